@@ -2,20 +2,228 @@
 # -*- coding: utf-8 -*-
 """File to store common / global variables"""
 
+from bisect import bisect_left
+from contextlib import contextmanager
 import threading
+import time
 
+DEFAULT_CALL_SITE = 'unknown'
+# Upper bounds, in seconds, of the buckets of the lock histograms; the last bucket is unbounded
+LOCK_HISTOGRAM_BOUNDS = [1e-6, 1e-5, 1e-4, 1e-3, 1e-2, 1e-1, 1., 10.]
 
-class CustomRLock(threading._PyRLock):
+
+class LockStatistics:
+    """
+    Class that keeps, per call site, the histograms of the time spent waiting for a lock and of
+    the time it was held
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.wait_histograms = {}
+        self.hold_histograms = {}
+
+    @staticmethod
+    def add_to_histogram(in_histograms, in_call_site, in_seconds):
+        if in_call_site not in in_histograms:
+            in_histograms[in_call_site] = [0] * (len(LOCK_HISTOGRAM_BOUNDS) + 1)
+        in_histograms[in_call_site][bisect_left(LOCK_HISTOGRAM_BOUNDS, in_seconds)] += 1
+
+    def record_wait(self, in_call_site, in_seconds):
+        with self.lock:
+            self.add_to_histogram(self.wait_histograms, in_call_site, in_seconds)
+
+    def record_hold(self, in_call_site, in_seconds):
+        with self.lock:
+            self.add_to_histogram(self.hold_histograms, in_call_site, in_seconds)
+
+    def get_histograms(self) -> dict:
+        """
+        Returns:
+            dict, for each call site a dict with the 'wait' and 'hold' histograms, lists with the
+            number of acquisitions in each bucket of LOCK_HISTOGRAM_BOUNDS
+        """
+        with self.lock:
+            call_sites = set(self.wait_histograms) | set(self.hold_histograms)
+            empty_histogram = [0] * (len(LOCK_HISTOGRAM_BOUNDS) + 1)
+            return {call_site: {'wait': list(self.wait_histograms.get(call_site, empty_histogram)),
+                                'hold': list(self.hold_histograms.get(call_site, empty_histogram))}
+                    for call_site in call_sites}
+
+    def reset(self):
+        with self.lock:
+            self.wait_histograms = {}
+            self.hold_histograms = {}
+
+
+class InstrumentedRLock:
+    """
+    Reentrant lock built on the C implementation of threading.RLock that keeps track of its owner
+    and records the wait and hold times of each call site.
+    The owner and count are only written by the thread that holds the lock
+    """
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.statistics = LockStatistics()
+        self.owner_id = None
+        self.count = 0
+        self.call_site = None
+        self.acquired_time = 0.
 
     @property
     def acquired(self):
-        return bool(self._count)
+        return self.count > 0
 
     @property
     def owner(self):
-        return self._owner
+        return self.owner_id
+
+    def acquire(self, blocking=True, timeout=-1, in_call_site=DEFAULT_CALL_SITE) -> bool:
+        start_time = time.perf_counter()
+        if not self.lock.acquire(blocking, timeout):
+            return False
+        if self.count == 0:
+            self.acquired_time = time.perf_counter()
+            self.statistics.record_wait(in_call_site, self.acquired_time - start_time)
+            self.owner_id = threading.get_ident()
+            self.call_site = in_call_site
+        self.count += 1
+        return True
+
+    def release(self):
+        if self.owner_id != threading.get_ident():
+            raise RuntimeError('cannot release un-acquired lock')
+        self.count -= 1
+        if self.count > 0:
+            self.lock.release()
+            return
+        hold_time = time.perf_counter() - self.acquired_time
+        call_site = self.call_site
+        self.owner_id = None
+        self.call_site = None
+        self.lock.release()
+        self.statistics.record_hold(call_site, hold_time)
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *args):
+        self.release()
+
+    @contextmanager
+    def using(self, in_call_site=DEFAULT_CALL_SITE):
+        """
+        Context that holds the lock, recording the times under 'in_call_site'
+        """
+        self.acquire(in_call_site=in_call_site)
+        try:
+            yield
+        finally:
+            self.release()
+
+
+class ReadWriteLock:
+    """
+    Lock that can be held by many readers or by a single writer.
+    Waiting writers have preference over new readers. The writer can re-acquire the lock, both for
+    reading and writing; readers must not re-acquire it
+    """
+
+    def __init__(self):
+        self.condition = threading.Condition(threading.Lock())
+        self.statistics = LockStatistics()
+        self.num_readers = 0
+        self.num_writers_waiting = 0
+        self.writer = None
+        self.writer_count = 0
+
+    @property
+    def acquired(self):
+        return self.writer is not None
+
+    @property
+    def owner(self):
+        return self.writer
+
+    def acquire_read(self):
+        with self.condition:
+            if self.writer == threading.get_ident():
+                self.writer_count += 1
+                return
+            while self.writer is not None or self.num_writers_waiting > 0:
+                self.condition.wait()
+            self.num_readers += 1
+
+    def release_read(self):
+        with self.condition:
+            if self.writer == threading.get_ident():
+                self.writer_count -= 1
+                return
+            self.num_readers -= 1
+            if self.num_readers == 0:
+                self.condition.notify_all()
+
+    def acquire_write(self):
+        with self.condition:
+            if self.writer == threading.get_ident():
+                self.writer_count += 1
+                return
+            self.num_writers_waiting += 1
+            while self.writer is not None or self.num_readers > 0:
+                self.condition.wait()
+            self.num_writers_waiting -= 1
+            self.writer = threading.get_ident()
+            self.writer_count = 1
+
+    def release_write(self):
+        with self.condition:
+            self.writer_count -= 1
+            if self.writer_count == 0:
+                self.writer = None
+                self.condition.notify_all()
+
+    @contextmanager
+    def read(self, in_call_site=DEFAULT_CALL_SITE):
+        start_time = time.perf_counter()
+        self.acquire_read()
+        acquired_time = time.perf_counter()
+        self.statistics.record_wait(in_call_site, acquired_time - start_time)
+        try:
+            yield
+        finally:
+            self.release_read()
+            self.statistics.record_hold(in_call_site, time.perf_counter() - acquired_time)
+
+    @contextmanager
+    def write(self, in_call_site=DEFAULT_CALL_SITE):
+        start_time = time.perf_counter()
+        self.acquire_write()
+        acquired_time = time.perf_counter()
+        self.statistics.record_wait(in_call_site, acquired_time - start_time)
+        try:
+            yield
+        finally:
+            self.release_write()
+            self.statistics.record_hold(in_call_site, time.perf_counter() - acquired_time)
 
 
 use_global_database = False
 global_events_db = None
-global_bot_lock = CustomRLock()
+# Shared by all the bot event registers: readers and per-bot writers take its read side, retention
+# and compaction snapshots its write side
+global_events_lock = ReadWriteLock()
+# Serializes the writing of the bot events to disk
+global_bot_lock = InstrumentedRLock()
+
+
+def get_lock_histograms() -> dict:
+    """
+    Returns the wait and hold histograms of the global locks, per call site
+
+    Returns:
+        dict, for each global lock name the dict returned by LockStatistics.get_histograms
+    """
+    return {'global_events_lock': global_events_lock.statistics.get_histograms(),
+            'global_bot_lock': global_bot_lock.statistics.get_histograms()}
@@ -5,14 +5,27 @@
 __author__ = "Josep-Arnau Claret"
 __email__ = "joseparnau81@gmail.com"
 
+import atexit
+from bisect import bisect_left, bisect_right
+from contextlib import contextmanager
 import datetime
 import os
 from pathlib import Path
+import sys
+import threading
+import time
 
+import numpy as np
 import pandas as pd
+from pandas.api.types import is_categorical_dtype, is_datetime64_dtype, union_categoricals
 
 import acid_rain.acid_rain_settings
+from acid_rain.acid_rain_settings import DEFAULT_CALL_SITE, ReadWriteLock
+from acid_rain.acid_rain_constants import ONE_DAY, ONE_HOUR
 from acid_rain.acid_rain_utils import get_random_string
+from acid_rain.event_store_server import is_remote_address
+from acid_rain.event_index import EventRollup, EventTimeIndex, QueryCache, RollingCounter, \
+    get_period_start
 
 LABEL_TIMESTAMP = 'timestamp'
 LABEL_BOT = 'bot'
@@ -30,22 +43,1089 @@ EVENT_EXCEPTION = 'exception'
 EVENT_BLOCK = 'block'
 ALL_EVENTS = [EVENT_LOGIN, EVENT_LIKES, EVENT_FOLLOW, EVENT_EXCEPTION, EVENT_BLOCK]
 
+COUNTER_WINDOWS = [ONE_HOUR, ONE_DAY]
+ROLLUP_PERIODS = [ONE_HOUR, ONE_DAY]
+LABEL_COUNT = 'count'
+
+JOURNAL_SUFFIX = '.journal'
+SQLITE_SUFFIXES = ['.db', '.sqlite']
+# Folder with the events as binary columns (see columnar_event_file)
+COLUMNAR_SUFFIX = '.events'
+DEFAULT_JOURNAL_MAX_EVENTS = 1000
+# Maximum time, in seconds, that saved events wait in memory in write-behind mode
+DEFAULT_WRITE_BEHIND_DELAY_S = 5.
+# Shared write-behind writers by (file path, store), with the number of registers using each one
+writers = {}
+writers_lock = threading.Lock()
+
+# Compact in-memory types: dictionary-encoded strings and small nullable integer likes
+CATEGORICAL_LABELS = [LABEL_BOT, LABEL_EVENT, LABEL_USERNAME, LABEL_COMMENTS]
+NUM_LIKES_DTYPE = 'Int16'
+
+
+def to_categorical(in_column) -> pd.Series:
+    """
+    Returns the column dictionary-encoded, with object categories so that columns can be merged.
+    Only the categories of its values are kept: a part of a categorical column (e.g. the events
+    of a day of a columnar file) would otherwise carry the categories of the whole column
+    """
+    if is_categorical_dtype(in_column) and in_column.cat.categories.dtype == object:
+        codes = in_column.cat.codes.to_numpy()
+        if np.bincount(codes[codes >= 0], minlength=len(in_column.cat.categories)).all():
+            return in_column
+        return in_column.cat.remove_unused_categories()
+    values = in_column.astype(object)
+    categories = pd.Index(values.dropna().unique(), dtype=object)
+    return pd.Series(pd.Categorical(values, categories=categories), index=in_column.index)
+
+
+def compact_events(in_database) -> pd.DataFrame:
+    """
+    Returns the events with compact types: datetime64 (int64) timestamps, categorical bot,
+    event, username and comments, with interned usernames, and Int16 likes.
+    Columns that already have these types are only trimmed, so compacting the parts of compact
+    events is cheap; their usernames are the categories of the whole events, already shared
+    """
+    database = in_database[ALL_LABELS].copy()
+    if not is_datetime64_dtype(database[LABEL_TIMESTAMP]):
+        database[LABEL_TIMESTAMP] = pd.to_datetime(database[LABEL_TIMESTAMP])
+    is_username_compact = is_categorical_dtype(database[LABEL_USERNAME])
+    for label in CATEGORICAL_LABELS:
+        database[label] = to_categorical(database[label])
+    if not is_username_compact:
+        usernames = database[LABEL_USERNAME].cat.categories
+        database[LABEL_USERNAME] = database[LABEL_USERNAME].cat.rename_categories(
+            [sys.intern(username) for username in usernames])
+    num_likes = database[LABEL_NUM_LIKES]
+    if num_likes.dtype == np.float64:
+        # From the values and a mask of the missing ones, faster than converting each value
+        missing = num_likes.isna().to_numpy()
+        database[LABEL_NUM_LIKES] = pd.arrays.IntegerArray(
+            num_likes.fillna(0.).to_numpy().astype(np.int16), missing)
+    elif num_likes.dtype != NUM_LIKES_DTYPE:
+        database[LABEL_NUM_LIKES] = num_likes.astype(NUM_LIKES_DTYPE)
+    return database
+
+
+def concat_events(in_databases) -> pd.DataFrame:
+    """
+    Concatenates compact events, merging the categories of the categorical columns
+    """
+    if len(in_databases) == 1:
+        return in_databases[0]
+    columns = {}
+    for label in ALL_LABELS:
+        label_columns = [database[label] for database in in_databases]
+        if label in CATEGORICAL_LABELS:
+            columns[label] = union_categoricals(label_columns)
+        else:
+            columns[label] = pd.concat(label_columns, ignore_index=True)
+    return pd.DataFrame(columns, columns=ALL_LABELS)
+
+
+EMPTY_EVENTS = compact_events(pd.DataFrame(columns=ALL_LABELS))
+
+# Callables notified of the events added to any register of the process
+event_listeners = []
+event_listeners_lock = threading.Lock()
+
+
+def add_event_listener(in_listener):
+    """
+    Adds a callable that is called with the list of event data (dicts with all the labels as
+    keys) added to any register of the process, after they are written
+    """
+    with event_listeners_lock:
+        event_listeners.append(in_listener)
+
+
+def remove_event_listener(in_listener):
+    with event_listeners_lock:
+        if in_listener in event_listeners:
+            event_listeners.remove(in_listener)
+
+
+def notify_event_listeners(in_data_list):
+    with event_listeners_lock:
+        listeners = list(event_listeners)
+    for listener in listeners:
+        listener(in_data_list)
+
+
+class EventSegment:
+    """
+    Class that holds the events of a single bot during a single day.
+    New events are appended to a growable columnar buffer, which is flushed into the queryable
+    DataFrame in a single batch the next time the database is read.
+    Events are also indexed per event and for all events in sorted time indexes that serve the
+    window queries without locking (see EventTimeIndex).
+    The events of a loaded segment stay in the rows of the loaded DataFrame until its database
+    is read (see from_sorted), so loading does not copy them day by day
+    """
+
+    def __init__(self, in_day):
+        """
+        Event segment constructor
+
+        Params:
+            in_day: date, day of the events of the segment
+        """
+
+        self.day = in_day
+        self.flush_lock = threading.Lock()
+
+        self.database = EMPTY_EVENTS
+        # Loaded events not copied into the database yet: (DataFrame, slice of its rows)
+        self.source = None
+        self.buffer = {label: [] for label in ALL_LABELS}
+        self.num_buffered = 0
+        # Kept apart from the database and the buffer so that it does not change on flush
+        self.num_events = 0
+
+        self.index = {}
+
+        # Persistence state: the first 'num_saved' events are already in the base file or in
+        # its journal
+        self.num_saved = 0
+
+    @classmethod
+    def from_sorted(cls, in_day, in_database, in_rows, in_index):
+        """
+        Returns the segment of loaded events, with the time indexes built from their arrays
+
+        Params:
+            in_day: date, day of the events
+            in_database: DataFrame, compact events sorted by timestamp (see compact_events)
+            in_rows: slice, rows of the events of the day
+            in_index: dict, event (None for all events) -> EventTimeIndex of the events
+        """
+        segment = cls(in_day)
+        segment.source = (in_database, in_rows)
+        segment.num_events = in_rows.stop - in_rows.start
+        segment.index = in_index
+        return segment
+
+    def __len__(self):
+        return self.num_events
+
+    def append(self, in_data, in_num_likes):
+        """
+        Appends an event to the buffer in amortized O(1)
+
+        Params:
+            in_data: dict, event data with all the labels as keys
+            in_num_likes: number, number of likes of the event, 0 if it has none
+        """
+        for label in ALL_LABELS:
+            self.buffer[label].append(in_data[label])
+        self.num_buffered += 1
+        self.index_event(in_data[LABEL_TIMESTAMP], in_data[LABEL_EVENT], in_num_likes)
+        self.num_events += 1
+
+    def append_many(self, in_data_list, in_num_likes_list):
+        """
+        Appends several events to the buffer, extending each column once
+
+        Params:
+            in_data_list: list, event data dicts with all the labels as keys
+            in_num_likes_list: list, number of likes of each event, 0 if it has none
+        """
+        for label in ALL_LABELS:
+            self.buffer[label].extend([data[label] for data in in_data_list])
+        self.num_buffered += len(in_data_list)
+        for data, num_likes in zip(in_data_list, in_num_likes_list):
+            self.index_event(data[LABEL_TIMESTAMP], data[LABEL_EVENT], num_likes)
+        self.num_events += len(in_data_list)
+
+    def index_event(self, in_timestamp, in_event, in_num_likes):
+        """
+        Adds an event to the time indexes of its event and of all events
+        """
+        num_likes = 0 if in_num_likes is None or pd.isna(in_num_likes) else in_num_likes
+        for key in (in_event, None):
+            if key not in self.index:
+                self.index[key] = EventTimeIndex()
+            self.index[key].add(in_timestamp, num_likes)
+
+    def get_index(self, in_event=None) -> EventTimeIndex:
+        """
+        Returns the time index of an event, or of all events if 'in_event' is None;
+        empty if there are no such events
+        """
+        return self.index.get(in_event, EventTimeIndex())
+
+    def flush(self) -> int:
+        """
+        Moves the buffered events into the database with a single concatenation, after copying
+        the loaded events into it
+
+        Returns:
+            int, number of flushed events
+        """
+        with self.flush_lock:
+            if self.source is not None:
+                database, rows = self.source
+                self.database = compact_events(database.iloc[rows].reset_index(drop=True))
+                self.source = None
+            if self.num_buffered == 0:
+                return 0
+
+            new_events = compact_events(pd.DataFrame(self.buffer, columns=ALL_LABELS))
+            if len(self.database) == 0:
+                self.database = new_events
+            else:
+                self.database = concat_events([self.database, new_events])
+
+            num_flushed = self.num_buffered
+            self.buffer = {label: [] for label in ALL_LABELS}
+            self.num_buffered = 0
+            return num_flushed
+
+    def get_database(self) -> pd.DataFrame:
+        """
+        Returns the database with all the buffered events flushed into it
+        """
+        self.flush()
+        return self.database
+
+    def get_num_flushed(self) -> int:
+        """
+        Returns the number of events in the database, including the loaded ones not copied yet
+        """
+        source = self.source
+        return len(self.database) if source is None else source[1].stop - source[1].start
+
+    def get_unsaved_events(self) -> pd.DataFrame:
+        """
+        Returns the events added since the last save
+        """
+        if self.num_saved >= self.num_events:
+            return EMPTY_EVENTS
+        return self.get_database().iloc[self.num_saved:]
+
+    def remove_before(self, in_timestamp) -> int:
+        """
+        Removes the events before the timestamp
+
+        Returns:
+            int, number of events removed
+        """
+        database = self.get_database()
+        keep_condition = database[LABEL_TIMESTAMP] >= in_timestamp
+        num_removed = len(database) - int(keep_condition.sum())
+        if num_removed > 0:
+            self.database = database.loc[keep_condition].reset_index(drop=True)
+            self.num_events -= num_removed
+            for time_index in self.index.values():
+                time_index.remove_before(in_timestamp)
+        return num_removed
+
+
+class BotEventShard:
+    """
+    Class that holds the events of a single bot in memory, partitioned in daily segments (see
+    EventSegment). Retention drops whole segments, and window queries only read the segments
+    of the days in the window.
+    Events are also counted per event in rolling counters over the last hour and day, and in
+    hourly and daily rollups over all the days of the shard.
+    Queries do not need a lock: the segments are published as an immutable version that writers
+    replace when they add or drop a segment. Writers must hold the write side of 'lock', and
+    readers of the whole database its read side
+    """
+
+    def __init__(self, in_database=None):
+        """
+        Bot event shard constructor. The segments, time indexes, counters and rollups of the
+        initial events are built from their columns as numpy arrays: the segments are the rows
+        between the edges of the days, found by bisecting the timestamps
+
+        Params:
+            in_database: DataFrame, initial compact events of the bot sorted by timestamp (see
+                         compact_events); if None, the shard starts empty
+        """
+
+        self.lock = ReadWriteLock()
+        # Days in increasing order and their segments, replaced as a whole when they change
+        self.version = ([], [])
+        self.counters = {}
+        self.rollups = {}
+        if in_database is None or len(in_database) == 0:
+            return
+
+        timestamps = in_database[LABEL_TIMESTAMP].to_numpy(dtype='datetime64[ns]')
+        num_likes = in_database[LABEL_NUM_LIKES].to_numpy(dtype=np.int64, na_value=0)
+        event_codes = in_database[LABEL_EVENT].cat.codes.to_numpy()
+        days = np.arange(timestamps[0].astype('datetime64[D]'),
+                         timestamps[-1].astype('datetime64[D]') + 2)
+        day_edges = days.astype('datetime64[ns]')
+
+        # Timestamps, prefix sums of the likes and positions of the day edges of all the events
+        # (None) and of each event
+        event_arrays = {None: (timestamps, np.concatenate(([0], np.cumsum(num_likes))))}
+        for code, event in enumerate(in_database[LABEL_EVENT].cat.categories):
+            positions = np.flatnonzero(event_codes == code)
+            if len(positions) > 0:
+                event_arrays[event] = (timestamps[positions], np.concatenate(
+                    ([0], np.cumsum(num_likes[positions]))))
+        edges = {event: np.searchsorted(event_timestamps, day_edges).tolist()
+                 for event, (event_timestamps, _) in event_arrays.items()}
+
+        segment_days = []
+        segments = []
+        for i_day, day in enumerate(days[:-1].tolist()):
+            if edges[None][i_day] == edges[None][i_day + 1]:
+                continue
+            index = {}
+            for event, (event_timestamps, event_cumulative) in event_arrays.items():
+                start, end = edges[event][i_day], edges[event][i_day + 1]
+                if end > start:
+                    index[event] = EventTimeIndex.from_sorted(event_timestamps[start:end],
+                                                              event_cumulative[start:end + 1])
+            segment_days.append(day)
+            segments.append(EventSegment.from_sorted(
+                day, in_database, slice(edges[None][i_day], edges[None][i_day + 1]), index))
+        self.version = (segment_days, segments)
+
+        del event_arrays[None]
+        self.build_counters(event_arrays)
+        self.build_rollups(event_arrays)
+
+    def __len__(self):
+        return sum(len(segment) for segment in self.get_segments())
+
+    @property
+    def num_buffered(self) -> int:
+        return sum(segment.num_buffered for segment in self.get_segments())
+
+    @property
+    def days(self) -> list:
+        return self.version[0]
+
+    def get_segments(self, in_day=None) -> list:
+        """
+        Returns the segments in increasing order of day; only those of days >= 'in_day' if
+        it is not None
+        """
+        days, segments = self.version
+        return segments if in_day is None else segments[bisect_left(days, in_day):]
+
+    def get_segment(self, in_day) -> EventSegment:
+        """
+        Returns the segment of a day, created if it does not exist yet. Only writers create
+        segments, so the write side of the lock must be held
+        """
+        days, segments = self.version
+        position = bisect_left(days, in_day)
+        if position < len(days) and days[position] == in_day:
+            return segments[position]
+        segment = EventSegment(in_day)
+        self.version = (days[:position] + [in_day] + days[position:],
+                        segments[:position] + [segment] + segments[position:])
+        return segment
+
+    def append(self, in_data):
+        """
+        Appends an event to the segment of its day
+
+        Params:
+            in_data: dict, event data with all the labels as keys
+        """
+        timestamp = in_data[LABEL_TIMESTAMP]
+        num_likes = in_data[LABEL_NUM_LIKES]
+        num_likes = 0 if num_likes is None or pd.isna(num_likes) else num_likes
+        self.get_segment(timestamp.date()).append(in_data, num_likes)
+        self.count_event(timestamp, in_data[LABEL_EVENT], num_likes)
+        self.roll_up_event(timestamp, in_data[LABEL_EVENT], num_likes)
+
+    def append_many(self, in_data_list):
+        """
+        Appends several events, each segment receiving all the events of its day at once
+
+        Params:
+            in_data_list: list, event data dicts with all the labels as keys
+        """
+        data_per_day = {}
+        for data in in_data_list:
+            num_likes = data[LABEL_NUM_LIKES]
+            num_likes = 0 if num_likes is None or pd.isna(num_likes) else num_likes
+            day_data = data_per_day.setdefault(data[LABEL_TIMESTAMP].date(), ([], []))
+            day_data[0].append(data)
+            day_data[1].append(num_likes)
+            self.count_event(data[LABEL_TIMESTAMP], data[LABEL_EVENT], num_likes)
+            self.roll_up_event(data[LABEL_TIMESTAMP], data[LABEL_EVENT], num_likes)
+        for day, (data_list, num_likes_list) in data_per_day.items():
+            self.get_segment(day).append_many(data_list, num_likes_list)
+
+    def count_event(self, in_timestamp, in_event, in_num_likes):
+        """
+        Adds an event to the rolling counters
+        """
+        if in_event not in self.counters:
+            self.counters[in_event] = {window: RollingCounter(window) for window in COUNTER_WINDOWS}
+        for counter in self.counters[in_event].values():
+            counter.add(in_timestamp, in_num_likes)
+
+    def build_counters(self, in_event_arrays):
+        """
+        Builds the rolling counters from the events of the longest window
+
+        Params:
+            in_event_arrays: dict, event -> (datetime64 timestamps, prefix sums of the likes) of
+                             the events sorted by timestamp
+        """
+        now = datetime.datetime.now()
+        window_start = np.datetime64(now - max(COUNTER_WINDOWS), 'ns')
+        for event, (timestamps, cumulative) in in_event_arrays.items():
+            start = int(np.searchsorted(timestamps, window_start))
+            self.counters[event] = {window: RollingCounter(window) for window in COUNTER_WINDOWS}
+            for window, counter in self.counters[event].items():
+                counter.extend(timestamps[start:], np.diff(cumulative[start:]))
+                counter.expire(now - window)
+
+    def get_event_rollups(self, in_event) -> dict:
+        """
+        Returns the rollups of an event by period, created if they do not exist yet
+        """
+        if in_event not in self.rollups:
+            self.rollups[in_event] = {period: EventRollup(period) for period in ROLLUP_PERIODS}
+        return self.rollups[in_event]
+
+    def roll_up_event(self, in_timestamp, in_event, in_num_likes):
+        """
+        Adds an event to the rollups
+        """
+        for rollup in self.get_event_rollups(in_event).values():
+            rollup.add(in_timestamp, in_num_likes)
+
+    def build_rollups(self, in_event_arrays):
+        """
+        Builds the rollups from the events, each period being a run of their sorted timestamps
+
+        Params:
+            in_event_arrays: dict, event -> (datetime64 timestamps, prefix sums of the likes) of
+                             the events sorted by timestamp
+        """
+        for event, (timestamps, cumulative) in in_event_arrays.items():
+            for period, rollup in self.get_event_rollups(event).items():
+                period_ns = np.timedelta64(period).astype('timedelta64[ns]').astype(np.int64)
+                buckets = timestamps.view(np.int64) // period_ns
+                starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+                ends = np.r_[starts[1:], len(buckets)]
+                rollup.extend((buckets[starts] * period_ns).astype('datetime64[ns]'),
+                              ends - starts,
+                              (cumulative[ends] - cumulative[starts]).astype(float))
+
+    def get_rollup(self, in_event, in_period) -> (None, EventRollup):
+        """
+        Returns the rollup of an event for one of ROLLUP_PERIODS; None if there are no such
+        events
+        """
+        event_rollups = self.rollups.get(in_event)
+        return None if event_rollups is None else event_rollups[in_period]
+
+    def get_counter(self, in_event, in_window) -> (None, RollingCounter):
+        """
+        Returns the rolling counter of an event for one of COUNTER_WINDOWS;
+        None if there are no such events
+        """
+        event_counters = self.counters.get(in_event)
+        return None if event_counters is None else event_counters[in_window]
+
+    def get_database(self) -> pd.DataFrame:
+        """
+        Returns the events of all the segments, in increasing order of day
+        """
+        databases = [segment.get_database() for segment in self.get_segments()]
+        databases = [database for database in databases if len(database) > 0]
+        if len(databases) == 0:
+            return EMPTY_EVENTS
+        return concat_events(databases)
+
+    def get_unsaved_events(self) -> pd.DataFrame:
+        """
+        Returns the events added since the last save
+        """
+        databases = [segment.get_unsaved_events() for segment in self.get_segments()]
+        databases = [database for database in databases if len(database) > 0]
+        if len(databases) == 0:
+            return EMPTY_EVENTS
+        return concat_events(databases)
+
+    def get_num_events_per_segment(self) -> dict:
+        """
+        Returns the number of flushed events of each segment, by day
+        """
+        return {segment.day: segment.get_num_flushed() for segment in self.get_segments()}
+
+    def mark_saved(self, in_num_saved_per_segment=None):
+        """
+        Marks events as saved
+
+        Params:
+            in_num_saved_per_segment: dict, number of saved events of each segment, by day;
+                                      if None, all the events are saved
+        """
+        for segment in self.get_segments():
+            if in_num_saved_per_segment is None:
+                segment.num_saved = len(segment)
+            elif segment.day in in_num_saved_per_segment:
+                segment.num_saved = in_num_saved_per_segment[segment.day]
+
+    def remove_before(self, in_timestamp) -> int:
+        """
+        Removes the events before the timestamp: drops the segments of the previous days and
+        trims the segment of the day of the timestamp
+
+        Returns:
+            int, number of events removed
+        """
+        days, segments = self.version
+        num_old_days = bisect_left(days, in_timestamp.date())
+        num_removed = sum(len(segment) for segment in segments[:num_old_days])
+        if num_old_days > 0:
+            days, segments = days[num_old_days:], segments[num_old_days:]
+            self.version = (days, segments)
+
+        if len(days) > 0 and days[0] == in_timestamp.date():
+            num_removed += segments[0].remove_before(in_timestamp)
+
+        if num_removed > 0:
+            for event_counters in self.counters.values():
+                for counter in event_counters.values():
+                    counter.expire(in_timestamp)
+            self.trim_rollups(in_timestamp)
+        return num_removed
+
+    def trim_rollups(self, in_timestamp):
+        """
+        Drops the rollup periods before the timestamp and recomputes the period of the timestamp
+        from the time indexes of its segment, which holds the whole period
+        """
+        days, segments = self.version
+        segment = segments[0] if len(days) > 0 and days[0] == in_timestamp.date() else None
+        for event, event_rollups in self.rollups.items():
+            for rollup in event_rollups.values():
+                rollup.remove_before(in_timestamp)
+                bucket_start = rollup.get_bucket_start(in_timestamp)
+                bucket_end = bucket_start + rollup.period
+                if segment is None:
+                    rollup.set_bucket(bucket_start, 0, 0)
+                    continue
+                time_index = segment.get_index(event)
+                rollup.set_bucket(
+                    bucket_start,
+                    time_index.count_since(bucket_start) - time_index.count_since(bucket_end),
+                    time_index.sum_since(bucket_start) - time_index.sum_since(bucket_end))
+
+    # -----------------------------------------------------------------------
+    # Queries
+
+    def count_since(self, in_event, in_timestamp) -> int:
+        """
+        Returns the number of events (of all events if 'in_event' is None) with
+        timestamp >= 'in_timestamp'
+        """
+        return sum(segment.get_index(in_event).count_since(in_timestamp)
+                   for segment in self.get_segments(in_timestamp.date()))
+
+    def sum_likes_since(self, in_timestamp):
+        """
+        Returns the number of likes with timestamp >= 'in_timestamp'
+        """
+        return sum(segment.get_index(EVENT_LIKES).sum_since(in_timestamp)
+                   for segment in self.get_segments(in_timestamp.date()))
+
+    def get_last_timestamp(self, in_event=None, in_timestamp=None):
+        """
+        Returns the timestamp of the last event <= 'in_timestamp' (or the last event if None);
+        None if there is no such event
+        """
+        days, segments = self.version
+        num_days = len(days) if in_timestamp is None else bisect_right(days, in_timestamp.date())
+        for segment in reversed(segments[:num_days]):
+            timestamp = segment.get_index(in_event).last_timestamp(in_timestamp)
+            if timestamp is not None:
+                return timestamp
+        return None
+
+    def get_rollup_buckets(self, in_event, in_period, in_start=None, in_end=None) -> dict:
+        """
+        Returns the periods of the rollup of an event that start in ['in_start', 'in_end')
+
+        Returns:
+            dict, start of each period with events -> (number of events, number of likes)
+        """
+        rollup = self.get_rollup(in_event, in_period)
+        return {} if rollup is None else rollup.get_buckets(in_start, in_end)
+
+    def get_first_timestamp_with_more_than_cumulative_likes(self, in_num_likes):
+        """
+        Returns the last timestamp such that the likes since then are more than 'in_num_likes';
+        None if there is no such timestamp.
+        Walks the segments back from the newest one, adding up their totals, and bisects the
+        prefix sums of the likes in the segment where the sum exceeds 'in_num_likes'
+        """
+        num_likes_after = 0
+        for segment in reversed(self.get_segments()):
+            likes_index = segment.get_index(EVENT_LIKES)
+            segment_num_likes = likes_index.get_total()
+            if num_likes_after + segment_num_likes > in_num_likes:
+                return likes_index.last_timestamp_with_sum_above(in_num_likes - num_likes_after)
+            num_likes_after += segment_num_likes
+        return None
+
+    def get_first_timestamp_with_more_than_cumulative_events(self, in_event, in_num_events):
+        """
+        Returns the last timestamp such that the events of type 'in_event' since then are more
+        than 'in_num_events'; None if there is no such timestamp.
+        Walks the segments back from the newest one, adding up their number of events
+        """
+        num_events_after = 0
+        for segment in reversed(self.get_segments()):
+            event_index = segment.get_index(in_event)
+            segment_num_events = len(event_index)
+            if num_events_after + segment_num_events > in_num_events:
+                return event_index.last_timestamp_with_count_above(in_num_events -
+                                                                   num_events_after)
+            num_events_after += segment_num_events
+        return None
+
+
+class EventStore:
+    """
+    Class that holds the bot events in memory, sharded per bot (see BotEventShard) so that the
+    events of different bots can be written concurrently.
+    Queries read the current version of the shard indexes without locking. Writes of a bot must
+    hold the write side of the bot lock (see get_lock); reads of whole databases lock each shard
+    themselves.
+    The register memoizes its queries in 'query_cache', which the writes invalidate
+    """
+
+    is_persistent = False
+
+    def __init__(self, in_database=None):
+        """
+        Event store constructor
+
+        Params:
+            in_database: DataFrame, initial events; if None, the store starts empty
+        """
+
+        self.shards = {}
+        self.shards_lock = threading.Lock()
+        if in_database is not None and len(in_database) > 0:
+            # Compacted once, so that the segments of all the bots share the usernames, and
+            # sorted by bot and timestamp, unless it already is (e.g. a columnar file), so that
+            # the events of each bot are a run of rows
+            database = compact_events(in_database)
+            bot_codes = database[LABEL_BOT].cat.codes.to_numpy()
+            timestamps = database[LABEL_TIMESTAMP].to_numpy(dtype='datetime64[ns]')
+            bot_steps = np.diff(bot_codes)
+            if not np.all((bot_steps > 0) |
+                          ((bot_steps == 0) & (timestamps[1:] >= timestamps[:-1]))):
+                order = np.lexsort((timestamps, bot_codes))
+                database = database.take(order).reset_index(drop=True)
+                bot_codes = bot_codes[order]
+            starts = np.flatnonzero(np.r_[True, bot_codes[1:] != bot_codes[:-1]])
+            ends = np.r_[starts[1:], len(bot_codes)]
+            bots = database[LABEL_BOT].cat.categories
+            for start, end in zip(starts.tolist(), ends.tolist()):
+                # Events without bot have code -1
+                if bot_codes[start] >= 0:
+                    self.shards[bots[bot_codes[start]]] = BotEventShard(database.iloc[start:end])
+
+        # Persistence state: 'num_journaled' events are saved in the journal
+        self.num_journaled = 0
+        self.needs_compaction = False
+
+        self.query_cache = QueryCache()
+
+    def __len__(self):
+        return sum(len(shard) for shard in list(self.shards.values()))
+
+    @property
+    def num_buffered(self) -> int:
+        return sum(shard.num_buffered for shard in list(self.shards.values()))
+
+    def get_shard(self, in_bot) -> BotEventShard:
+        """
+        Returns the shard of a bot, created if it does not exist yet
+        """
+        shard = self.shards.get(in_bot)
+        if shard is None:
+            with self.shards_lock:
+                shard = self.shards.get(in_bot)
+                if shard is None:
+                    shard = BotEventShard()
+                    self.shards[in_bot] = shard
+        return shard
+
+    def get_lock(self, in_bot) -> ReadWriteLock:
+        """
+        Returns the lock of the events of a bot
+        """
+        return self.get_shard(in_bot).lock
+
+    # -----------------------------------------------------------------------
+    # Queries
+
+    def count_events(self, in_bot=None) -> int:
+        """
+        Returns the number of events of a bot, or of all bots if 'in_bot' is None
+        """
+        return len(self) if in_bot is None else len(self.get_shard(in_bot))
+
+    def get_last_timestamp(self, in_bot=None, in_event=None, in_timestamp=None):
+        """
+        Returns the timestamp of the last event <= 'in_timestamp' (or the last event if None)
+        of a bot and event; None if there is no such event
+        """
+        if in_bot is not None:
+            return self.get_shard(in_bot).get_last_timestamp(in_event, in_timestamp)
+
+        last_timestamp = None
+        for shard in list(self.shards.values()):
+            timestamp = shard.get_last_timestamp(in_event, in_timestamp)
+            if timestamp is not None and (last_timestamp is None or timestamp > last_timestamp):
+                last_timestamp = timestamp
+        return last_timestamp
+
+    def count_events_since(self, in_bot, in_event, in_timestamp) -> int:
+        """
+        Returns the number of events of a bot with timestamp >= 'in_timestamp'
+        """
+        return self.get_shard(in_bot).count_since(in_event, in_timestamp)
+
+    def sum_likes_since(self, in_bot, in_timestamp):
+        """
+        Returns the number of likes of a bot with timestamp >= 'in_timestamp'
+        """
+        return self.get_shard(in_bot).sum_likes_since(in_timestamp)
+
+    def count_events_in_last(self, in_bot, in_event, in_window, in_now=None) -> int:
+        """
+        Returns the number of events of a bot in the window ending now.
+        Windows in COUNTER_WINDOWS are read from the rolling counters
+        """
+        now = datetime.datetime.now() if in_now is None else in_now
+        if in_window not in COUNTER_WINDOWS:
+            return self.count_events_since(in_bot, in_event, now - in_window)
+        counter = self.get_shard(in_bot).get_counter(in_event, in_window)
+        return 0 if counter is None else counter.get_count(now)
+
+    def sum_likes_in_last(self, in_bot, in_window, in_now=None):
+        """
+        Returns the number of likes of a bot in the window ending now.
+        Windows in COUNTER_WINDOWS are read from the rolling counters
+        """
+        now = datetime.datetime.now() if in_now is None else in_now
+        if in_window not in COUNTER_WINDOWS:
+            return self.sum_likes_since(in_bot, now - in_window)
+        counter = self.get_shard(in_bot).get_counter(EVENT_LIKES, in_window)
+        return 0 if counter is None else counter.get_total(now)
+
+    def get_first_timestamp_with_more_than_cumulative_likes(self, in_bot, in_num_likes):
+        """
+        Returns the last timestamp such that the likes of the bot since then are more than
+        'in_num_likes'; None if there is no such timestamp
+        """
+        return self.get_shard(in_bot).get_first_timestamp_with_more_than_cumulative_likes(
+            in_num_likes)
+
+    def get_first_timestamp_with_more_than_cumulative_events(self, in_bot, in_event,
+                                                             in_num_events):
+        """
+        Returns the last timestamp such that the events of type 'in_event' of the bot since then
+        are more than 'in_num_events'; None if there is no such timestamp
+        """
+        return self.get_shard(in_bot).get_first_timestamp_with_more_than_cumulative_events(
+            in_event, in_num_events)
+
+    def get_rollup_buckets(self, in_bot, in_event, in_period, in_start=None, in_end=None) -> dict:
+        """
+        Returns the periods of the rollup of an event of a bot, or of all bots if 'in_bot' is
+        None, that start in ['in_start', 'in_end')
+
+        Returns:
+            dict, start of each period with events -> (number of events, number of likes)
+        """
+        if in_bot is not None:
+            return self.get_shard(in_bot).get_rollup_buckets(in_event, in_period, in_start, in_end)
+
+        buckets = {}
+        for shard in list(self.shards.values()):
+            for bucket_start, (count, total) in shard.get_rollup_buckets(
+                    in_event, in_period, in_start, in_end).items():
+                bucket_count, bucket_total = buckets.get(bucket_start, (0, 0))
+                buckets[bucket_start] = (bucket_count + count, bucket_total + total)
+        return buckets
+
+    def collect_events(self, in_unsaved_only=False) -> tuple:
+        """
+        Returns the events of all bots sorted by timestamp, locking each shard while it is read
+
+        Params:
+            in_unsaved_only: bool, return only the events added since the last save
+
+        Returns:
+            tuple, the events DataFrame and a dict with the number of events of each segment of
+                   each bot shard at the moment it was read
+        """
+        databases = []
+        num_events_per_bot = {}
+        for bot, shard in list(self.shards.items()):
+            with shard.lock.read():
+                database = shard.get_unsaved_events() if in_unsaved_only \
+                    else shard.get_database()
+                num_events_per_bot[bot] = shard.get_num_events_per_segment()
+            if len(database) > 0:
+                databases.append(database)
+
+        if len(databases) == 0:
+            return EMPTY_EVENTS, num_events_per_bot
+        database = concat_events(databases)
+        database = database.sort_values(LABEL_TIMESTAMP, kind='stable', ignore_index=True)
+        return database, num_events_per_bot
+
+    def get_database(self) -> pd.DataFrame:
+        """
+        Returns all the events sorted by timestamp
+        """
+        database, _ = self.collect_events()
+        return database
+
+    def get_memory_usage(self) -> dict:
+        """
+        Returns the memory used by each column of the events, in bytes, adding up all the
+        segments of all the bots. Usernames shared between segments are interned, but they are
+        counted in each segment
+
+        Returns:
+            dict, bytes used by each label
+        """
+        memory_usage = {label: 0 for label in ALL_LABELS}
+        for shard in list(self.shards.values()):
+            with shard.lock.read():
+                for segment in shard.get_segments():
+                    segment_usage = segment.get_database().memory_usage(deep=True, index=False)
+                    for label in ALL_LABELS:
+                        memory_usage[label] += int(segment_usage[label])
+        return memory_usage
+
+    # -----------------------------------------------------------------------
+    # Write
+
+    def append(self, in_data):
+        """
+        Appends an event to the shard of its bot
+
+        Params:
+            in_data: dict, event data with all the labels as keys
+        """
+        self.get_shard(in_data[LABEL_BOT]).append(in_data)
+        self.query_cache.invalidate(in_data[LABEL_BOT])
+
+    def append_many(self, in_data_list):
+        """
+        Appends several events, each shard receiving all the events of its bot at once.
+        The write side of the lock of every bot of the events must be held
+
+        Params:
+            in_data_list: list, event data dicts with all the labels as keys
+        """
+        data_per_bot = {}
+        for data in in_data_list:
+            data_per_bot.setdefault(data[LABEL_BOT], []).append(data)
+        for bot, data_list in data_per_bot.items():
+            self.get_shard(bot).append_many(data_list)
+            self.query_cache.invalidate(bot)
+
+    def remove_before(self, in_timestamp) -> int:
+        """
+        Removes the events before the timestamp. No other reader or writer must hold a shard
+
+        Returns:
+            int, number of events removed
+        """
+        num_removed = sum(shard.remove_before(in_timestamp)
+                          for shard in list(self.shards.values()))
+        if num_removed > 0:
+            self.needs_compaction = True
+            self.query_cache.invalidate()
+        return num_removed
+
+    def mark_saved(self, in_num_saved_per_bot=None, in_num_journaled=0):
+        """
+        Marks events as saved
+
+        Params:
+            in_num_saved_per_bot: dict, number of saved events of each segment of each bot shard,
+                                  as returned by collect_events; if None, all the events are saved
+            in_num_journaled: int, number of events that have been saved in the journal
+        """
+        for bot, shard in list(self.shards.items()):
+            if in_num_saved_per_bot is None:
+                shard.mark_saved()
+            elif bot in in_num_saved_per_bot:
+                shard.mark_saved(in_num_saved_per_bot[bot])
+        self.num_journaled = in_num_journaled
+        self.needs_compaction = False
+
+
+class WriteBehindWriter:
+    """
+    Class that runs the saves of a register in a background thread.
+    Saving only marks the register as dirty; the thread waits 'delay' seconds after the first
+    save and then writes once, coalescing all the saves in between
+    """
+
+    def __init__(self, in_write, in_delay=DEFAULT_WRITE_BEHIND_DELAY_S):
+        """
+        Params:
+            in_write: callable, writes the events to disk and returns whether it succeeded
+            in_delay: float, maximum time in seconds between a save and its write
+        """
+        self.write = in_write
+        self.delay = in_delay
+        self.condition = threading.Condition()
+        self.dirty = False
+        self.dirty_time = None
+        self.closed = False
+        # Serializes the writes of the thread and of flush()
+        self.write_lock = threading.Lock()
+        self.thread = threading.Thread(target=self.run, name='bot-event-register-writer',
+                                       daemon=True)
+        self.thread.start()
+
+    def mark_dirty(self):
+        with self.condition:
+            if not self.dirty:
+                self.dirty = True
+                self.dirty_time = time.monotonic()
+                self.condition.notify_all()
+
+    def run(self):
+        while True:
+            with self.condition:
+                while not self.dirty and not self.closed:
+                    self.condition.wait()
+                while not self.closed:
+                    remaining_s = self.dirty_time + self.delay - time.monotonic()
+                    if remaining_s <= 0:
+                        break
+                    self.condition.wait(remaining_s)
+                if self.closed:
+                    return
+            self.flush()
+
+    def flush(self) -> bool:
+        """
+        Writes the events if any save is pending
+
+        Returns:
+            bool, whether the events are on disk
+        """
+        with self.write_lock:
+            with self.condition:
+                is_dirty = self.dirty
+                self.dirty = False
+            if not is_dirty:
+                return True
+            try:
+                return self.write()
+            except OSError as e:
+                print('Write-behind save failed: {}'.format(e))
+                self.mark_dirty()
+                return False
+
+    def close(self) -> bool:
+        """
+        Stops the thread and writes the pending events
+
+        Returns:
+            bool, whether the events are on disk
+        """
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+        self.thread.join()
+        return self.flush()
+
+
+def open_write_behind_writer(in_register) -> WriteBehindWriter:
+    """
+    Returns the write-behind writer of the file and store of a register, shared by all the
+    registers of the process that save the same store to the same file, created if it does not
+    exist yet. Each call must be matched by a call to close_write_behind_writer
+    """
+    store = in_register.get_store()
+    key = (os.path.realpath(in_register.source), id(store))
+    with writers_lock:
+        if key not in writers:
+            # The store is kept so that its id is not reused while the writer exists
+            writers[key] = [WriteBehindWriter(in_register.save_to_source), 0, store]
+        writers[key][1] += 1
+        return writers[key][0]
+
+
+def close_write_behind_writer(in_writer) -> bool:
+    """
+    Writes the pending events of a shared writer, and stops it if no other register uses it
+
+    Returns:
+        bool, whether the events are on disk
+    """
+    with writers_lock:
+        is_used = False
+        for key, (writer, num_users, _) in list(writers.items()):
+            if writer is in_writer:
+                writers[key][1] = num_users - 1
+                is_used = num_users > 1
+                if not is_used:
+                    del writers[key]
+                break
+    if is_used:
+        in_writer.mark_dirty()
+        return in_writer.flush()
+    return in_writer.close()
+
+
+@atexit.register
+def close_write_behind_writers():
+    """
+    Stops all the shared writers and writes their pending events, so that the last events of a
+    process that ends without closing its registers are not lost with the daemon threads
+    """
+    with writers_lock:
+        open_writers = [writer for writer, _, _ in writers.values()]
+        writers.clear()
+    for writer in open_writers:
+        writer.close()
+
 
 class BotEventRegister:
     """
     Class that manages the storing of bot events in a database
     """
 
-    def __init__(self, in_csv_path, in_database=None, in_backup_folder=None, in_verbose_on=False):
+    def __init__(self, in_csv_path, in_database=None, in_backup_folder=None, in_verbose_on=False,
+                 in_journal_on=False, in_write_behind_on=False):
         """
         Event register constructor.
         Will use global database if global variable 'global_events_db' is not None
 
         Params:
-            in_csv_path: string, a path to the csv with the data
+            in_csv_path: string, a path to the csv with the data;
+                         a path ending in COLUMNAR_SUFFIX uses the binary columnar format and
+                         a path ending in SQLITE_SUFFIXES uses the SQLite backend
             in_database: DataFrame, a database
             in_backup_folder: string, backup folder
             in_verbose: bool, set verbose on
+            in_journal_on: bool, save new events in an append-only journal next to the csv
+                           instead of rewriting the whole csv
+            in_write_behind_on: bool, save to the csv in a background thread shared by all the
+                                registers of the same csv and store; call close() to make
+                                sure that all the events are written
         """
 
         self.source = in_csv_path
@@ -56,33 +1136,155 @@ class BotEventRegister:
 
         self.use_global = acid_rain.acid_rain_settings.use_global_database
         if self.use_global:
-            self.database = acid_rain.acid_rain_settings.global_events_db
+            self.store = acid_rain.acid_rain_settings.global_events_db
             print("bot event register: database set to global")
         else:
             if in_database is None:
-                self.database = pd.read_csv(self.source)
-                self.database[LABEL_TIMESTAMP] = pd.to_datetime(self.database[LABEL_TIMESTAMP])
+                self.store = self.read_database(self.source)
             else:
-                self.database = in_database
+                self.store = EventStore(in_database)
 
         self.verbose_on = in_verbose_on
 
+        self.journal_on = in_journal_on
+        self.journal_max_events = DEFAULT_JOURNAL_MAX_EVENTS
+
+        self.writer = open_write_behind_writer(self) if in_write_behind_on else None
+
         self.labels = ALL_LABELS
 
+    @property
+    def database(self) -> pd.DataFrame:
+        return self.get_store().get_database()
+
+    @staticmethod
+    def get_journal_path(in_csv_path) -> str:
+        return str(in_csv_path) + JOURNAL_SUFFIX
+
+    @staticmethod
+    def read_database(in_csv_path):
+        """
+        Reads the events of the csv (or columnar events folder) and replays the events of its
+        journal, if any.
+        If the path is a SQLite database, the events are not read but queried on demand
+
+        Params:
+            in_csv_path: string, a path to the csv with the data, to a columnar events folder or
+                         to a SQLite database
+
+        Returns:
+            EventStore or SqliteEventStore, the store with all the events marked as saved
+        """
+        if Path(in_csv_path).suffix in SQLITE_SUFFIXES:
+            # Imported here since the SQLite backend depends on this module
+            from acid_rain.sqlite_event_store import SqliteEventStore
+            return SqliteEventStore(in_csv_path)
+
+        tmp_database = BotEventRegister.read_events_file(in_csv_path)
+        num_journaled = 0
+        journal_path = BotEventRegister.get_journal_path(in_csv_path)
+        if os.path.isfile(journal_path):
+            journal = BotEventRegister.read_events_file(journal_path)
+            num_journaled = len(journal)
+            tmp_database = pd.concat([tmp_database, journal], ignore_index=True)
+        store = EventStore(tmp_database)
+        store.mark_saved(in_num_journaled=num_journaled)
+        return store
+
+    @staticmethod
+    def read_events_file(in_path) -> pd.DataFrame:
+        """
+        Reads the events of a csv, or of a columnar events folder if the path ends in
+        COLUMNAR_SUFFIX. Columns that are not in ALL_LABELS are ignored
+        """
+        if Path(in_path).suffix == COLUMNAR_SUFFIX:
+            # Imported here since the columnar format depends on this module
+            from acid_rain.columnar_event_file import read_columnar_events
+            return read_columnar_events(in_path)
+
+        database = pd.read_csv(in_path, usecols=lambda label: label in ALL_LABELS,
+                               dtype={LABEL_NUM_LIKES: float})
+        database[LABEL_TIMESTAMP] = pd.to_datetime(database[LABEL_TIMESTAMP])
+        return database.reindex(columns=ALL_LABELS)
+
+    @staticmethod
+    def write_events_file(in_database, in_path):
+        """
+        Writes the events to a csv, or to a columnar events folder if the path ends in
+        COLUMNAR_SUFFIX
+        """
+        if Path(in_path).suffix == COLUMNAR_SUFFIX:
+            from acid_rain.columnar_event_file import write_columnar_events
+            write_columnar_events(in_database, in_path)
+        else:
+            in_database.to_csv(in_path, index=False, columns=ALL_LABELS)
+
     @staticmethod
     def load_database(in_csv_path):
-        with acid_rain.acid_rain_settings.global_bot_lock:
+        """
+        Loads the events to share them between the registers of the process (see
+        'global_events_db')
+
+        Params:
+            in_csv_path: string, a path as in read_database, or the address of an event store
+                         server
+
+        Returns:
+            EventStore or SqliteEventStore, the store with the events; None for an event store
+            server address, since the server holds the events
+        """
+        if is_remote_address(in_csv_path):
+            return None
+        with acid_rain.acid_rain_settings.global_bot_lock.using('load_database'):
             print("Load database")
-            tmp_database = pd.read_csv(in_csv_path)
-            tmp_database[LABEL_TIMESTAMP] = pd.to_datetime(tmp_database[LABEL_TIMESTAMP])
-            return tmp_database
+            return BotEventRegister.read_database(in_csv_path)
+
+    def get_store(self):
+        """
+        Returns the event store, refreshed from the global one if the register uses it
+        """
+        if self.use_global:
+            self.store = acid_rain.acid_rain_settings.global_events_db
+        return self.store
+
+    @contextmanager
+    def reading(self, in_bot=None, in_call_site=DEFAULT_CALL_SITE):
+        """
+        Context to read the events: holds the read side of the global events lock and, if a bot
+        is specified, the read side of its lock. The lock times are recorded under 'in_call_site'
+        """
+        with acid_rain.acid_rain_settings.global_events_lock.read(in_call_site):
+            if in_bot is None:
+                yield
+            else:
+                with self.get_store().get_lock(in_bot).read(in_call_site):
+                    yield
+
+    @contextmanager
+    def writing(self, in_bot, in_call_site=DEFAULT_CALL_SITE):
+        """
+        Context to write the events of a bot: holds the read side of the global events lock and
+        the write side of the bot lock, so that different bots can write concurrently
+        """
+        with acid_rain.acid_rain_settings.global_events_lock.read(in_call_site):
+            with self.get_store().get_lock(in_bot).write(in_call_site):
+                yield
+
+    @staticmethod
+    @contextmanager
+    def writing_all(in_call_site=DEFAULT_CALL_SITE):
+        """
+        Context to write the events of all bots: holds the write side of the global events lock
+        """
+        with acid_rain.acid_rain_settings.global_events_lock.write(in_call_site):
+            yield
 
     def bot_is_locked(self, function):
         if self.use_global:
-            is_locked = None if acid_rain.acid_rain_settings.global_bot_lock is None \
-                else acid_rain.acid_rain_settings.global_bot_lock.acquired
-            owner = None if acid_rain.acid_rain_settings.global_bot_lock is None \
-                else acid_rain.acid_rain_settings.global_bot_lock.owner
+            is_locked = None if acid_rain.acid_rain_settings.global_events_lock is None \
+                else acid_rain.acid_rain_settings.global_events_lock.acquired
+            owner = None if acid_rain.acid_rain_settings.global_events_lock is None \
+                else acid_rain.acid_rain_settings.global_events_lock.owner
             lock_event_id = get_random_string()
             if is_locked:
                 print(f"-{lock_event_id} ({owner})- '{function}'"
@@ -95,8 +1297,8 @@ class BotEventRegister:
         if self.use_global:
             is_locked = lock_data[0]
             lock_ts = lock_data[1]
-            owner = None if acid_rain.acid_rain_settings.global_bot_lock is None \
-                else acid_rain.acid_rain_settings.global_bot_lock.owner
+            owner = None if acid_rain.acid_rain_settings.global_events_lock is None \
+                else acid_rain.acid_rain_settings.global_events_lock.owner
             lock_event_id = lock_data[2]
             if is_locked:
                 print(f'-{lock_event_id} ({owner})-: lock released after '
@@ -104,7 +1306,14 @@ class BotEventRegister:
 
     def save(self, in_file_path=None) -> bool:
         """
-        Save the book as a csv in a file
+        Save the book as a csv (or as a columnar events folder, see COLUMNAR_SUFFIX) in a file.
+        When saving to self.source with the journal on, only the new events are appended to the
+        journal; the journal is compacted into the csv once it exceeds 'journal_max_events' or
+        after events have been removed.
+        A SQLite backend writes every event as it is added, so there is nothing to save.
+        In write-behind mode, saving to self.source is left to the background writer.
+        The events are collected under the events locks but written to disk after releasing
+        them, so saving does not block the readers and writers of the register
 
         Params:
             in_file_path: None or string, path of the file to save the book as a csv;
@@ -120,16 +1329,110 @@ class BotEventRegister:
             print('Please specify a file path')
             return False
 
-        lock_data = self.bot_is_locked('save')
-        with acid_rain.acid_rain_settings.global_bot_lock:
-            self.print_lock_release(lock_data)
-            if self.use_global:
-                self.database = acid_rain.acid_rain_settings.global_events_db
-            self.database.to_csv(file_path, index=False)
+        if self.source is None or Path(file_path) != Path(self.source):
+            lock_data = self.bot_is_locked('save')
+            with self.reading(in_call_site='save'):
+                self.print_lock_release(lock_data)
+                database = self.get_store().get_database()
+            self.write_events_file(database, file_path)
+            if self.verbose_on:
+                print('Book saved in: {}'.format(file_path))
+            return True
+
+        if self.writer is not None:
+            self.writer.mark_dirty()
+            return True
+        return self.save_to_source()
+
+    def save_to_source(self) -> bool:
+        """
+        Saves the events to self.source, appending them to the journal or compacting it
+
+        Returns:
+            bool, whether the book was saved or not
+        """
+
+        with acid_rain.acid_rain_settings.global_bot_lock.using('save'):
+            store = self.get_store()
+            if store.is_persistent:
+                return True
+            if self.journal_on and not store.needs_compaction:
+                lock_data = self.bot_is_locked('save')
+                with self.reading(in_call_site='save'):
+                    self.print_lock_release(lock_data)
+                    unsaved_events, num_saved_per_bot = store.collect_events(True)
+                num_journaled = store.num_journaled + len(unsaved_events)
+                if num_journaled <= self.journal_max_events:
+                    if len(unsaved_events) > 0:
+                        journal_path = self.get_journal_path(self.source)
+                        unsaved_events.to_csv(journal_path, mode='a', index=False,
+                                              columns=ALL_LABELS,
+                                              header=not os.path.isfile(journal_path))
+                        store.mark_saved(num_saved_per_bot, num_journaled)
+                    if self.verbose_on:
+                        print('Book journaled in: {}'.format(self.get_journal_path(self.source)))
+                    return True
+            return self.compact()
+
+    def compact(self) -> bool:
+        """
+        Rewrites the csv with all the events and removes its journal.
+        A SQLite backend checkpoints its write-ahead log instead.
+        The events are collected holding the global events lock for writing, but written to disk
+        after releasing it
+
+        Returns:
+            bool, whether the book was compacted or not
+        """
+
+        if self.source is None:
+            print('Please specify a file path')
+            return False
+
+        with acid_rain.acid_rain_settings.global_bot_lock.using('compact'):
+            store = self.get_store()
+            if store.is_persistent:
+                return store.checkpoint()
+            lock_data = self.bot_is_locked('compact')
+            with self.writing_all('compact'):
+                self.print_lock_release(lock_data)
+                database, num_saved_per_bot = store.collect_events()
+            self.write_events_file(database, self.source)
+            journal_path = self.get_journal_path(self.source)
+            if os.path.isfile(journal_path):
+                os.remove(journal_path)
+            store.mark_saved(num_saved_per_bot)
         if self.verbose_on:
-            print('Book saved in: {}'.format(file_path))
+            print('Book saved in: {}'.format(self.source))
         return True
 
+    def flush(self) -> bool:
+        """
+        Saves the events to self.source now, including the pending saves of write-behind mode
+
+        Returns:
+            bool, whether the book was saved or not
+        """
+        if self.source is None:
+            print('Please specify a file path')
+            return False
+        if self.writer is not None:
+            self.writer.mark_dirty()
+            return self.writer.flush()
+        return self.save_to_source()
+
+    def close(self) -> bool:
+        """
+        Saves the pending events and releases the write-behind thread, if any, which stops once
+        no other register uses it
+
+        Returns:
+            bool, whether the book was saved or not
+        """
+        if self.writer is None:
+            return self.flush()
+        return close_write_behind_writer(self.writer)
+
     def do_backup(self) -> bool:
         """
         Saves a backup of the book as a csv in a file
@@ -150,6 +1453,39 @@ class BotEventRegister:
     # -----------------------------------------------------------------------
     # Read
 
+    def get_query_cache(self) -> (None, QueryCache):
+        """
+        Returns the query cache of the store, None if the store is not cached (e.g. SQLite,
+        which other processes can write)
+        """
+        return getattr(self.get_store(), 'query_cache', None)
+
+    def query(self, in_bot, in_key, in_compute):
+        """
+        Returns the result of a query, memoized until the events of the bot change
+
+        Params:
+            in_bot: str, name of the bot of the query, None if it spans all bots
+            in_key: tuple, the method and its arguments
+            in_compute: callable without arguments that returns the result of the query
+        """
+        query_cache = self.get_query_cache()
+        if query_cache is None:
+            return in_compute()
+        return query_cache.get(in_bot, in_key, in_compute)
+
+    def get_query_cache_statistics(self) -> dict:
+        """
+        Returns the number of hits and misses of the query cache
+
+        Returns:
+            dict, 'hits' and 'misses'; both 0 if the store is not cached
+        """
+        query_cache = self.get_query_cache()
+        if query_cache is None:
+            return {'hits': 0, 'misses': 0}
+        return query_cache.get_statistics()
+
     def get_number_of_events(self, in_bot=None) -> int:
         """
         Returns the number of events of the database
@@ -160,14 +1496,25 @@ class BotEventRegister:
         Returns:
             int, number of events
         """
-        lock_data = self.bot_is_locked('get_number_of_events')
-        with acid_rain.acid_rain_settings.global_bot_lock:
-            if self.use_global:
-                self.database = acid_rain.acid_rain_settings.global_events_db
-            number_of_events = len(self.database) if in_bot is None \
-                else len(self.database[self.database[LABEL_BOT] == in_bot])
+        return self.query(in_bot, ('get_number_of_events',),
+                          lambda: self.get_store().count_events(in_bot))
+
+    def get_memory_report(self) -> pd.Series:
+        """
+        Returns the memory used by the events in memory, per column
+
+        Returns:
+            Series, bytes used by each label and in total ('total')
+        """
+        lock_data = self.bot_is_locked('get_memory_report')
+        with self.reading(in_call_site='get_memory_report'):
+            memory_usage = self.get_store().get_memory_usage()
             self.print_lock_release(lock_data)
-            return number_of_events
+        memory_report = pd.Series(memory_usage, index=ALL_LABELS, dtype='int64')
+        memory_report['total'] = memory_report.sum()
+        if self.verbose_on:
+            print('Events memory (bytes):\n{}'.format(memory_report.to_string()))
+        return memory_report
 
     def get_event_timestamp(self, in_bot=None, in_timestamp=None) -> datetime:
         """
@@ -180,18 +1527,9 @@ class BotEventRegister:
         Returns:
             datetime or None, timestamp of the previous event of bot, None if not previous events
         """
-        lock_data = self.bot_is_locked('get_event_timestamp')
-        with acid_rain.acid_rain_settings.global_bot_lock:
-            if self.use_global:
-                self.database = acid_rain.acid_rain_settings.global_events_db
-            timestamp = datetime.datetime.now() if in_timestamp is None else in_timestamp
-            condition = self.database[LABEL_TIMESTAMP] <= timestamp
-            if in_bot is not None:
-                condition &= self.database[LABEL_BOT] == in_bot
-            results = self.database.loc[condition][LABEL_TIMESTAMP]
-            event_timestamp = results.iloc[-1] if len(results) > 0 else None
-            self.print_lock_release(lock_data)
-            return event_timestamp
+        timestamp = datetime.datetime.now() if in_timestamp is None else in_timestamp
+        event_timestamp = self.get_store().get_last_timestamp(in_bot, None, timestamp)
+        return event_timestamp
 
     def get_last_block_timestamp(self, in_bot) -> (None, datetime):
         """
@@ -203,16 +1541,10 @@ class BotEventRegister:
         Returns:
             datetime or None, timestamp of the last block
         """
-        lock_data = self.bot_is_locked('get_last_block_timestamp')
-        with acid_rain.acid_rain_settings.global_bot_lock:
-            if self.use_global:
-                self.database = acid_rain.acid_rain_settings.global_events_db
-            condition = (self.database[LABEL_BOT] == in_bot) \
-                        & (self.database[LABEL_EVENT] == EVENT_BLOCK)
-            results = self.database.loc[condition][LABEL_TIMESTAMP]
-            event_timestamp = results.iloc[-1] if len(results) > 0 else None
-            self.print_lock_release(lock_data)
-            return event_timestamp
+        event_timestamp = self.query(
+            in_bot, ('get_last_block_timestamp',),
+            lambda: self.get_store().get_last_timestamp(in_bot, EVENT_BLOCK))
+        return event_timestamp
 
     def get_number_of_follows_since(self, in_bot, in_timestamp) -> int:
         """
@@ -225,16 +1557,10 @@ class BotEventRegister:
         Returns:
             datetime, timestamp of the previous event of bot
         """
-        lock_data = self.bot_is_locked('get_number_of_follows_since')
-        with acid_rain.acid_rain_settings.global_bot_lock:
-            if self.use_global:
-                self.database = acid_rain.acid_rain_settings.global_events_db
-            condition = (self.database[LABEL_BOT] == in_bot) \
-                        & (self.database[LABEL_EVENT] == EVENT_FOLLOW) \
-                        & (self.database[LABEL_TIMESTAMP] >= in_timestamp)
-            number_of_follows = len(self.database.loc[condition][LABEL_TIMESTAMP])
-            self.print_lock_release(lock_data)
-            return number_of_follows
+        number_of_follows = self.query(
+            in_bot, ('get_number_of_follows_since', in_timestamp),
+            lambda: self.get_store().count_events_since(in_bot, EVENT_FOLLOW, in_timestamp))
+        return number_of_follows
 
     def get_number_of_likes_since(self, in_bot, in_timestamp) -> int:
         """
@@ -247,16 +1573,43 @@ class BotEventRegister:
         Returns:
             datetime, timestamp of the previous event of bot
         """
-        lock_data = self.bot_is_locked('get_number_of_likes_since')
-        with acid_rain.acid_rain_settings.global_bot_lock:
-            if self.use_global:
-                self.database = acid_rain.acid_rain_settings.global_events_db
-            condition = (self.database[LABEL_BOT] == in_bot) \
-                        & (self.database[LABEL_EVENT] == EVENT_LIKES) \
-                        & (self.database[LABEL_TIMESTAMP] >= in_timestamp)
-            number_of_likes = self.database.loc[condition][LABEL_NUM_LIKES].sum()
-            self.print_lock_release(lock_data)
-            return number_of_likes
+        number_of_likes = self.query(
+            in_bot, ('get_number_of_likes_since', in_timestamp),
+            lambda: self.get_store().sum_likes_since(in_bot, in_timestamp))
+        return number_of_likes
+
+    def get_number_of_follows_in_last(self, in_bot, in_window) -> int:
+        """
+        Returns the number of follows done by the bot in the last time window.
+        Windows in COUNTER_WINDOWS are read from the rolling counters in constant time, so they
+        are not memoized
+
+        Params:
+            in_bot: str, name of the bot
+            in_window: timedelta, duration of the window
+
+        Returns:
+            int, number of follows
+        """
+        number_of_follows = \
+            self.get_store().count_events_in_last(in_bot, EVENT_FOLLOW, in_window)
+        return number_of_follows
+
+    def get_number_of_likes_in_last(self, in_bot, in_window) -> int:
+        """
+        Returns the number of likes done by the bot in the last time window.
+        Windows in COUNTER_WINDOWS are read from the rolling counters in constant time, so they
+        are not memoized
+
+        Params:
+            in_bot: str, name of the bot
+            in_window: timedelta, duration of the window
+
+        Returns:
+            int, number of likes
+        """
+        number_of_likes = self.get_store().sum_likes_in_last(in_bot, in_window)
+        return number_of_likes
 
     def get_first_timestamp_with_more_than_cumulative_likes(
             self, in_bot, in_num_likes) -> (None, datetime.datetime):
@@ -270,20 +1623,64 @@ class BotEventRegister:
         Returns:
             datetime, the timestamp, or None if no match is found
         """
-        lock_data = self.bot_is_locked('get_first_timestamp_with_more_than_cumulative_likes')
-        with acid_rain.acid_rain_settings.global_bot_lock:
-            if self.use_global:
-                self.database = acid_rain.acid_rain_settings.global_events_db
-            bot_likes_condition = (self.database[LABEL_BOT] == in_bot) \
-                                  & (self.database[LABEL_EVENT] == EVENT_LIKES)
-            bot_df = self.database[bot_likes_condition]
-            reverse_cumulative_likes_df = bot_df.loc[::-1, LABEL_NUM_LIKES].cumsum()[::-1]
-            cum_likes_match = \
-                reverse_cumulative_likes_df[reverse_cumulative_likes_df > in_num_likes]
-            first_timestamp = None if len(cum_likes_match) == 0 \
-                else self.database.iloc[cum_likes_match.index[-1]][LABEL_TIMESTAMP]
-            self.print_lock_release(lock_data)
-            return first_timestamp
+        first_timestamp = self.query(
+            in_bot, ('get_first_timestamp_with_more_than_cumulative_likes', in_num_likes),
+            lambda: self.get_store().get_first_timestamp_with_more_than_cumulative_likes(
+                in_bot, in_num_likes))
+        return first_timestamp
+
+    def get_first_timestamp_with_more_than_cumulative_follows(
+            self, in_bot, in_num_follows) -> (None, datetime.datetime):
+        """
+        Returns the first timestamp such that the number of follows is more than
+        'in_num_follows'
+
+        Params:
+            in_bot: str, name of the bot
+            in_num_follows: int, the number of follows
+
+        Returns:
+            datetime, the timestamp, or None if no match is found
+        """
+        first_timestamp = self.query(
+            in_bot, ('get_first_timestamp_with_more_than_cumulative_follows', in_num_follows),
+            lambda: self.get_store().get_first_timestamp_with_more_than_cumulative_events(
+                in_bot, EVENT_FOLLOW, in_num_follows))
+        return first_timestamp
+
+    def get_rollup(self, in_bot, in_event, in_period=ONE_HOUR, in_start=None,
+                   in_end=None) -> pd.DataFrame:
+        """
+        Returns the number of events and of likes of a bot per period, read from the rollups
+
+        Params:
+            in_bot: str, name of the bot; if None, the events of all bots are added up
+            in_event: str, the event
+            in_period: timedelta, one of ROLLUP_PERIODS
+            in_start: datetime, start of the series, rounded down to the start of its period;
+                      if None, the first period with events
+            in_end: datetime, end of the series (the periods that start before it are
+                    returned); if None, now
+
+        Returns:
+            DataFrame, the LABEL_COUNT and LABEL_NUM_LIKES of each period, indexed by the start
+            of the periods; periods without events are 0
+        """
+        if in_period not in ROLLUP_PERIODS:
+            print('Rollup period {} is not one of {}'.format(in_period, ROLLUP_PERIODS))
+            return None
+        end = datetime.datetime.now() if in_end is None else in_end
+        buckets = self.get_store().get_rollup_buckets(in_bot, in_event, in_period, in_start, end)
+
+        start = in_start
+        if start is None:
+            start = min(buckets) if len(buckets) > 0 else end
+        bucket_starts = pd.date_range(get_period_start(start, in_period), end,
+                                      freq=pd.Timedelta(in_period), inclusive='left',
+                                      name=LABEL_TIMESTAMP)
+        rollup = pd.DataFrame.from_dict(buckets, orient='index',
+                                        columns=[LABEL_COUNT, LABEL_NUM_LIKES])
+        return rollup.reindex(bucket_starts, fill_value=0).astype('int64')
 
     # -----------------------------------------------------------------------
     # Write
@@ -299,14 +1696,9 @@ class BotEventRegister:
             int, number of events removed
         """
         lock_data = self.bot_is_locked('remove_events_before')
-        with acid_rain.acid_rain_settings.global_bot_lock:
-            if self.use_global:
-                self.database = acid_rain.acid_rain_settings.global_events_db
-            previous_num_of_events = self.get_number_of_events()
-            self.database = self.database.loc[self.database[LABEL_TIMESTAMP] >= in_timestamp]
-            if self.use_global:
-                acid_rain.acid_rain_settings.global_events_db = self.database
-            num_events_removed = previous_num_of_events - self.get_number_of_events()
+        with acid_rain.acid_rain_settings.global_bot_lock.using('remove_events_before'), \
+                self.writing_all('remove_events_before'):
+            num_events_removed = self.get_store().remove_before(in_timestamp)
             self.print_lock_release(lock_data)
             return num_events_removed
 
@@ -332,22 +1724,44 @@ class BotEventRegister:
             bool, whether the event was succesfully written
         """
 
+        data = self.make_event_data(in_bot, in_event_name, in_username, in_num_likes, in_comments,
+                                    in_timestamp)
+        if data is None:
+            return False
+
+        lock_data = self.bot_is_locked('add_event')
+        with self.writing(in_bot, 'add_event'):
+            self.get_store().append(data)
+            self.print_lock_release(lock_data)
+        notify_event_listeners([data])
+        return True
+
+    @staticmethod
+    def make_event_data(in_bot, in_event_name, in_username=None, in_num_likes=None,
+                        in_comments=None, in_timestamp=None) -> (None, dict):
+        """
+        Validates an event and returns its data (see add_event for the params)
+
+        Returns:
+            dict or None, event data with all the labels as keys; None if the event is not valid
+        """
+
         if in_event_name == EVENT_LIKES and (in_username is None or in_num_likes is None):
             print("Event 'likes' requires 'in_username' and 'in_num_likes")
-            return False
+            return None
         elif in_event_name == EVENT_FOLLOW and in_username is None:
             print("Event 'follow' requires 'in_username'")
-            return False
+            return None
         elif in_event_name == EVENT_EXCEPTION and in_comments is None:
             print("Event 'exception' requires 'in_comments'")
-            return False
+            return None
         elif in_event_name == EVENT_BLOCK and in_comments is None:
             print("Event 'block' requires 'in_comments'")
-            return False
+            return None
 
         timestamp = datetime.datetime.now() if in_timestamp is None else in_timestamp
 
-        data = {
+        return {
             LABEL_TIMESTAMP: timestamp,
             LABEL_BOT: in_bot,
             LABEL_EVENT: in_event_name,
@@ -356,12 +1770,36 @@ class BotEventRegister:
             LABEL_COMMENTS: in_comments
         }
 
-        lock_data = self.bot_is_locked('add_event')
-        with acid_rain.acid_rain_settings.global_bot_lock:
-            if self.use_global:
-                self.database = acid_rain.acid_rain_settings.global_events_db
-            self.database = self.database.append(data, ignore_index=True)
-            if self.use_global:
-                acid_rain.acid_rain_settings.global_events_db = self.database
+    def add_events(self, in_events) -> bool:
+        """
+        Adds several events to the database at once, holding the locks a single time.
+        Either all the events are added or none of them
+
+        Params:
+            in_events: iterable, dicts with the data of each event; 'bot' and 'event' labels are
+                       required and the rest are optional, with the same rules as add_event
+
+        Returns:
+            bool, whether the events were succesfully written
+        """
+
+        data_list = []
+        for event in in_events:
+            data = self.make_event_data(event.get(LABEL_BOT), event.get(LABEL_EVENT),
+                                        event.get(LABEL_USERNAME), event.get(LABEL_NUM_LIKES),
+                                        event.get(LABEL_COMMENTS), event.get(LABEL_TIMESTAMP))
+            if data is None:
+                return False
+            data_list.append(data)
+        if len(data_list) == 0:
+            return True
+
+        bots = {data[LABEL_BOT] for data in data_list}
+        lock_data = self.bot_is_locked('add_events')
+        # A batch of a single bot only locks that bot
+        with self.writing(bots.pop(), 'add_events') if len(bots) == 1 \
+                else self.writing_all('add_events'):
+            self.get_store().append_many(data_list)
             self.print_lock_release(lock_data)
+        notify_event_listeners(data_list)
         return True
@@ -5,18 +5,27 @@
 __author__ = "Josep-Arnau Claret"
 __email__ = "joseparnau81@gmail.com"
 
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from random import uniform, shuffle
 from time import sleep
-from threading import Thread
+from threading import Lock, Thread
 
 import pandas as pd
 
 import acid_rain.acid_rain_settings
 from acid_rain.bot_event_register import BotEventRegister
-from acid_rain.insta_bot import InstaBot, LIKES_MAX_PER_RUN, LIKES_MAX_PER_DAY, \
-    LIKES_MAX_PER_HOUR, LIKES_MIN_X_PROFILE, LIKES_MAX_X_PROFILE, LIKES_MIN_SLEEP_TIME_S, \
-    LIKES_MAX_SLEEP_TIME_S, LIKES_MIN_SECONDS_BETWEEN_PROFILES, \
+from acid_rain.excluded_profiles import get_exclusion_index, get_profile_key, LABEL_PROFILE_URL
+from acid_rain.target_queue import TargetQueue
+from acid_rain.engage_checkpoint import EngageCheckpoint
+from acid_rain.bot_scheduler import BotScheduler, AsyncBotScheduler
+from acid_rain.target_planner import plan_targets, LABEL_ALLOTMENT, LABEL_CAPACITY, \
+    LABEL_DAY_HEADROOM, LABEL_BLOCKED_UNTIL
+from acid_rain.insta_bot import InstaBot, ACTION_LIKE, ACTION_FOLLOW, ACTION_LIST, \
+    LIKES_MAX_PER_RUN, LIKES_MAX_PER_DAY, LIKES_MAX_PER_HOUR, LIKES_MIN_X_PROFILE, \
+    LIKES_MAX_X_PROFILE, LIKES_MIN_SLEEP_TIME_S, LIKES_MAX_SLEEP_TIME_S, \
+    LIKES_MIN_SECONDS_BETWEEN_PROFILES, \
     LIKES_MAX_SECONDS_BETWEEN_PROFILES, FOLLOWS_MAX_PER_RUN, FOLLOWS_MAX_PER_DAY, \
     FOLLOWS_MAX_PER_HOUR, FOLLOWS_MIN_SECONDS_BETWEEN_PROFILES, \
     FOLLOWS_MAX_SECONDS_BETWEEN_PROFILES, MAX_RUN_HOURS, WAIT_AFTER_BLOCK_HOURS
@@ -35,6 +44,64 @@ DEFAULT_LAUNCH_MAX_WAIT_TIME_M = 20
 FUNCTION_LIKE_FOLLOW = 'like_follow'
 FUNCTION_ENGAGE = 'engage'
 
+LABEL_IS_PRIVATE = 'isPrivate'
+IS_PRIVATE = 'Private'
+TARGETS_CHUNK_SIZE = 100000
+
+DEFAULT_EXECUTOR_MAX_WORKERS = 4
+
+
+def read_target_profiles(in_file_path, in_exclusion_index=None, in_max_likes=None,
+                         in_max_follows=None, in_chunk_size=TARGETS_CHUNK_SIZE) -> tuple:
+    """
+    Reads the urls of the target profiles in chunks, reading only the url and privacy columns
+    and skipping the excluded profiles, until the public (likes) and private (follows) targets
+    are enough, so memory is bounded by the chunk size and the targets
+
+    Params:
+        in_file_path: str, file path with the profiles
+        in_exclusion_index: ExclusionIndex, index of the excluded profiles; None excludes none
+        in_max_likes: int, number of public profiles to read; if None, all of them
+        in_max_follows: int, number of private profiles to read; if None, all of them
+        in_chunk_size: int, number of rows read at once
+
+    Returns:
+        tuple, the Series with the urls of the likes targets and of the follows targets, and the
+        number of rows read
+    """
+    targets = {False: [], True: []}
+    max_targets = {False: in_max_likes, True: in_max_follows}
+    num_targets = {False: 0, True: 0}
+    num_rows = 0
+    # The keys are hashed once for all the chunks
+    excluded_keys = None if in_exclusion_index is None else pd.Index(in_exclusion_index.get_keys())
+    with pd.read_csv(in_file_path, usecols=[LABEL_PROFILE_URL, LABEL_IS_PRIVATE], dtype=str,
+                     chunksize=in_chunk_size) as reader:
+        for chunk in reader:
+            num_rows += len(chunk)
+            chunk = chunk.loc[chunk[LABEL_PROFILE_URL].notna()]
+            if excluded_keys is not None:
+                chunk = chunk.loc[~chunk[LABEL_PROFILE_URL].map(get_profile_key)
+                                  .isin(excluded_keys)]
+            for is_private, is_target in ((False, chunk[LABEL_IS_PRIVATE].isnull()),
+                                          (True, chunk[LABEL_IS_PRIVATE] == IS_PRIVATE)):
+                chunk_targets = chunk.loc[is_target, LABEL_PROFILE_URL]
+                if max_targets[is_private] is not None:
+                    chunk_targets = \
+                        chunk_targets[:max_targets[is_private] - num_targets[is_private]]
+                targets[is_private].append(chunk_targets)
+                num_targets[is_private] += len(chunk_targets)
+            if all(max_targets[is_private] is not None and
+                   num_targets[is_private] >= max_targets[is_private]
+                   for is_private in (False, True)):
+                break
+
+    likes_targets, follows_targets = [
+        pd.concat(targets[is_private], ignore_index=True) if len(targets[is_private]) > 0
+        else pd.Series([], name=LABEL_PROFILE_URL, dtype=object)
+        for is_private in (False, True)]
+    return likes_targets, follows_targets, num_rows
+
 
 class BotMaster:
     """
@@ -43,7 +110,7 @@ class BotMaster:
 
     def __init__(self, in_bots, in_target_profiles_file, in_excluded_profiles_file,
                  in_bot_events_database_file_path, in_test=False, in_with_shuffle=True,
-                 in_log_folder=None):
+                 in_log_folder=None, in_checkpoint_folder=None):
         """
         Params:
             in_bots: list, list of bot dicts.
@@ -54,6 +121,8 @@ class BotMaster:
             in_test: bool, whether to run in test or not
             in_with_shuffle: bool, randomly sort bots
             in_log_folder: str, folder to log
+            in_checkpoint_folder: str, folder to checkpoint the progress of the bots, so that a run
+                                  can be resumed; if None, it is not checkpointed
         """
 
         self.test_on = in_test
@@ -68,6 +137,9 @@ class BotMaster:
         self.num_of_bots = len(self.bots_credentials)
         self.bots = None
         self.bot_threads = None
+        self.scheduler = None
+        self.num_running_bots = 0
+        self.num_running_bots_lock = Lock()
 
         self.target_profiles_file = in_target_profiles_file
         self.excluded_profiles_file = in_excluded_profiles_file
@@ -76,8 +148,10 @@ class BotMaster:
         self.launch_min_wait_time_m = DEFAULT_LAUNCH_MIN_WAIT_TIME_M
         self.launch_max_wait_time_m = DEFAULT_LAUNCH_MAX_WAIT_TIME_M
 
-        self.likes_target_profiles_per_bot = None
-        self.follow_target_profiles_per_bot = None
+        self.target_queue = None
+        self.target_plan = None
+        self.checkpoint = None if in_checkpoint_folder is None \
+            else EngageCheckpoint(in_checkpoint_folder)
         self.probabilities_per_bot = None
 
         self.wait_after_block_hours = WAIT_AFTER_BLOCK_HOURS
@@ -120,9 +194,10 @@ class BotMaster:
         """
 
         if self.bots is None:
-            acid_rain.acid_rain_settings.use_global_database = True
-            acid_rain.acid_rain_settings.global_events_db = \
-                BotEventRegister.load_database(self.bot_events_database_file_path)
+            # The bots of an event store server query it instead of a global database
+            global_events_db = BotEventRegister.load_database(self.bot_events_database_file_path)
+            acid_rain.acid_rain_settings.use_global_database = global_events_db is not None
+            acid_rain.acid_rain_settings.global_events_db = global_events_db
 
             print('+++++ BOTS: {}'.format([x[KEY_BOT_NAME] for x in self.bots_credentials]))
 
@@ -173,119 +248,275 @@ class BotMaster:
         """
 
         # choose target profiles
-        profiles = pd.read_csv(self.target_profiles_file)
-        excluded_profiles = pd.read_csv(self.excluded_profiles_file)
-        print('+++++ Profiles: {}'.format(len(profiles)))
-        print('+++++ Excluded: {}'.format(len(excluded_profiles)))
-
-        public_profiles = profiles.loc[profiles['isPrivate'].isnull()]
-        private_profiles = profiles.loc[profiles.isPrivate == 'Private']
-
-        likes_targets \
-            = public_profiles[~public_profiles.profileUrl.isin(excluded_profiles.profileUrl)]
-        if in_load_num_profiles_likes is not None:
-            likes_targets = likes_targets[0:in_load_num_profiles_likes]
-
-        follow_targets = \
-            private_profiles[~private_profiles.profileUrl.isin(excluded_profiles.profileUrl)]
-        if in_load_num_profiles_follows is not None:
-            follow_targets = follow_targets[0:in_load_num_profiles_follows]
-
-        likes_target_profiles = likes_targets.profileUrl
-        follow_target_profiles = follow_targets.profileUrl
-        print('+++++ Like Profiles: {} / {}'.format(len(likes_target_profiles), len(profiles)))
-        print('+++++ Follow Profiles: {} / {}'.format(len(follow_target_profiles), len(profiles)))
-
-        # separate profiles by target
-        num_profiles_likes = len(likes_target_profiles)
-        num_profiles_follows = len(follow_target_profiles)
-        likes_per_bot = int(num_profiles_likes / self.num_of_bots)
-        follows_per_bot = int(num_profiles_follows / self.num_of_bots)
-
-        self.likes_target_profiles_per_bot = []
-        self.follow_target_profiles_per_bot = []
+        exclusion_index = get_exclusion_index(self.excluded_profiles_file)
+        exclusion_index.save()
+        print('+++++ Excluded: {}'.format(len(exclusion_index)))
+
+        likes_target_profiles, follow_target_profiles, num_profiles = read_target_profiles(
+            self.target_profiles_file, exclusion_index, in_load_num_profiles_likes,
+            in_load_num_profiles_follows)
+        print('+++++ Profiles read: {}'.format(num_profiles))
+        print('+++++ Like Profiles: {} / {}'.format(len(likes_target_profiles), num_profiles))
+        print('+++++ Follow Profiles: {} / {}'.format(len(follow_target_profiles), num_profiles))
+
+        # share the profiles between the bots: each bot takes batches of targets from a
+        # common queue, and steals from the others when it is empty
+        self.target_queue = TargetQueue({ACTION_LIKE: likes_target_profiles.values,
+                                         ACTION_FOLLOW: follow_target_profiles.values})
+
+        # Report
+        print('+++++ Print profiles')
+        if len(likes_target_profiles) > 0:
+            print('  +++++ - Likes:   first - {}'.format(likes_target_profiles.values[0]))
+            print('  +++++            last  - {}'.format(likes_target_profiles.values[-1]))
+        if len(follow_target_profiles) > 0:
+            print('  +++++ - Follows: first - {}'.format(follow_target_profiles.values[0]))
+            print('  +++++            last  - {}'.format(follow_target_profiles.values[-1]))
+
+    def load_probabilities(self):
+        """
+        Loads the action probabilities of the bots from their data
+        """
         self.probabilities_per_bot = []
-        likes_last_idx = -1
-        follows_last_idx = -1
         for i_bot in range(self.num_of_bots):
-            likes_first_idx = likes_last_idx + 1
-            likes_last_idx = likes_first_idx + likes_per_bot
-            self.likes_target_profiles_per_bot.append(
-                likes_target_profiles[likes_first_idx:likes_last_idx + 1])
-
-            follows_first_idx = follows_last_idx + 1
-            follows_last_idx = follows_first_idx + follows_per_bot
-            self.follow_target_profiles_per_bot.append(
-                follow_target_profiles[follows_first_idx:follows_last_idx + 1])
-
             if self.bots_data[i_bot] is None or KEY_ACTION_PROBS not in self.bots_data[i_bot]:
                 self.probabilities_per_bot.append(None)
             else:
                 self.probabilities_per_bot.append(self.bots_data[i_bot][KEY_ACTION_PROBS])
+
+    def resume_profiles(self) -> bool:
+        """
+        Loads the target queue of the checkpoint, in the state it was last saved
+
+        Returns:
+            bool, whether there was a checkpoint to resume
+        """
+        self.target_queue = None if self.checkpoint is None \
+            else self.checkpoint.load_target_queue()
+        if self.target_queue is None:
+            print('+++++ No checkpoint to resume')
+            return False
+        print('+++++ Resumed profiles: likes {}, follows {}'
+              .format(self.target_queue.get_num_targets(ACTION_LIKE),
+                      self.target_queue.get_num_targets(ACTION_FOLLOW)))
+        return True
+
+    def plan_targets(self):
+        """
+        Reserves for each bot the targets of the likes and follows it can still do in the run,
+        given its remaining daily and hourly quota and its block state in the register, and
+        reports when the fleet is projected to complete the targets. The reservations are soft:
+        bots go on with the targets not reserved, or released by the bots that stop (see
+        TargetQueue)
+        """
+        num_targets = {action: self.target_queue.get_num_targets(action) for action in ACTION_LIST}
+        self.target_plan, completion_times = plan_targets(
+            self.bots, num_targets, self.follows_max_run_hours + self.likes_max_run_hours)
+        for (bot_name, action), allotment in self.target_plan[LABEL_ALLOTMENT].items():
+            self.target_queue.set_allotment(bot_name, action, int(allotment))
+
         # Report
-        print('+++++ Print profiles')
-        for i_bot, data in enumerate(zip(self.bots,
-                                         self.likes_target_profiles_per_bot,
-                                         self.follow_target_profiles_per_bot)):
-            bot_name = data[0].name
-            like_profiles = data[1]
-            follow_profiles = data[2]
-            print('  +++++ Bot: {}'.format(bot_name))
-            if len(like_profiles) > 0:
-                print('    +++++ - Likes:   first - {}'.format(like_profiles.values[0]))
-                print('    +++++            last  - {}'.format(like_profiles.values[-1]))
-            if len(follow_profiles) > 0:
-                print('    +++++ - Follows: first - {}'.format(follow_profiles.values[0]))
-                print('    +++++            last  - {}'.format(follow_profiles.values[-1]))
-
-    def run(self, in_load_num_profiles_likes=None, in_load_num_profiles_follows=None):
+        print('+++++ Target plan')
+        for (bot_name, action), row in self.target_plan.iterrows():
+            blocked_str = '' if pd.isnull(row[LABEL_BLOCKED_UNTIL]) \
+                else ', blocked until {}'.format(row[LABEL_BLOCKED_UNTIL])
+            print('  +++++ ({}) {}: {} profiles (capacity {}, day headroom {}{})'
+                  .format(bot_name, action.upper(), row[LABEL_ALLOTMENT], row[LABEL_CAPACITY],
+                          row[LABEL_DAY_HEADROOM], blocked_str))
+        for action in ACTION_LIST:
+            print('  +++++ {}: {} profiles, projected completion: {}'
+                  .format(action.upper(), num_targets[action],
+                          completion_times[action] or 'beyond the planning horizon'))
+
+    def prepare_run(self, in_load_num_profiles_likes=None, in_load_num_profiles_follows=None,
+                    in_resume=False) -> list:
+        """
+        Initializes the bots and loads their targets, or resumes them from the checkpoint
+
+        Params:
+            in_load_num_profiles_likes: int, number of profiles to like; if None, all of them
+            in_load_num_profiles_follows: int, number of profiles to follow; if None, all of them
+            in_resume: bool, restart the bots where the last checkpointed run stopped, with its
+                       targets, instead of loading them
+
+        Returns:
+            list, progress of each bot to resume (see EngageCheckpoint.load_progress), None to
+                  start anew
+        """
 
         if self.test_on:
             print('+++++ TEST MODE')
 
         self.initialize_bots()
+        self.load_probabilities()
+        if in_resume and self.resume_profiles():
+            return [self.checkpoint.load_progress(bot.name) for bot in self.bots]
+
         self.load_profiles(in_load_num_profiles_likes, in_load_num_profiles_follows)
+        self.plan_targets()
+        if self.checkpoint is not None:
+            self.checkpoint.save_targets(self.target_queue)
+        return [None for _ in self.bots]
+
+    def get_launch_wait_time_s(self, in_i_bot) -> float:
+        return uniform(in_i_bot * (self.launch_min_wait_time_m * 60),
+                       in_i_bot * (self.launch_max_wait_time_m * 60))
+
+    def run(self, in_load_num_profiles_likes=None, in_load_num_profiles_follows=None,
+            in_resume=False):
+        """
+        Launches the bots, each one in its own thread (see prepare_run for the params)
+        """
 
+        progress_per_bot = self.prepare_run(in_load_num_profiles_likes,
+                                            in_load_num_profiles_follows, in_resume)
+
+        # The bots sleep in a shared scheduler until they can act
+        self.scheduler = BotScheduler()
         self.bot_threads = []
-        for i_bot, bot_data in enumerate(zip(self.bots,
-                                             self.likes_target_profiles_per_bot,
-                                             self.follow_target_profiles_per_bot,
-                                             self.probabilities_per_bot)):
-            bot_name = bot_data[0].name
-            wait_time_s = uniform(i_bot * (self.launch_min_wait_time_m * 60),
-                                  i_bot * (self.launch_max_wait_time_m * 60))
-            print('+++++ ({}) Launch bot after {} s'.format(bot_name, timedelta(0, wait_time_s)))
+        self.num_running_bots = len(self.bots)
+        for i_bot, bot_data in enumerate(zip(self.bots, self.probabilities_per_bot,
+                                             progress_per_bot)):
+            bot, probabilities, progress = bot_data
+            wait_time_s = self.get_launch_wait_time_s(i_bot)
+            print('+++++ ({}) Launch bot after {} s'.format(bot.name, timedelta(0, wait_time_s)))
             sleep(wait_time_s)
 
-            bot_thread = Thread(target=self.bot_run_function, args=bot_data)
+            bot_thread = Thread(target=self.bot_thread_function,
+                                args=(bot, probabilities, FUNCTION_ENGAGE, progress))
             bot_thread.start()
             self.bot_threads.append(bot_thread)
 
-    def bot_run_function(self, bot, like_targets, follow_targets, probabilities=None,
-                         in_function=FUNCTION_ENGAGE):
+    def run_async(self, in_load_num_profiles_likes=None, in_load_num_profiles_follows=None,
+                  in_resume=False, in_max_workers=DEFAULT_EXECUTOR_MAX_WORKERS):
+        """
+        Runs the bots in an asyncio event loop until all of them end: their waits are timers of
+        the loop and only their Selenium calls take a thread, from an executor of
+        'in_max_workers' threads (see prepare_run for the rest of params)
+        """
+
+        progress_per_bot = self.prepare_run(in_load_num_profiles_likes,
+                                            in_load_num_profiles_follows, in_resume)
+        asyncio.run(self.run_bots_async(progress_per_bot, in_max_workers))
+        self.compact_events()
+
+    async def run_bots_async(self, in_progress_per_bot, in_max_workers):
+        scheduler = AsyncBotScheduler()
+        with ThreadPoolExecutor(in_max_workers, thread_name_prefix='selenium') as executor:
+            try:
+                results = await asyncio.gather(
+                    *[self.bot_run_async(bot, probabilities, progress, i_bot, scheduler, executor)
+                      for i_bot, (bot, probabilities, progress) in enumerate(
+                          zip(self.bots, self.probabilities_per_bot, in_progress_per_bot))],
+                    return_exceptions=True)
+            finally:
+                scheduler.close()
+        for bot, result in zip(self.bots, results):
+            if isinstance(result, Exception):
+                print('+++++ ({}) CRASHED: {}'.format(bot.name, repr(result)))
+
+    async def bot_run_async(self, bot, probabilities, progress, in_i_bot, scheduler, executor):
+
+        wait_time_s = self.get_launch_wait_time_s(in_i_bot)
+        print('+++++ ({}) Launch bot after {} s'.format(bot.name, timedelta(0, wait_time_s)))
+        await asyncio.sleep(wait_time_s)
 
         if probabilities is None:
             probabilities = [0.80, 0.20]
         time_start = datetime.now()
 
-        print('+++++ ({}) Start: {}'.format(bot.name, in_function.upper()))
-        if in_function == FUNCTION_LIKE_FOLLOW:
-            liked_profiles, followed_profiles = \
-                bot.do_likes_and_follows(likes_targets=like_targets,
-                                         likes_max_run_hours=self.likes_max_run_hours,
-                                         follow_targets=follow_targets,
-                                         follow_max_run_hours=self.follows_max_run_hours)
-        elif in_function == FUNCTION_ENGAGE:
-            liked_profiles, followed_profiles = \
-                bot.engage(likes_targets=like_targets, follow_targets=follow_targets,
-                           run_time_hours=self.follows_max_run_hours + self.likes_max_run_hours,
-                           probabilities=probabilities)
+        # The checkpoint writes run in the default executor, apart from the Selenium calls
+        loop = asyncio.get_running_loop()
+        print('+++++ ({}) Start: {}'.format(bot.name, FUNCTION_ENGAGE.upper()))
+        try:
+            liked_profiles, followed_profiles = await bot.engage_async(
+                self.target_queue,
+                run_time_hours=self.follows_max_run_hours + self.likes_max_run_hours,
+                probabilities=probabilities, checkpoint=self.checkpoint, progress=progress,
+                scheduler=scheduler, executor=executor)
+        finally:
+            await loop.run_in_executor(None, self.release_bot_targets, bot)
+            await loop.run_in_executor(None, self.flush_bot_events, bot)
+        await loop.run_in_executor(None, self.end_bot_run, bot, liked_profiles, followed_profiles,
+                                   time_start)
+        await loop.run_in_executor(executor, bot.close_session)
+
+        print('+++++ ({}) GOOD BYE'.format(bot.name))
+
+    def release_bot_targets(self, bot):
+        """
+        Returns the targets of a bot that stops or crashes to the other bots
+        """
+        num_released = self.target_queue.release(bot.name)
+        print('+++++ ({}) Released profiles: {}'.format(bot.name, num_released))
+        if self.checkpoint is not None:
+            self.checkpoint.save_queue(self.target_queue)
+
+    @staticmethod
+    def flush_bot_events(bot):
+        """
+        Writes the pending events of a bot that stops or crashes, such as its last block
+        """
+        if not bot.event_register.flush():
+            print('+++++ ({}) Events not saved'.format(bot.name))
+
+    def end_bot_run(self, bot, liked_profiles, followed_profiles, time_start):
+        # The run ended: a resumed run starts the bot anew. After a crash, the progress is kept
+        if self.checkpoint is not None:
+            self.checkpoint.remove_progress(bot.name)
         print('+++++ ({}) Liked profiles: {}'.format(bot.name, len(liked_profiles)))
         print('+++++ ({}) Followed profiles: {}'.format(bot.name, len(followed_profiles)))
 
         print('+++++ ({}) CLOSE after {}'.format(bot.name, datetime.now() - time_start))
-        bot.close_session()
 
-        print('+++++ ({}) GOOD BYE'.format(bot.name))
+    def compact_events(self):
+        """
+        Rewrites the events file once all the bots end. Only the owner of the shared store
+        compacts it: the bots of an event store server leave it to the server
+        """
+        if not acid_rain.acid_rain_settings.use_global_database or not self.bots:
+            return
+        if self.bots[0].event_register.compact():
+            print('+++++ Events compacted')
 
+    def bot_thread_function(self, *args):
+        """
+        Runs a bot (see bot_run_function) and compacts the events after the last bot ends
+        """
+        try:
+            self.bot_run_function(*args)
+        finally:
+            with self.num_running_bots_lock:
+                self.num_running_bots -= 1
+                is_last = self.num_running_bots == 0
+            if is_last:
+                self.compact_events()
+
+    def bot_run_function(self, bot, probabilities=None, in_function=FUNCTION_ENGAGE,
+                         progress=None):
 
+        if probabilities is None:
+            probabilities = [0.80, 0.20]
+        time_start = datetime.now()
+
+        print('+++++ ({}) Start: {}'.format(bot.name, in_function.upper()))
+        try:
+            if in_function == FUNCTION_LIKE_FOLLOW:
+                liked_profiles, followed_profiles = bot.do_likes_and_follows(
+                    likes_targets=self.target_queue.iterate(bot.name, ACTION_LIKE),
+                    likes_max_run_hours=self.likes_max_run_hours,
+                    follow_targets=self.target_queue.iterate(bot.name, ACTION_FOLLOW),
+                    follow_max_run_hours=self.follows_max_run_hours)
+            elif in_function == FUNCTION_ENGAGE:
+                liked_profiles, followed_profiles = bot.engage(
+                    self.target_queue,
+                    run_time_hours=self.follows_max_run_hours + self.likes_max_run_hours,
+                    probabilities=probabilities, checkpoint=self.checkpoint, progress=progress,
+                    scheduler=self.scheduler)
+        finally:
+            self.release_bot_targets(bot)
+            self.flush_bot_events(bot)
+        self.end_bot_run(bot, liked_profiles, followed_profiles, time_start)
+        bot.close_session()
+
+        print('+++++ ({}) GOOD BYE'.format(bot.name))
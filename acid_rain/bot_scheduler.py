@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""File with the schedulers that sleep the bots until they can act, in threads or in asyncio"""
+
+__author__ = "Josep-Arnau Claret"
+__email__ = "joseparnau81@gmail.com"
+
+import asyncio
+from datetime import datetime
+import heapq
+import itertools
+import threading
+
+from acid_rain.bot_event_register import LABEL_BOT, add_event_listener, remove_event_listener
+
+
+class BotScheduler:
+    """
+    Class that sleeps the bots until a given time or until an event of the bot is added to a
+    register of the process, whichever is first. The wake up times are kept in a heap served by
+    a single thread, which sleeps until the earliest one
+    """
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        # (wake up time, sequence number, bot)
+        self.heap = []
+        self.sequence = itertools.count()
+        # Bot -> event set to wake it up
+        self.wake_events = {}
+        self.thread = None
+        self.closed = False
+        add_event_listener(self.on_events)
+
+    def run(self):
+        with self.condition:
+            while not self.closed:
+                now = datetime.now()
+                while len(self.heap) > 0 and self.heap[0][0] <= now:
+                    _, _, bot = heapq.heappop(self.heap)
+                    if bot in self.wake_events:
+                        self.wake_events[bot].set()
+                timeout = None if len(self.heap) == 0 \
+                    else (self.heap[0][0] - now).total_seconds()
+                self.condition.wait(timeout)
+
+    def sleep_until(self, in_bot, in_time) -> bool:
+        """
+        Sleeps a bot until a time or until it is woken up (see wake)
+
+        Params:
+            in_bot: str, name of the bot
+            in_time: datetime, time to wake up
+
+        Returns:
+            bool, whether the bot was woken up before the time
+        """
+        with self.condition:
+            if self.closed or in_time <= datetime.now():
+                return False
+            wake_event = self.wake_events.setdefault(in_bot, threading.Event())
+            wake_event.clear()
+            heapq.heappush(self.heap, (in_time, next(self.sequence), in_bot))
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, name='bot-scheduler',
+                                               daemon=True)
+                self.thread.start()
+            self.condition.notify()
+        wake_event.wait()
+        woken_up = datetime.now() < in_time
+        with self.condition:
+            # Drop the wake up time if the bot was woken up before it
+            heap = [entry for entry in self.heap if entry[2] != in_bot]
+            if len(heap) < len(self.heap):
+                self.heap = heap
+                heapq.heapify(self.heap)
+        return woken_up
+
+    def wake(self, in_bot):
+        """
+        Wakes up a bot if it is sleeping
+        """
+        with self.condition:
+            if in_bot in self.wake_events:
+                self.wake_events[in_bot].set()
+
+    def wake_all(self):
+        with self.condition:
+            for wake_event in self.wake_events.values():
+                wake_event.set()
+
+    def on_events(self, in_events):
+        """
+        Wakes up the bots of the events added to a register, so that they check again whether
+        they can act
+        """
+        for bot in {event[LABEL_BOT] for event in in_events}:
+            self.wake(bot)
+
+    def close(self):
+        """
+        Wakes up all the bots and stops the scheduler; sleeping is not possible afterwards
+        """
+        remove_event_listener(self.on_events)
+        with self.condition:
+            self.closed = True
+            self.condition.notify()
+        self.wake_all()
+        if self.thread is not None:
+            self.thread.join()
+
+
+class AsyncBotScheduler:
+    """
+    Class that sleeps the bots run in an asyncio event loop, like BotScheduler: until a given
+    time or until an event of the bot is added to a register of the process. The wake up times
+    are the timers of the event loop
+    """
+
+    def __init__(self, in_loop=None):
+        """
+        Params:
+            in_loop: AbstractEventLoop, loop of the bots; if None, the running loop
+        """
+        self.loop = asyncio.get_running_loop() if in_loop is None else in_loop
+        # Bot -> event set to wake it up
+        self.wake_events = {}
+        self.closed = False
+        add_event_listener(self.on_events)
+
+    async def sleep_until(self, in_bot, in_time) -> bool:
+        """
+        Sleeps a bot until a time or until it is woken up (see wake)
+
+        Returns:
+            bool, whether the bot was woken up before the time
+        """
+        timeout = (in_time - datetime.now()).total_seconds()
+        if self.closed or timeout <= 0:
+            return False
+        wake_event = self.wake_events.setdefault(in_bot, asyncio.Event())
+        wake_event.clear()
+        try:
+            await asyncio.wait_for(wake_event.wait(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        return True
+
+    def wake(self, in_bot):
+        """
+        Wakes up a bot if it is sleeping; it can be called from any thread
+        """
+        try:
+            in_loop = asyncio.get_running_loop() is self.loop
+        except RuntimeError:
+            in_loop = False
+        if in_bot in self.wake_events:
+            if in_loop:
+                self.wake_events[in_bot].set()
+            elif not self.loop.is_closed():
+                self.loop.call_soon_threadsafe(self.wake_events[in_bot].set)
+
+    def wake_all(self):
+        for bot in list(self.wake_events):
+            self.wake(bot)
+
+    def on_events(self, in_events):
+        """
+        Wakes up the bots of the events added to a register, so that they check again whether
+        they can act
+        """
+        for bot in {event[LABEL_BOT] for event in in_events}:
+            self.wake(bot)
+
+    def close(self):
+        """
+        Wakes up all the bots and stops the scheduler; sleeping is not possible afterwards
+        """
+        remove_event_listener(self.on_events)
+        self.closed = True
+        self.wake_all()
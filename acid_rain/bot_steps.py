@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""File with the drivers of the steps of the bots, in threads or in asyncio"""
+
+__author__ = "Josep-Arnau Claret"
+__email__ = "joseparnau81@gmail.com"
+
+import asyncio
+from functools import partial
+from time import sleep
+
+# The bot routines (e.g. InstaBot.like_steps) are generators that yield the steps that block:
+# - (STEP_WAIT, seconds): wait a duration
+# - (STEP_SLEEP_UNTIL, datetime): sleep in the scheduler until a time or until woken up; the
+#   generator is sent whether it was woken up
+# - (STEP_CALL, function, args): call a blocking function (e.g. Selenium); the generator is sent
+#   its result, or thrown its exception
+# - (STEP_IO, function, args): like STEP_CALL, for a function that blocks on disk or on the
+#   register locks (e.g. saving the events); in asyncio it runs in the default executor of the
+#   loop, so that it does not wait for the Selenium calls
+# and return their result. The drivers below run them in a thread or in an asyncio event loop
+STEP_WAIT = 'wait'
+STEP_SLEEP_UNTIL = 'sleep_until'
+STEP_CALL = 'call'
+STEP_IO = 'io'
+
+
+def run_steps(in_steps, in_bot=None, in_scheduler=None):
+    """
+    Runs the steps of a bot routine in the current thread
+
+    Params:
+        in_steps: generator, the steps
+        in_bot: str, name of the bot, to sleep in the scheduler
+        in_scheduler: BotScheduler, scheduler for the STEP_SLEEP_UNTIL steps
+
+    Returns:
+        the result of the routine
+    """
+    send, value = in_steps.send, None
+    while True:
+        try:
+            step = send(value)
+        except StopIteration as e:
+            return e.value
+        send = in_steps.send
+        try:
+            if step[0] == STEP_WAIT:
+                value = sleep(step[1])
+            elif step[0] == STEP_SLEEP_UNTIL:
+                value = in_scheduler.sleep_until(in_bot, step[1])
+            elif step[0] in (STEP_CALL, STEP_IO):
+                value = step[1](*step[2])
+        except Exception as e:  # pylint: disable=broad-except
+            send, value = in_steps.throw, e
+
+
+async def run_steps_async(in_steps, in_bot=None, in_scheduler=None, in_executor=None):
+    """
+    Runs the steps of a bot routine in the running asyncio event loop: the waits are asyncio
+    timers and the blocking calls run in executors, so that the loop never blocks
+
+    Params:
+        in_steps: generator, the steps
+        in_bot: str, name of the bot, to sleep in the scheduler
+        in_scheduler: AsyncBotScheduler, scheduler for the STEP_SLEEP_UNTIL steps
+        in_executor: Executor, executor of the STEP_CALL steps; if None, the loop default one
+
+    Returns:
+        the result of the routine
+    """
+    loop = asyncio.get_running_loop()
+    send, value = in_steps.send, None
+    while True:
+        try:
+            step = send(value)
+        except StopIteration as e:
+            return e.value
+        send = in_steps.send
+        try:
+            if step[0] == STEP_WAIT:
+                value = await asyncio.sleep(step[1])
+            elif step[0] == STEP_SLEEP_UNTIL:
+                value = await in_scheduler.sleep_until(in_bot, step[1])
+            elif step[0] == STEP_CALL:
+                value = await loop.run_in_executor(in_executor, partial(step[1], *step[2]))
+            elif step[0] == STEP_IO:
+                value = await loop.run_in_executor(None, partial(step[1], *step[2]))
+        except Exception as e:  # pylint: disable=broad-except
+            send, value = in_steps.throw, e
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""File with the binary columnar format of the bot events database"""
+
+__author__ = "Josep-Arnau Claret"
+__email__ = "joseparnau81@gmail.com"
+
+import os
+from pathlib import Path
+import shutil
+
+import numpy as np
+import pandas as pd
+
+from acid_rain.bot_event_register import BotEventRegister, ALL_LABELS, LABEL_TIMESTAMP, \
+    LABEL_BOT, LABEL_EVENT, LABEL_USERNAME, LABEL_NUM_LIKES, LABEL_COMMENTS
+
+COLUMN_INT64_NS = 'int64_ns'
+COLUMN_FLOAT64 = 'float64'
+COLUMN_CATEGORICAL = 'categorical'
+# Fixed schema: every label is stored as one or two .npy files in the events folder
+#   - int64_ns: '<label>.npy' with the nanoseconds since the epoch
+#   - float64: '<label>.npy' with the values, NaN if missing
+#   - categorical: '<label>.npy' with int32 codes (-1 if missing) and
+#                  '<label>_categories.npy' with the unicode categories
+COLUMNAR_SCHEMA = {
+    LABEL_TIMESTAMP: COLUMN_INT64_NS,
+    LABEL_BOT: COLUMN_CATEGORICAL,
+    LABEL_EVENT: COLUMN_CATEGORICAL,
+    LABEL_USERNAME: COLUMN_CATEGORICAL,
+    LABEL_NUM_LIKES: COLUMN_FLOAT64,
+    LABEL_COMMENTS: COLUMN_CATEGORICAL
+}
+CATEGORIES_SUFFIX = '_categories'
+NPY_SUFFIX = '.npy'
+
+
+def get_column_path(in_folder, in_label, in_suffix='') -> Path:
+    return Path(in_folder) / (in_label + in_suffix + NPY_SUFFIX)
+
+
+def write_columnar_events(in_database, in_path):
+    """
+    Writes the events in the columnar format, sorted by bot and timestamp so that the events of
+    each bot and day are runs of rows that are loaded without sorting or copying them (see
+    EventStore). The folder is replaced at once, so readers never see a partially written
+    database
+
+    Params:
+        in_database: DataFrame, the events
+        in_path: str, path of the events folder
+    """
+    path = Path(in_path)
+    tmp_path = path.with_name(path.name + '.tmp')
+    old_path = path.with_name(path.name + '.old')
+    for stale_path in (tmp_path, old_path):
+        if stale_path.exists():
+            shutil.rmtree(stale_path)
+    os.makedirs(tmp_path)
+
+    database = in_database.sort_values([LABEL_BOT, LABEL_TIMESTAMP], kind='stable')
+    for label, column_type in COLUMNAR_SCHEMA.items():
+        column = database[label]
+        if column_type == COLUMN_INT64_NS:
+            values = pd.to_datetime(column).to_numpy(dtype='datetime64[ns]').view(np.int64)
+            np.save(get_column_path(tmp_path, label), values)
+        elif column_type == COLUMN_FLOAT64:
+            np.save(get_column_path(tmp_path, label),
+                    column.to_numpy(dtype=np.float64, na_value=np.nan))
+        else:
+            categorical = pd.Categorical(column.astype(object).where(column.notna(), None))
+            categories = np.array(categorical.categories.astype(str), dtype=str)
+            np.save(get_column_path(tmp_path, label), categorical.codes.astype(np.int32))
+            np.save(get_column_path(tmp_path, label, CATEGORIES_SUFFIX), categories)
+
+    if path.exists():
+        os.rename(path, old_path)
+    os.rename(tmp_path, path)
+    if old_path.exists():
+        shutil.rmtree(old_path)
+
+
+def read_columnar_events(in_path, in_mmap_on=True) -> pd.DataFrame:
+    """
+    Reads the events of the columnar format
+
+    Params:
+        in_path: str, path of the events folder
+        in_mmap_on: bool, memory-map the numerical columns instead of reading them
+
+    Returns:
+        DataFrame, the events with datetime timestamps and categorical bot, event, username and
+        comments
+    """
+    mmap_mode = 'r' if in_mmap_on else None
+    columns = {}
+    for label, column_type in COLUMNAR_SCHEMA.items():
+        values = np.load(get_column_path(in_path, label), mmap_mode=mmap_mode)
+        if column_type == COLUMN_INT64_NS:
+            columns[label] = values.view('datetime64[ns]')
+        elif column_type == COLUMN_FLOAT64:
+            columns[label] = values
+        else:
+            categories = np.load(get_column_path(in_path, label, CATEGORIES_SUFFIX))
+            columns[label] = pd.Categorical.from_codes(values, categories=categories)
+    return pd.DataFrame(columns)
+
+
+def convert_csv_to_columnar(in_csv_path, in_columnar_path) -> int:
+    """
+    Copies the events of a csv register (and of its journal, if any) into the columnar format
+
+    Returns:
+        int, number of converted events
+    """
+    database = BotEventRegister.read_database(in_csv_path).get_database()
+    write_columnar_events(database, in_columnar_path)
+    return len(database)
+
+
+def convert_columnar_to_csv(in_columnar_path, in_csv_path) -> int:
+    """
+    Copies the events of a columnar register (and of its journal, if any) into a csv
+
+    Returns:
+        int, number of converted events
+    """
+    database = BotEventRegister.read_database(in_columnar_path).get_database()
+    database.to_csv(in_csv_path, index=False, columns=ALL_LABELS)
+    return len(database)
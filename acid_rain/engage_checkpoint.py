@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""File with the checkpoints of the engage progress of the bots"""
+
+__author__ = "Josep-Arnau Claret"
+__email__ = "joseparnau81@gmail.com"
+
+import json
+import os
+from pathlib import Path
+import threading
+
+from acid_rain.target_queue import TargetQueue, DEFAULT_BATCH_SIZE
+
+TARGETS_FILE_NAME = 'targets.json'
+QUEUE_FILE_NAME = 'queue.json'
+PROGRESS_SUFFIX = '.progress.json'
+PROFILES_SUFFIX = '.profiles.jsonl'
+
+KEY_ACTIONS_COUNT = 'actions_count'
+KEY_PROFILES = 'profiles'
+KEY_ELAPSED_S = 'elapsed_s'
+
+
+def sync_directory(in_path):
+    """
+    Syncs a directory to disk, so that the files renamed in it survive a power loss.
+    Directories cannot be opened on some platforms (e.g. Windows), where it does nothing
+    """
+    try:
+        fd = os.open(in_path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def write_json_atomically(in_path, in_data) -> bool:
+    """
+    Writes data as JSON to a temporary file and replaces the file with it, so that readers find
+    either the previous or the new content, even if the process crashes while writing.
+    The file and its directory are synced to disk before returning
+    """
+    tmp_path = str(in_path) + '.tmp'
+    try:
+        with open(tmp_path, 'w') as file:
+            json.dump(in_data, file)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp_path, in_path)
+        sync_directory(os.path.dirname(os.path.abspath(in_path)))
+    except OSError as e:
+        print('Checkpoint write failed: {}'.format(e))
+        return False
+    return True
+
+
+def read_json(in_path):
+    """
+    Returns the data of a JSON file, None if it does not exist or is not valid
+    """
+    try:
+        with open(in_path) as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return None
+
+
+class EngageCheckpoint:
+    """
+    Class that persists the engage progress of the bots, so that a run that crashes is resumed
+    where it stopped. The folder keeps:
+    - 'targets.json': the targets of the run, written once at launch
+    - 'queue.json': the state of the target queue (see TargetQueue.get_state)
+    - '<bot>.progress.json': the elapsed run time of each bot
+    - '<bot>.profiles.jsonl': the profiles processed by each bot, one action and profile per line
+    The state files are small and are replaced after each action of a bot, while the processed
+    profiles are appended, so that each action writes the same amount whatever the length of the
+    run
+    """
+
+    def __init__(self, in_folder):
+        """
+        Params:
+            in_folder: str, folder of the checkpoint files, created if it does not exist
+        """
+        self.folder = Path(in_folder)
+        self.folder.mkdir(parents=True, exist_ok=True)
+        self.lock = threading.Lock()
+
+    def get_progress_path(self, in_bot) -> Path:
+        return self.folder / (in_bot + PROGRESS_SUFFIX)
+
+    def get_profiles_path(self, in_bot) -> Path:
+        return self.folder / (in_bot + PROFILES_SUFFIX)
+
+    def save_targets(self, in_target_queue) -> bool:
+        """
+        Starts a new checkpoint with the targets and the state of a queue; the progress of the
+        bots of the previous one is removed
+        """
+        with self.lock:
+            for suffix in (PROGRESS_SUFFIX, PROFILES_SUFFIX):
+                for path in self.folder.glob('*' + suffix):
+                    path.unlink()
+            return write_json_atomically(self.folder / TARGETS_FILE_NAME, in_target_queue.targets) \
+                and write_json_atomically(self.folder / QUEUE_FILE_NAME,
+                                          in_target_queue.get_state())
+
+    def save_queue(self, in_target_queue) -> bool:
+        with self.lock:
+            return write_json_atomically(self.folder / QUEUE_FILE_NAME,
+                                         in_target_queue.get_state())
+
+    def add_profile(self, in_bot, in_action, in_profile) -> bool:
+        """
+        Appends a profile processed by a bot to its log
+
+        Params:
+            in_bot: str, name of the bot
+            in_action: str, the action done on the profile
+            in_profile: the processed profile, as returned by the action
+
+        Returns:
+            bool, whether the profile was written
+        """
+        try:
+            with open(self.get_profiles_path(in_bot), 'a') as file:
+                # The line starts with the new line, so that it does not follow a line cut by a
+                # crash
+                file.write('\n' + json.dumps([in_action, in_profile]))
+        except OSError as e:
+            print('Checkpoint write failed: {}'.format(e))
+            return False
+        return True
+
+    def save(self, in_bot, in_elapsed_s, in_target_queue) -> bool:
+        """
+        Saves the elapsed run time of a bot and the state of the queue it takes its targets from.
+        The processed profiles are saved as they are processed (see add_profile)
+
+        Params:
+            in_bot: str, name of the bot
+            in_elapsed_s: float, elapsed run time in seconds
+            in_target_queue: TargetQueue, the queue
+
+        Returns:
+            bool, whether the checkpoint was written
+        """
+        with self.lock:
+            return write_json_atomically(self.folder / QUEUE_FILE_NAME,
+                                         in_target_queue.get_state()) \
+                and write_json_atomically(self.get_progress_path(in_bot),
+                                          {KEY_ELAPSED_S: in_elapsed_s})
+
+    def load_target_queue(self, in_batch_size=DEFAULT_BATCH_SIZE):
+        """
+        Returns the target queue of the checkpoint, in its last saved state, None if there is no
+        checkpoint
+        """
+        targets = read_json(self.folder / TARGETS_FILE_NAME)
+        state = read_json(self.folder / QUEUE_FILE_NAME)
+        if targets is None or state is None:
+            return None
+        target_queue = TargetQueue(targets, in_batch_size)
+        target_queue.set_state(state)
+        return target_queue
+
+    def load_profiles(self, in_bot) -> dict:
+        """
+        Returns the profiles processed by a bot, per action, in the order they were processed.
+        A line cut by a crash while it was written is skipped
+        """
+        profiles = {}
+        try:
+            with open(self.get_profiles_path(in_bot)) as file:
+                for line in file:
+                    if len(line.strip()) == 0:
+                        continue
+                    try:
+                        action, profile = json.loads(line)
+                    except ValueError:
+                        continue
+                    profiles.setdefault(action, []).append(profile)
+        except OSError:
+            pass
+        return profiles
+
+    def load_progress(self, in_bot):
+        """
+        Returns the last saved progress of a bot, None if there is none
+
+        Returns:
+            dict or None, actions count (KEY_ACTIONS_COUNT) and processed profiles (KEY_PROFILES)
+            of each action, and elapsed run time in seconds (KEY_ELAPSED_S)
+        """
+        progress = read_json(self.get_progress_path(in_bot))
+        profiles = self.load_profiles(in_bot)
+        if progress is None and len(profiles) == 0:
+            return None
+        return {KEY_ACTIONS_COUNT: {action: len(action_profiles)
+                                   for action, action_profiles in profiles.items()},
+                KEY_PROFILES: profiles,
+                KEY_ELAPSED_S: 0. if progress is None else progress[KEY_ELAPSED_S]}
+
+    def remove_progress(self, in_bot):
+        """
+        Removes the progress of a bot, e.g. when its run ends
+        """
+        with self.lock:
+            for path in (self.get_progress_path(in_bot), self.get_profiles_path(in_bot)):
+                if path.is_file():
+                    path.unlink()
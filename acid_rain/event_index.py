@@ -0,0 +1,524 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""File with the time indexes, rolling counters, rollups and query cache of the bot events"""
+
+__author__ = "Josep-Arnau Claret"
+__email__ = "joseparnau81@gmail.com"
+
+from bisect import bisect_left, bisect_right
+from collections import deque
+import datetime
+import threading
+
+import numpy as np
+
+QUERY_CACHE_MAX_ENTRIES_PER_BOT = 256
+
+
+def get_period_start(in_timestamp, in_period) -> datetime.datetime:
+    """
+    Returns the start of the period of a timestamp, periods starting at midnight
+    """
+    return in_timestamp - (in_timestamp - datetime.datetime.min) % in_period
+
+
+def search_sorted(in_values, in_value, in_length, in_right=False) -> int:
+    """
+    Returns the position of a value in the first 'in_length' sorted values, before any equal
+    ones (or after them if 'in_right'). The values are a list, or a numpy array, with datetime64
+    values for timestamps, that is searched without converting it to Python objects
+    """
+    if isinstance(in_values, np.ndarray):
+        if isinstance(in_value, datetime.datetime):
+            in_value = np.datetime64(in_value, 'ns')
+        return int(np.searchsorted(in_values[:in_length], in_value,
+                                   'right' if in_right else 'left'))
+    if in_right:
+        return bisect_right(in_values, in_value, 0, in_length)
+    return bisect_left(in_values, in_value, 0, in_length)
+
+
+def to_python(in_value):
+    """
+    Returns an element of a list or of a numpy array as a Python object (datetime or number)
+    """
+    if isinstance(in_value, np.datetime64):
+        return in_value.astype('datetime64[us]').item()
+    if isinstance(in_value, np.generic):
+        return in_value.item()
+    return in_value
+
+
+class EventTimeIndex:
+    """
+    Class that keeps the timestamps of a series of events sorted, together with the prefix sums of
+    a value associated to each event (e.g. the number of likes), so that window queries are
+    O(log n) bisections.
+    Readers do not need a lock: writers publish the lists and their length in 'version', and
+    in-order events are only appended beyond the published length while any other change
+    replaces the lists, so a reader always sees a consistent version.
+    The events of a loaded file are kept in numpy arrays (see from_sorted), which are converted
+    to lists when an event is added, so only the index of the current day is ever converted.
+    Writers must be serialized
+    """
+
+    def __init__(self):
+        self.timestamps = []
+        # cumulative[i] is the sum of the values of all the events before timestamps[i],
+        # including the removed ones; only differences between elements are meaningful
+        self.cumulative = [0]
+        self.version = (self.timestamps, self.cumulative, 0)
+
+    def __len__(self):
+        return self.version[2]
+
+    def publish(self):
+        self.version = (self.timestamps, self.cumulative, len(self.timestamps))
+
+    @classmethod
+    def from_sorted(cls, in_timestamps, in_cumulative):
+        """
+        Returns the index of events already sorted by timestamp, e.g. sorted and summed with
+        vectorized operations when the events are loaded, instead of adding them one by one
+
+        Params:
+            in_timestamps: list or datetime64 array, timestamps of the events in increasing order
+            in_cumulative: list or array, prefix sums of the values of the events, with one more
+                           element than the timestamps
+        """
+        time_index = cls()
+        time_index.timestamps = in_timestamps
+        time_index.cumulative = in_cumulative
+        time_index.publish()
+        return time_index
+
+    def get_values(self) -> list:
+        """
+        Returns the values of the events, in increasing order of timestamp
+        """
+        _, cumulative, length = self.version
+        if isinstance(cumulative, np.ndarray):
+            return np.diff(cumulative[:length + 1]).tolist()
+        return [value_1 - value_0 for value_0, value_1 in zip(cumulative[:length],
+                                                              cumulative[1:length + 1])]
+
+    def add(self, in_timestamp, in_value=0):
+        """
+        Adds an event. O(1) when the timestamp is not older than the last one, O(n) otherwise
+
+        Params:
+            in_timestamp: datetime, timestamp of the event
+            in_value: number, value of the event
+        """
+        if isinstance(self.timestamps, np.ndarray):
+            self.timestamps = self.timestamps.astype('datetime64[us]').tolist()
+            self.cumulative = self.cumulative.tolist()
+        if len(self.timestamps) == 0 or in_timestamp >= self.timestamps[-1]:
+            self.timestamps.append(in_timestamp)
+            self.cumulative.append(self.cumulative[-1] + in_value)
+        else:
+            position = bisect_right(self.timestamps, in_timestamp)
+            timestamps = self.timestamps[:position] + [in_timestamp] + self.timestamps[position:]
+            cumulative = self.cumulative[:position + 1] + \
+                [value + in_value for value in self.cumulative[position:]]
+            self.timestamps, self.cumulative = timestamps, cumulative
+        self.publish()
+
+    def count_since(self, in_timestamp) -> int:
+        """
+        Returns the number of events with timestamp >= 'in_timestamp'
+        """
+        timestamps, _, length = self.version
+        return length - search_sorted(timestamps, in_timestamp, length)
+
+    def sum_since(self, in_timestamp):
+        """
+        Returns the sum of the values of the events with timestamp >= 'in_timestamp'
+        """
+        timestamps, cumulative, length = self.version
+        position = search_sorted(timestamps, in_timestamp, length)
+        return to_python(cumulative[length] - cumulative[position])
+
+    def get_total(self):
+        """
+        Returns the sum of the values of all the events
+        """
+        _, cumulative, length = self.version
+        return to_python(cumulative[length] - cumulative[0])
+
+    def last_timestamp_with_sum_above(self, in_value):
+        """
+        Returns the timestamp of the last event such that the sum of the values of it and of the
+        events after it is > 'in_value', by bisecting the prefix sums. The values must not be
+        negative. None if there is no such event
+        """
+        timestamps, cumulative, length = self.version
+        # Last position whose prefix sum is < cumulative[length] - in_value
+        position = search_sorted(cumulative, cumulative[length] - in_value, length) - 1
+        return to_python(timestamps[position]) if position >= 0 else None
+
+    def last_timestamp_with_count_above(self, in_count):
+        """
+        Returns the timestamp of the last event such that the number of it and of the events
+        after it is > 'in_count'. None if there is no such event
+        """
+        timestamps, _, length = self.version
+        position = length - in_count - 1
+        return to_python(timestamps[position]) if position >= 0 else None
+
+    def last_timestamp(self, in_timestamp=None):
+        """
+        Returns the last timestamp <= 'in_timestamp', or the last one if 'in_timestamp' is None.
+        None if there is no such timestamp
+        """
+        timestamps, _, length = self.version
+        if in_timestamp is None:
+            return to_python(timestamps[length - 1]) if length > 0 else None
+        position = search_sorted(timestamps, in_timestamp, length, in_right=True)
+        return to_python(timestamps[position - 1]) if position > 0 else None
+
+    def remove_before(self, in_timestamp) -> int:
+        """
+        Removes the events with timestamp < 'in_timestamp'
+
+        Returns:
+            int, number of events removed
+        """
+        position = search_sorted(self.timestamps, in_timestamp, len(self.timestamps))
+        if position > 0:
+            self.timestamps = self.timestamps[position:]
+            self.cumulative = self.cumulative[position:]
+            self.publish()
+        return position
+
+
+class RollingCounter:
+    """
+    Class that keeps the number of events and the sum of their values over a sliding time window
+    ending now. Events are expired lazily when the counter is read, so reads are amortized O(1).
+    The loaded events are kept in numpy arrays (see extend), ahead of the events added later.
+    Since reads modify the counter, it has its own lock so that it can be read concurrently
+    """
+
+    def __init__(self, in_window):
+        """
+        Params:
+            in_window: timedelta, duration of the window
+        """
+        self.window = in_window
+        self.lock = threading.Lock()
+        self.events = deque()
+        # Loaded events: datetime64 timestamps, prefix sums of their values and the position of
+        # the first one not expired
+        self.loaded_timestamps = None
+        self.loaded_cumulative = None
+        self.loaded_start = 0
+        self.count = 0
+        self.total = 0
+
+    def add(self, in_timestamp, in_value=0):
+        """
+        Adds an event. O(1) when the timestamp is not older than the last one
+
+        Params:
+            in_timestamp: datetime, timestamp of the event
+            in_value: number, value of the event
+        """
+        with self.lock:
+            if len(self.events) == 0 or in_timestamp >= self.events[-1][0]:
+                self.events.append((in_timestamp, in_value))
+            else:
+                position = len(self.events)
+                while position > 0 and self.events[position - 1][0] > in_timestamp:
+                    position -= 1
+                self.events.insert(position, (in_timestamp, in_value))
+            self.count += 1
+            self.total += in_value
+
+    def extend(self, in_timestamps, in_values):
+        """
+        Adds several events in increasing order of timestamp, none older than the last one.
+        The events of numpy arrays given to an empty counter are kept as arrays
+
+        Params:
+            in_timestamps: list or datetime64 array, timestamps of the events
+            in_values: list or array, values of the events
+        """
+        with self.lock:
+            if isinstance(in_timestamps, np.ndarray):
+                if len(self.events) == 0 and self.loaded_timestamps is None:
+                    self.loaded_timestamps = in_timestamps
+                    self.loaded_cumulative = np.concatenate(([0], np.cumsum(in_values)))
+                    self.loaded_start = 0
+                    self.count += len(in_timestamps)
+                    self.total += to_python(self.loaded_cumulative[-1])
+                    return
+                in_timestamps = in_timestamps.astype('datetime64[us]').tolist()
+                in_values = np.asarray(in_values).tolist()
+            self.events.extend(zip(in_timestamps, in_values))
+            self.count += len(in_timestamps)
+            self.total += sum(in_values)
+
+    def expire(self, in_timestamp) -> int:
+        """
+        Removes the events with timestamp < 'in_timestamp'
+
+        Returns:
+            int, number of events removed
+        """
+        with self.lock:
+            return self.remove_older_than(in_timestamp)
+
+    def remove_older_than(self, in_timestamp) -> int:
+        """
+        Removes the events with timestamp < 'in_timestamp'. The lock must be held
+
+        Returns:
+            int, number of events removed
+        """
+        num_expired = 0
+        if self.loaded_timestamps is not None:
+            position = search_sorted(self.loaded_timestamps, in_timestamp,
+                                     len(self.loaded_timestamps))
+            if position > self.loaded_start:
+                num_expired = position - self.loaded_start
+                self.count -= num_expired
+                self.total -= to_python(self.loaded_cumulative[position] -
+                                        self.loaded_cumulative[self.loaded_start])
+                self.loaded_start = position
+            if self.loaded_start == len(self.loaded_timestamps):
+                self.loaded_timestamps = None
+                self.loaded_cumulative = None
+                self.loaded_start = 0
+        while len(self.events) > 0 and self.events[0][0] < in_timestamp:
+            _, value = self.events.popleft()
+            self.count -= 1
+            self.total -= value
+            num_expired += 1
+        return num_expired
+
+    def get_count(self, in_now) -> int:
+        """
+        Returns the number of events in the window ending at 'in_now'
+        """
+        with self.lock:
+            self.remove_older_than(in_now - self.window)
+            return self.count
+
+    def get_total(self, in_now):
+        """
+        Returns the sum of the values of the events in the window ending at 'in_now'
+        """
+        with self.lock:
+            self.remove_older_than(in_now - self.window)
+            return self.total
+
+
+class EventRollup:
+    """
+    Class that keeps the number of events and the sum of their values in consecutive periods
+    (e.g. hours or days) starting at midnight, updated as events are added, so that aggregated
+    series are read without scanning the events.
+    It has its own lock so that it can be read while it is written
+    """
+
+    def __init__(self, in_period):
+        """
+        Params:
+            in_period: timedelta, duration of the periods; a day must be a multiple of it
+        """
+        self.period = in_period
+        self.lock = threading.Lock()
+        # Start of each period with events -> [number of events, sum of values]
+        self.bucket_dict = {}
+        # Periods added at once and not merged into the dict yet (see extend)
+        self.unmerged = None
+
+    def __len__(self):
+        with self.lock:
+            return len(self.buckets)
+
+    @property
+    def buckets(self) -> dict:
+        """
+        The periods with events, with the periods added at once merged. The lock must be held
+        """
+        self.merge_periods()
+        return self.bucket_dict
+
+    def merge_periods(self):
+        """
+        Merges the periods added at once (see extend) into the dict. The lock must be held
+        """
+        if self.unmerged is None:
+            return
+        bucket_starts, counts, values = self.unmerged
+        self.unmerged = None
+        for bucket_start, count, value in zip(bucket_starts.astype('datetime64[us]').tolist(),
+                                              counts.tolist(), values.tolist()):
+            bucket = self.bucket_dict.get(bucket_start)
+            if bucket is None:
+                self.bucket_dict[bucket_start] = [count, value]
+            else:
+                bucket[0] += count
+                bucket[1] += value
+
+    def get_bucket_start(self, in_timestamp) -> datetime.datetime:
+        """
+        Returns the start of the period of a timestamp
+        """
+        return get_period_start(in_timestamp, self.period)
+
+    def add(self, in_timestamp, in_value=0, in_count=1):
+        """
+        Adds events to the period of a timestamp
+
+        Params:
+            in_timestamp: datetime, timestamp of the events
+            in_value: number, sum of the values of the events
+            in_count: int, number of events
+        """
+        bucket_start = self.get_bucket_start(in_timestamp)
+        with self.lock:
+            bucket = self.buckets.get(bucket_start)
+            if bucket is None:
+                self.buckets[bucket_start] = [in_count, in_value]
+            else:
+                bucket[0] += in_count
+                bucket[1] += in_value
+
+    def extend(self, in_bucket_starts, in_counts, in_values):
+        """
+        Adds the events of several periods at once, e.g. of the loaded events. They are kept as
+        arrays until the rollup is used, so loading does not convert them to Python objects
+
+        Params:
+            in_bucket_starts: datetime64 array, starts of the periods
+            in_counts: array, number of events of each period
+            in_values: array, sum of the values of the events of each period
+        """
+        with self.lock:
+            self.merge_periods()
+            self.unmerged = (in_bucket_starts, in_counts, in_values)
+
+    def set_bucket(self, in_bucket_start, in_count, in_value):
+        """
+        Sets the number of events and the sum of their values of a period; drops it if it has
+        no events
+        """
+        with self.lock:
+            if in_count == 0:
+                self.buckets.pop(in_bucket_start, None)
+            else:
+                self.buckets[in_bucket_start] = [in_count, in_value]
+
+    def remove_before(self, in_timestamp) -> int:
+        """
+        Drops the periods that end before the period of the timestamp. The period of the
+        timestamp itself must be recomputed with set_bucket
+
+        Returns:
+            int, number of periods dropped
+        """
+        first_bucket_start = self.get_bucket_start(in_timestamp)
+        with self.lock:
+            old_bucket_starts = [bucket_start for bucket_start in self.buckets
+                                 if bucket_start < first_bucket_start]
+            for bucket_start in old_bucket_starts:
+                del self.buckets[bucket_start]
+        return len(old_bucket_starts)
+
+    def get_buckets(self, in_start=None, in_end=None) -> dict:
+        """
+        Returns the periods with events that start in ['in_start', 'in_end'), 'in_start'
+        rounded down to the start of its period; all of them if both are None
+
+        Returns:
+            dict, start of each period -> (number of events, sum of values)
+        """
+        first_bucket_start = None if in_start is None else self.get_bucket_start(in_start)
+        with self.lock:
+            return {bucket_start: tuple(bucket) for bucket_start, bucket in self.buckets.items()
+                    if (first_bucket_start is None or bucket_start >= first_bucket_start)
+                    and (in_end is None or bucket_start < in_end)}
+
+
+class QueryCache:
+    """
+    Class that memoizes the results of the queries of each bot until the events of the bot change.
+    Keys must identify the query and its arguments, so every key is cached for one bot (or for
+    all bots, with bot None). Invalidating a bot also invalidates the queries of all bots.
+    A result computed while the bot was being invalidated is not cached
+    """
+
+    def __init__(self, in_max_entries_per_bot=QUERY_CACHE_MAX_ENTRIES_PER_BOT):
+        """
+        Params:
+            in_max_entries_per_bot: int, entries kept per bot; the entries of a bot are cleared
+                                    when they exceed it
+        """
+        self.max_entries_per_bot = in_max_entries_per_bot
+        self.lock = threading.Lock()
+        self.entries = {}
+        # A result is only cached if the generation of its bot and the epoch did not change
+        # while it was computed
+        self.generations = {}
+        self.epoch = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, in_bot, in_key, in_compute):
+        """
+        Returns the cached result of a query, computing it on a miss
+
+        Params:
+            in_bot: str, name of the bot of the query, None if it spans all bots
+            in_key: hashable, the query and its arguments
+            in_compute: callable without arguments that returns the result of the query
+
+        Returns:
+            the result of the query
+        """
+        with self.lock:
+            bot_entries = self.entries.get(in_bot)
+            if bot_entries is not None and in_key in bot_entries:
+                self.hits += 1
+                return bot_entries[in_key]
+            self.misses += 1
+            token = (self.epoch, self.generations.get(in_bot, 0))
+
+        result = in_compute()
+
+        with self.lock:
+            if token == (self.epoch, self.generations.get(in_bot, 0)):
+                bot_entries = self.entries.setdefault(in_bot, {})
+                if len(bot_entries) >= self.max_entries_per_bot:
+                    bot_entries.clear()
+                bot_entries[in_key] = result
+        return result
+
+    def invalidate(self, in_bot=None):
+        """
+        Drops the cached queries of a bot and of all bots, or every cached query if 'in_bot' is
+        None. Call it after the events change
+        """
+        with self.lock:
+            if in_bot is None:
+                self.epoch += 1
+                self.entries = {}
+                return
+            for bot in (in_bot, None):
+                self.generations[bot] = self.generations.get(bot, 0) + 1
+                self.entries.pop(bot, None)
+
+    def get_statistics(self) -> dict:
+        """
+        Returns the number of hits and misses
+        """
+        with self.lock:
+            return {'hits': self.hits, 'misses': self.misses}
+
+    def reset_statistics(self):
+        with self.lock:
+            self.hits = 0
+            self.misses = 0
@@ -0,0 +1,329 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""File with a local server that shares a bot event register between processes, and its clients"""
+
+__author__ = "Josep-Arnau Claret"
+__email__ = "joseparnau81@gmail.com"
+
+import datetime
+import json
+import math
+import os
+import socket
+import socketserver
+import threading
+
+import numpy as np
+import pandas as pd
+
+TCP_PREFIX = 'tcp://'
+UNIX_PREFIX = 'unix://'
+
+KEY_METHOD = 'method'
+KEY_ARGS = 'args'
+KEY_KWARGS = 'kwargs'
+KEY_RESULT = 'result'
+KEY_ERROR = 'error'
+KEY_DATETIME = '__datetime__'
+KEY_TIMEDELTA = '__timedelta__'
+KEY_DATAFRAME = '__dataframe__'
+KEY_SERIES = '__series__'
+
+# Methods of BotEventRegister that clients can call. Compacting is left to the server
+REMOTE_METHODS = [
+    'add_event', 'add_events', 'save', 'flush', 'remove_events_before',
+    'get_number_of_events', 'get_event_timestamp', 'get_last_block_timestamp',
+    'get_number_of_follows_since', 'get_number_of_likes_since', 'get_number_of_follows_in_last',
+    'get_number_of_likes_in_last', 'get_first_timestamp_with_more_than_cumulative_likes',
+    'get_first_timestamp_with_more_than_cumulative_follows', 'get_rollup', 'get_memory_report',
+    'get_query_cache_statistics']
+# Methods that clients call without arguments: the server saves its register to its own file only
+REMOTE_METHODS_WITHOUT_ARGS = ['save', 'flush']
+
+
+def is_remote_address(in_path) -> bool:
+    return str(in_path).startswith((TCP_PREFIX, UNIX_PREFIX))
+
+
+def parse_address(in_address):
+    """
+    Returns the socket family and address of 'tcp://host:port' or 'unix:///path/to/socket'
+    """
+    address = str(in_address)
+    if address.startswith(UNIX_PREFIX):
+        return socket.AF_UNIX, address[len(UNIX_PREFIX):]
+    host, port = address[len(TCP_PREFIX):].rsplit(':', 1)
+    return socket.AF_INET, (host, int(port))
+
+
+def encode_value(in_value):
+    """
+    JSON encoder of the values that json does not support
+    """
+    if isinstance(in_value, datetime.datetime):
+        return {KEY_DATETIME: in_value.isoformat()}
+    if isinstance(in_value, datetime.timedelta):
+        return {KEY_TIMEDELTA: in_value.total_seconds()}
+    if isinstance(in_value, np.generic):
+        return in_value.item()
+    if isinstance(in_value, pd.DataFrame):
+        return {KEY_DATAFRAME: dict(in_value.to_dict(orient='split'),
+                                    index_name=in_value.index.name)}
+    if isinstance(in_value, pd.Series):
+        return {KEY_SERIES: {'index': in_value.index.tolist(), 'data': in_value.tolist(),
+                             'name': in_value.name}}
+    raise TypeError('Cannot encode {}'.format(type(in_value).__name__))
+
+
+def decode_value(in_dict):
+    """
+    JSON object hook that reverses encode_value
+    """
+    if KEY_DATETIME in in_dict:
+        return datetime.datetime.fromisoformat(in_dict[KEY_DATETIME])
+    if KEY_TIMEDELTA in in_dict:
+        return datetime.timedelta(seconds=in_dict[KEY_TIMEDELTA])
+    if KEY_DATAFRAME in in_dict:
+        frame = in_dict[KEY_DATAFRAME]
+        return pd.DataFrame(frame['data'], columns=frame['columns'],
+                            index=pd.Index(frame['index'], name=frame['index_name']))
+    if KEY_SERIES in in_dict:
+        series = in_dict[KEY_SERIES]
+        return pd.Series(series['data'], index=series['index'], name=series['name'])
+    return in_dict
+
+
+def encode_message(in_message) -> bytes:
+    return (json.dumps(in_message, default=encode_value) + '\n').encode()
+
+
+def decode_message(in_line) -> dict:
+    return json.loads(in_line, object_hook=decode_value)
+
+
+def handle_request(in_register, in_line) -> bytes:
+    """
+    Runs a request on a register
+
+    Params:
+        in_register: BotEventRegister, the register
+        in_line: bytes, the encoded request
+
+    Returns:
+        bytes, the encoded response
+    """
+    try:
+        request = decode_message(in_line)
+        method = request[KEY_METHOD]
+        if method not in REMOTE_METHODS:
+            return encode_message({KEY_ERROR: 'Unknown method: {}'.format(method)})
+        if method in REMOTE_METHODS_WITHOUT_ARGS and \
+                (len(request.get(KEY_ARGS, [])) > 0 or len(request.get(KEY_KWARGS, {})) > 0):
+            return encode_message({KEY_ERROR: '{} takes no arguments'.format(method)})
+        result = getattr(in_register, method)(*request.get(KEY_ARGS, []),
+                                               **request.get(KEY_KWARGS, {}))
+        if isinstance(result, float) and math.isnan(result):
+            result = None
+        return encode_message({KEY_RESULT: result})
+    except Exception as e:  # pylint: disable=broad-except
+        return encode_message({KEY_ERROR: '{}: {}'.format(type(e).__name__, e)})
+
+
+class EventStoreRequestHandler(socketserver.StreamRequestHandler):
+    """
+    Serves the requests of a client connection, one per line, until it is closed
+    """
+
+    def setup(self):
+        super().setup()
+        if self.server.address_family == socket.AF_INET:
+            self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def handle(self):
+        for line in self.rfile:
+            self.wfile.write(handle_request(self.server.register, line))
+            self.wfile.flush()
+
+
+class EventStoreServer:
+    """
+    Class that serves a register to the bots of other processes through a local socket, with one
+    thread per client connection. Requests and responses are JSON lines
+    """
+
+    def __init__(self, in_register, in_address):
+        """
+        Params:
+            in_register: BotEventRegister, the register to serve
+            in_address: str, 'tcp://host:port' or 'unix:///path/to/socket';
+                        port 0 picks a free port (see 'address')
+        """
+        family, address = parse_address(in_address)
+        if family == socket.AF_UNIX:
+            if os.path.exists(address):
+                os.remove(address)
+            self.server = socketserver.ThreadingUnixStreamServer(address, EventStoreRequestHandler)
+            self.address = UNIX_PREFIX + address
+        else:
+            self.server = socketserver.ThreadingTCPServer(address, EventStoreRequestHandler)
+            host, port = self.server.server_address[:2]
+            self.address = '{}{}:{}'.format(TCP_PREFIX, host, port)
+        self.server.daemon_threads = True
+        self.server.register = in_register
+        self.thread = None
+
+    def serve_forever(self):
+        self.server.serve_forever()
+
+    def start(self):
+        """
+        Serves in a background thread
+        """
+        self.thread = threading.Thread(target=self.serve_forever, name='event-store-server',
+                                       daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+        if self.thread is not None:
+            self.thread.join()
+        family, address = parse_address(self.address)
+        if family == socket.AF_UNIX and os.path.exists(address):
+            os.remove(address)
+
+
+class RegisterClient:
+    """
+    Base class of the clients of a served register: the methods in REMOTE_METHODS are forwarded
+    with the same arguments and results as BotEventRegister
+    """
+
+    def __getattr__(self, in_name):
+        if in_name not in REMOTE_METHODS:
+            raise AttributeError(in_name)
+
+        def remote_method(*args, **kwargs):
+            return self.call(in_name, *args, **kwargs)
+        return remote_method
+
+    def send(self, in_line) -> bytes:
+        raise NotImplementedError
+
+    def call(self, in_method, *args, **kwargs):
+        """
+        Calls a method of the register
+
+        Raises:
+            RuntimeError, if the method failed in the server
+        """
+        response = decode_message(self.send(encode_message(
+            {KEY_METHOD: in_method, KEY_ARGS: list(args), KEY_KWARGS: kwargs})))
+        if KEY_ERROR in response:
+            raise RuntimeError('{} failed in the event store server: {}'
+                               .format(in_method, response[KEY_ERROR]))
+        return response[KEY_RESULT]
+
+    def close(self) -> bool:
+        return True
+
+
+class RemoteBotEventRegister(RegisterClient):
+    """
+    Client of an EventStoreServer. Each thread keeps its own connection open
+    """
+
+    def __init__(self, in_address):
+        """
+        Params:
+            in_address: str, 'tcp://host:port' or 'unix:///path/to/socket'
+        """
+        self.address = in_address
+        self.local = threading.local()
+        self.connections = []
+        self.connections_lock = threading.Lock()
+
+    def connect(self):
+        family, address = parse_address(self.address)
+        connection = socket.socket(family, socket.SOCK_STREAM)
+        connection.connect(address)
+        if family == socket.AF_INET:
+            connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.local.connection = connection
+        self.local.rfile = connection.makefile('rb')
+        with self.connections_lock:
+            self.connections.append(connection)
+
+    def send(self, in_line) -> bytes:
+        if getattr(self.local, 'connection', None) is None:
+            self.connect()
+        self.local.connection.sendall(in_line)
+        line = self.local.rfile.readline()
+        if len(line) == 0:
+            self.local.connection = None
+            raise ConnectionError('The event store server closed the connection')
+        return line
+
+    def add_event(self, in_bot, in_event_name, in_username=None, in_num_likes=None,
+                  in_comments=None, in_timestamp=None) -> bool:
+        """
+        Adds an event to the served register (see BotEventRegister.add_event).
+        The listeners of the server process are notified there, so the event is also notified to
+        the listeners of this process, e.g. to wake up its bot from a BotScheduler
+        """
+        timestamp = datetime.datetime.now() if in_timestamp is None else in_timestamp
+        if not self.call('add_event', in_bot, in_event_name, in_username, in_num_likes,
+                         in_comments, timestamp):
+            return False
+        # Imported here since bot_event_register imports this module
+        from acid_rain.bot_event_register import BotEventRegister, notify_event_listeners
+        notify_event_listeners([BotEventRegister.make_event_data(
+            in_bot, in_event_name, in_username, in_num_likes, in_comments, timestamp)])
+        return True
+
+    def add_events(self, in_events) -> bool:
+        """
+        Adds several events to the served register (see BotEventRegister.add_events) and
+        notifies them to the listeners of this process, like add_event
+        """
+        from acid_rain.bot_event_register import BotEventRegister, notify_event_listeners, \
+            LABEL_BOT, LABEL_EVENT, LABEL_USERNAME, LABEL_NUM_LIKES, LABEL_COMMENTS, \
+            LABEL_TIMESTAMP
+        now = datetime.datetime.now()
+        data_list = [BotEventRegister.make_event_data(
+            event.get(LABEL_BOT), event.get(LABEL_EVENT), event.get(LABEL_USERNAME),
+            event.get(LABEL_NUM_LIKES), event.get(LABEL_COMMENTS),
+            event.get(LABEL_TIMESTAMP) or now) for event in in_events]
+        if None in data_list or not self.call('add_events', data_list):
+            return False
+        if len(data_list) > 0:
+            notify_event_listeners(data_list)
+        return True
+
+    def close(self) -> bool:
+        """
+        Closes the connections of all the threads; the served register stays open
+        """
+        with self.connections_lock:
+            for connection in self.connections:
+                connection.close()
+            self.connections = []
+        self.local = threading.local()
+        return True
+
+
+class LocalBotEventRegister(RegisterClient):
+    """
+    In-process stand-in of RemoteBotEventRegister: requests go through the same encoding and
+    dispatch as in the server, but without sockets
+    """
+
+    def __init__(self, in_register):
+        """
+        Params:
+            in_register: BotEventRegister, the register
+        """
+        self.register = in_register
+
+    def send(self, in_line) -> bytes:
+        return handle_request(self.register, in_line)
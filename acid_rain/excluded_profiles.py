@@ -0,0 +1,319 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""File with the shared writer and index of the excluded profiles file"""
+
+__author__ = "Josep-Arnau Claret"
+__email__ = "joseparnau81@gmail.com"
+
+import hashlib
+import os
+import queue
+import threading
+import time
+
+DEFAULT_FSYNC_INTERVAL_S = 1.
+HASH_CHUNK_SIZE = 1 << 20
+
+INDEX_SUFFIX = '.index'
+LABEL_PROFILE_URL = 'profileUrl'
+
+# Shared writers by file path, with the number of users of each one
+writers = {}
+writers_lock = threading.Lock()
+# Shared indexes by file path
+indexes = {}
+indexes_lock = threading.Lock()
+
+
+class ExcludedProfilesWriter:
+    """
+    Class that appends profiles to the excluded profiles file from several bot threads.
+    The file is opened once; bots enqueue the profiles without locking and a background thread
+    writes them in batches, one line per profile, syncing them to disk at most every
+    'fsync_interval_s' seconds and on flush
+    """
+
+    def __init__(self, in_file_path, in_fsync_interval_s=DEFAULT_FSYNC_INTERVAL_S):
+        """
+        Params:
+            in_file_path: str, path of the excluded profiles file
+            in_fsync_interval_s: float, maximum time in seconds between a write and its sync to
+                                 disk; 0 syncs every batch
+        """
+        self.file_path = in_file_path
+        self.fsync_interval_s = in_fsync_interval_s
+        self.file = open(in_file_path, 'a')
+        self.queue = queue.SimpleQueue()
+        self.last_fsync_time = time.monotonic()
+        self.is_synced = True
+        self.write_failed = False
+        self.closed = False
+        self.thread = threading.Thread(target=self.run, name='excluded-profiles-writer',
+                                       daemon=True)
+        self.thread.start()
+
+    def add(self, in_profile):
+        """
+        Enqueues a profile to be written
+
+        Params:
+            in_profile: str, url of the profile
+        """
+        self.queue.put(in_profile)
+
+    def run(self):
+        while True:
+            try:
+                items = [self.queue.get(timeout=self.fsync_interval_s or None)]
+            except queue.Empty:
+                items = []
+            while True:
+                try:
+                    items.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            profiles = [item for item in items if isinstance(item, str)]
+            # Events and None are flush and close requests, served once the profiles enqueued
+            # before them are written
+            requests = [item for item in items if not isinstance(item, str)]
+            try:
+                if len(profiles) > 0:
+                    self.file.write(''.join(profile + '\n' for profile in profiles))
+                    self.file.flush()
+                    self.is_synced = False
+                if not self.is_synced and \
+                        (len(requests) > 0 or
+                         time.monotonic() - self.last_fsync_time >= self.fsync_interval_s):
+                    os.fsync(self.file.fileno())
+                    self.is_synced = True
+                    self.last_fsync_time = time.monotonic()
+                self.write_failed = False
+            except OSError as e:
+                print('Excluded profiles write failed: {}'.format(e))
+                self.write_failed = True
+
+            for request in requests:
+                if request is None:
+                    self.file.close()
+                    return
+                request.set()
+
+    def flush(self) -> bool:
+        """
+        Waits until all the enqueued profiles are written and synced to disk
+
+        Returns:
+            bool, whether the last write succeeded
+        """
+        if not self.closed:
+            flushed = threading.Event()
+            self.queue.put(flushed)
+            flushed.wait()
+        return not self.write_failed
+
+    def close(self) -> bool:
+        """
+        Writes the enqueued profiles, stops the thread and closes the file
+
+        Returns:
+            bool, whether the last write succeeded
+        """
+        if not self.closed:
+            self.closed = True
+            self.queue.put(None)
+            self.thread.join()
+        return not self.write_failed
+
+
+def open_excluded_profiles_writer(in_file_path) -> ExcludedProfilesWriter:
+    """
+    Returns the writer of an excluded profiles file shared by all the bots of the process,
+    created if it does not exist yet. Each call must be matched by a call to
+    close_excluded_profiles_writer
+    """
+    key = os.path.realpath(in_file_path)
+    with writers_lock:
+        if key not in writers:
+            writers[key] = [ExcludedProfilesWriter(in_file_path), 0]
+        writers[key][1] += 1
+        return writers[key][0]
+
+
+def close_excluded_profiles_writer(in_writer) -> bool:
+    """
+    Flushes the profiles of a shared writer, and closes it if no other bot uses it
+
+    Returns:
+        bool, whether the profiles are on disk
+    """
+    key = os.path.realpath(in_writer.file_path)
+    with writers_lock:
+        is_used = False
+        if key in writers and writers[key][0] is in_writer:
+            writers[key][1] -= 1
+            is_used = writers[key][1] > 0
+            if not is_used:
+                del writers[key]
+    return in_writer.flush() if is_used else in_writer.close()
+
+
+def get_profile_key(in_profile_url) -> str:
+    """
+    Returns the key of a profile in the exclusion index: its url without surrounding spaces or
+    trailing slash, in lower case
+    """
+    return in_profile_url.strip().rstrip('/').lower()
+
+
+def get_prefix_digest(in_file_path, in_size) -> str:
+    """
+    Returns the hex digest of the first 'in_size' bytes of a file
+    """
+    digest = hashlib.blake2b()
+    with open(in_file_path, 'rb') as file:
+        remaining = in_size
+        while remaining > 0:
+            chunk = file.read(min(HASH_CHUNK_SIZE, remaining))
+            if len(chunk) == 0:
+                break
+            digest.update(chunk)
+            remaining -= len(chunk)
+    return digest.hexdigest()
+
+
+class ExclusionIndex:
+    """
+    Class that keeps the keys (see get_profile_key) of the excluded profiles in a hash set, so
+    that the bots check them in O(1) while they act.
+    Only the profile urls (first column) of the excluded profiles file are read, and the keys
+    are persisted in '<file>.index' together with the size and the digest of the part of the
+    file they cover, so loading reads the index and only the lines appended to the file since it
+    was saved. The index is rebuilt if that part of the file changed
+    """
+
+    def __init__(self, in_file_path):
+        """
+        Params:
+            in_file_path: str, path of the excluded profiles file
+        """
+        self.file_path = in_file_path
+        self.index_path = str(in_file_path) + INDEX_SUFFIX
+        self.lock = threading.Lock()
+        self.keys = set()
+        # Bytes of the excluded profiles file whose profiles are in 'keys'
+        self.offset = 0
+        self.load()
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __contains__(self, in_profile_url):
+        return get_profile_key(in_profile_url) in self.keys
+
+    def load(self):
+        """
+        Reads the keys of the index file, if it still matches the part of the excluded profiles
+        file it covers, and of the lines of the file after it
+        """
+        keys = set()
+        offset = 0
+        try:
+            with open(self.index_path) as file:
+                index_offset = int(file.readline())
+                index_digest = file.readline().rstrip('\n')
+                if index_offset <= os.path.getsize(self.file_path) and \
+                        index_digest == get_prefix_digest(self.file_path, index_offset):
+                    keys = set(file.read().splitlines())
+                    offset = index_offset
+        except (OSError, ValueError):
+            pass
+        with self.lock:
+            self.keys = keys
+            self.offset = offset
+        self.refresh()
+
+    def refresh(self) -> int:
+        """
+        Adds the profiles appended to the excluded profiles file since it was last read
+
+        Returns:
+            int, number of lines read
+        """
+        with self.lock:
+            if not os.path.isfile(self.file_path):
+                return 0
+            with open(self.file_path, 'rb') as file:
+                file.seek(self.offset)
+                data = file.read()
+            # A partially written last line is read next time
+            data = data[:data.rfind(b'\n') + 1]
+            lines = data.decode().splitlines()
+            for line in lines:
+                profile_url = line.split(',', 1)[0]
+                if len(profile_url) > 0 and profile_url != LABEL_PROFILE_URL:
+                    self.keys.add(get_profile_key(profile_url))
+            self.offset += len(data)
+            return len(lines)
+
+    def add(self, in_profile_url):
+        """
+        Adds a profile
+        """
+        self.keys.add(get_profile_key(in_profile_url))
+
+    def claim(self, in_profile_url) -> bool:
+        """
+        Adds a profile if it is not excluded yet, so that only one bot acts on it
+
+        Returns:
+            bool, whether the profile was not excluded
+        """
+        key = get_profile_key(in_profile_url)
+        with self.lock:
+            if key in self.keys:
+                return False
+            self.keys.add(key)
+            return True
+
+    def get_keys(self) -> list:
+        """
+        Returns:
+            list, a copy of the keys of the excluded profiles
+        """
+        with self.lock:
+            return list(self.keys)
+
+    def save(self) -> bool:
+        """
+        Writes the index file with the keys of the excluded profiles file, read up to its end
+        """
+        self.refresh()
+        with self.lock:
+            keys = list(self.keys)
+            offset = self.offset
+        tmp_path = self.index_path + '.tmp'
+        try:
+            # The file is only appended to, so the part covered by the keys does not change
+            digest = get_prefix_digest(self.file_path, offset) if offset > 0 else \
+                hashlib.blake2b().hexdigest()
+            with open(tmp_path, 'w') as file:
+                file.write('{}\n{}\n'.format(offset, digest))
+                file.write(''.join(key + '\n' for key in keys))
+            os.replace(tmp_path, self.index_path)
+        except OSError as e:
+            print('Exclusion index save failed: {}'.format(e))
+            return False
+        return True
+
+
+def get_exclusion_index(in_file_path) -> ExclusionIndex:
+    """
+    Returns the exclusion index of an excluded profiles file shared by all the bots of the
+    process, loaded if it does not exist yet
+    """
+    key = os.path.realpath(in_file_path)
+    with indexes_lock:
+        if key not in indexes:
+            indexes[key] = ExclusionIndex(in_file_path)
+        return indexes[key]
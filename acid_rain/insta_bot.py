@@ -11,10 +11,18 @@ from random import uniform, randint
 from time import sleep
 
 from acid_rain.bot_event_register import BotEventRegister, EVENT_LOGIN, EVENT_LIKES, EVENT_FOLLOW, \
-    EVENT_EXCEPTION, EVENT_BLOCK
+    EVENT_EXCEPTION, EVENT_BLOCK, LABEL_BOT, LABEL_EVENT, LABEL_USERNAME, LABEL_NUM_LIKES, \
+    LABEL_COMMENTS
+from acid_rain.event_store_server import RemoteBotEventRegister, is_remote_address
+from acid_rain.excluded_profiles import open_excluded_profiles_writer, \
+    close_excluded_profiles_writer, get_exclusion_index
+from acid_rain.engage_checkpoint import KEY_ACTIONS_COUNT, KEY_PROFILES, KEY_ELAPSED_S
+from acid_rain.bot_scheduler import BotScheduler, AsyncBotScheduler
+from acid_rain.bot_steps import run_steps, run_steps_async, STEP_WAIT, STEP_SLEEP_UNTIL, \
+    STEP_CALL, STEP_IO
 from acid_rain.acid_rain_constants import ONE_HOUR, ONE_DAY, ACTION_BLOCK
-from acid_rain.insta_funcs import follow_profile, like_photos_profile, append_profile_as_row, \
-    login, start_selenium, close_selenium
+from acid_rain.insta_funcs import follow_profile, like_photos_profile, login, start_selenium, \
+    close_selenium
 from acid_rain.acid_rain_utils import get_random_bool, select_idx_by_prob
 
 ACTION_LIKE = 'like'
@@ -26,6 +34,7 @@ MAX_CONSECUTIVE_EXCEPTIONS = 3
 
 SLEEP_AFTER_EXCEPTION_MIN_S = 3 * 60
 SLEEP_AFTER_EXCEPTION_MAX_S = 5 * 60
+ENGAGE_ACTION_PERIOD_S = 5
 
 MAX_RUN_HOURS = 3
 WAIT_AFTER_BLOCK_HOURS = 24
@@ -92,7 +101,8 @@ class InstaBot:
             username: str, username of the bot
             password: str, password of the bot
             in_excluded_profiles_file: str, file path with excluded profiles
-            in_events_file: str, file path with the bot events
+            in_events_file: str, file path with the bot events, or address of an event store
+                            server ('tcp://host:port' or 'unix:///path/to/socket')
             in_test: bool, run in test or not
             in_log_folder: str, folder to log
         """
@@ -107,6 +117,8 @@ class InstaBot:
         self.time_start = None
 
         self.excluded_profiles_file = in_excluded_profiles_file
+        self.excluded_profiles_writer = open_excluded_profiles_writer(self.excluded_profiles_file)
+        self.exclusion_index = get_exclusion_index(self.excluded_profiles_file)
         self.events_file_path = in_events_file
 
         self.events_keep_duration_s = EVENTS_KEEP_DURATION_S
@@ -133,31 +145,48 @@ class InstaBot:
         self.follows_max_seconds_between_profiles = FOLLOWS_MAX_SECONDS_BETWEEN_PROFILES
 
         # Initialize event register
-        self.event_register = BotEventRegister(self.events_file_path)
+        if is_remote_address(self.events_file_path):
+            self.event_register = RemoteBotEventRegister(self.events_file_path)
+        else:
+            self.event_register = BotEventRegister(self.events_file_path, in_journal_on=True,
+                                                   in_write_behind_on=True)
 
         # Initialize bot
         self.bot = start_selenium()
 
         self.time_login = None
+        # (last block timestamp, end of the wait after it)
+        self.block_end_time = None
 
     def close_session(self):
         close_selenium(self.bot)
+        close_excluded_profiles_writer(self.excluded_profiles_writer)
+        self.exclusion_index.save()
+        # The events file is compacted by its owner, BotMaster or the event store server
+        self.event_register.close()
 
     def login(self):
+        run_steps(self.login_steps())
+
+    def login_steps(self):
+        """
+        Steps of login (see bot_steps)
+        """
 
         if self.time_login is None:
             if self.test_on:
                 print('({}) Login mocked'.format(self.name))
             else:
-                login(self.bot, self.name, self.password)
+                yield STEP_CALL, login, (self.bot, self.name, self.password)
             self.time_login = datetime.now()
 
             keep_events_timestamp = self.time_login - timedelta(0, self.events_keep_duration_s)
-            num_removed = self.event_register.remove_events_before(keep_events_timestamp)
+            num_removed = yield STEP_IO, self.event_register.remove_events_before, \
+                (keep_events_timestamp,)
             print('({}) Removed events: {}'.format(self.name, num_removed))
 
-            self.event_register.add_event(self.name, EVENT_LOGIN)
-            self.event_register.save()
+            yield STEP_IO, self.event_register.add_event, (self.name, EVENT_LOGIN)
+            yield STEP_IO, self.event_register.save, ()
 
     def do_likes(self, target_urls, in_jump_wait=False) -> list:
         """
@@ -170,6 +199,12 @@ class InstaBot:
         Return:
             list, liked urls
         """
+        return run_steps(self.like_steps(target_urls, in_jump_wait))
+
+    def like_steps(self, target_urls, in_jump_wait=False):
+        """
+        Steps of do_likes (see bot_steps)
+        """
 
         print('({}) likes: START'.format(self.name))
 
@@ -178,7 +213,7 @@ class InstaBot:
         if not self.waited_enough_after_last_block('likes'):
             return []
 
-        self.login()
+        yield from self.login_steps()
 
         time_start = datetime.now() if self.time_start is None else self.time_start
 
@@ -193,51 +228,62 @@ class InstaBot:
                 break
 
             # Wait conditions
-            if self.wait_for_max_counts_per_hour('likes', in_jump_wait=in_jump_wait) \
-                    and in_jump_wait:
+            max_counts_reached = yield from self.wait_for_max_counts_per_hour_steps(
+                'likes', in_jump_wait=in_jump_wait)
+            if max_counts_reached and in_jump_wait:
                 break
-            self.sleep_for_next_profile('likes')
+            yield from self.sleep_for_next_profile_steps('likes')
+
+            # Skip the profiles processed by any bot
+            if not self.exclusion_index.claim(profile):
+                print('({}) likes: {} already excluded'.format(self.name, profile))
+                continue
 
             # Like
             if self.test_on:
-                num_likes_done, exception_found, exception_cause = \
-                    mock_like_photos_profile(self.name,
-                                             self.likes_min_x_profile,
-                                             self.likes_max_x_profile,
-                                             self.likes_min_sleep_time_s,
-                                             self.likes_max_sleep_time_s)
+                num_likes_done, exception_found, exception_cause = yield STEP_CALL, \
+                    mock_like_photos_profile, (self.name,
+                                               self.likes_min_x_profile,
+                                               self.likes_max_x_profile,
+                                               self.likes_min_sleep_time_s,
+                                               self.likes_max_sleep_time_s)
             else:
-                num_likes_done, exception_found, exception_cause = \
-                    like_photos_profile(self.bot, profile,
-                                        self.likes_min_x_profile, self.likes_max_x_profile,
-                                        self.likes_min_sleep_time_s, self.likes_max_sleep_time_s,
-                                        log_fail_folder=self.log_folder)
+                num_likes_done, exception_found, exception_cause = yield STEP_CALL, \
+                    like_photos_profile, (self.bot, profile,
+                                          self.likes_min_x_profile, self.likes_max_x_profile,
+                                          self.likes_min_sleep_time_s, self.likes_max_sleep_time_s,
+                                          self.log_folder)
 
             # add profile to to already liked list
             profiles_liked.append(profile)
-            append_profile_as_row(self.excluded_profiles_file, profile)
+            self.excluded_profiles_writer.add(profile)
 
+            events = []
             if num_likes_done > 0:
-                self.event_register.add_event(self.name, EVENT_LIKES, profile, num_likes_done)
+                events.append({LABEL_BOT: self.name, LABEL_EVENT: EVENT_LIKES,
+                               LABEL_USERNAME: profile, LABEL_NUM_LIKES: num_likes_done})
+            if exception_found:
+                events.append({LABEL_BOT: self.name, LABEL_EVENT: EVENT_EXCEPTION,
+                               LABEL_COMMENTS: 'like'})
+                if exception_cause == ACTION_BLOCK:
+                    events.append({LABEL_BOT: self.name, LABEL_EVENT: EVENT_BLOCK,
+                                   LABEL_COMMENTS: 'like'})
+            yield STEP_IO, self.event_register.add_events, (events,)
 
             if exception_found:
                 num_consecutive_exceptions += 1
-                self.event_register.add_event(self.name, EVENT_EXCEPTION, in_comments='like')
-                if exception_cause == ACTION_BLOCK:
-                    self.event_register.add_event(self.name, EVENT_BLOCK, in_comments='like')
-                self.wait_after_exception('like')
+                yield from self.wait_after_exception_steps('like')
             else:
                 num_consecutive_exceptions = 0
 
-            self.event_register.save()
+            yield STEP_IO, self.event_register.save, ()
 
             likes_counter += num_likes_done
 
             run_time = datetime.now() - time_start
             print('({}) likes: Total: {} in {}'
                   .format(self.name,
-                          self.event_register.get_number_of_likes_since(self.name,
-                                                                        datetime.now() - run_time),
+                          self.event_register.get_number_of_likes_since(self.name, time_start),
                           run_time))
 
             # Ending conditions
@@ -249,7 +295,7 @@ class InstaBot:
                     self.enough_counts_in_run(likes_counter, 'likes'):
                 break
 
-            self.wait_for_max_count_rate(time_start, 'likes')
+            yield from self.wait_for_max_count_rate_steps(time_start, 'likes')
 
         return profiles_liked
 
@@ -264,6 +310,12 @@ class InstaBot:
         Return:
             list, followed urls
         """
+        return run_steps(self.follow_steps(target_urls, in_jump_wait))
+
+    def follow_steps(self, target_urls, in_jump_wait=False):
+        """
+        Steps of do_follows (see bot_steps)
+        """
 
         print('({}) follows: START'.format(self.name))
 
@@ -272,7 +324,7 @@ class InstaBot:
         if not self.waited_enough_after_last_block('follows'):
             return []
 
-        self.login()
+        yield from self.login_steps()
 
         time_start = datetime.now() if self.time_start is None else self.time_start
 
@@ -287,40 +339,48 @@ class InstaBot:
                 break
 
             # Wait conditions
-            if self.wait_for_max_counts_per_hour('follows', in_jump_wait=in_jump_wait) \
-                    and in_jump_wait:
+            max_counts_reached = yield from self.wait_for_max_counts_per_hour_steps(
+                'follows', in_jump_wait=in_jump_wait)
+            if max_counts_reached and in_jump_wait:
                 break
-            self.sleep_for_next_profile('follows')
+            yield from self.sleep_for_next_profile_steps('follows')
+
+            # Skip the profiles processed by any bot
+            if not self.exclusion_index.claim(my_profile):
+                print('({}) follows: {} already excluded'.format(self.name, my_profile))
+                continue
 
             # Follow
             if self.test_on:
-                follow_done, exception_cause = mock_follow_profile(self.name)
+                follow_done, exception_cause = yield STEP_CALL, mock_follow_profile, (self.name,)
             else:
-                follow_done, exception_cause = \
-                    follow_profile(self.bot, my_profile, log_fail_folder=self.log_folder)
+                follow_done, exception_cause = yield STEP_CALL, \
+                    follow_profile, (self.bot, my_profile, self.log_folder)
 
             # add profile to already followed list
             profiles_followed.append(my_profile)
-            append_profile_as_row(self.excluded_profiles_file, my_profile)
+            self.excluded_profiles_writer.add(my_profile)
 
             if follow_done:
                 follows_counter += 1
                 num_consecutive_exceptions = 0
-                self.event_register.add_event(self.name, EVENT_FOLLOW, my_profile)
+                yield STEP_IO, self.event_register.add_event, (self.name, EVENT_FOLLOW, my_profile)
             else:
                 num_consecutive_exceptions += 1
-                self.event_register.add_event(self.name, EVENT_EXCEPTION, in_comments='follow')
+                events = [{LABEL_BOT: self.name, LABEL_EVENT: EVENT_EXCEPTION,
+                           LABEL_COMMENTS: 'follow'}]
                 if exception_cause == ACTION_BLOCK:
-                    self.event_register.add_event(self.name, EVENT_BLOCK, in_comments='follow')
-                self.wait_after_exception('follow')
+                    events.append({LABEL_BOT: self.name, LABEL_EVENT: EVENT_BLOCK,
+                                   LABEL_COMMENTS: 'follow'})
+                yield STEP_IO, self.event_register.add_events, (events,)
+                yield from self.wait_after_exception_steps('follow')
 
-            self.event_register.save()
+            yield STEP_IO, self.event_register.save, ()
 
             run_time = datetime.now() - time_start
             print('({}) follows: Total: {} in {}'
                   .format(self.name,
-                          self.event_register.get_number_of_follows_since(self.name,
-                                                                          datetime.now() - run_time),
+                          self.event_register.get_number_of_follows_since(self.name, time_start),
                           run_time))
 
             # Ending conditions
@@ -353,20 +413,72 @@ class InstaBot:
 
         return liked_profiles, followed_profiles
 
-    def engage(self, likes_targets, follow_targets, run_time_hours=None,
-               probabilities=None) -> tuple:
+    def engage(self, target_queue, run_time_hours=None, probabilities=None, checkpoint=None,
+               progress=None, scheduler=None) -> tuple:
         """
         Runs likes and follows randomly until the profiles are ended or the maximum time is reached.
+        While the bot waits after a block, its targets are released to the other bots.
+        Between actions, and while it waits after a block or for the limits of all the actions,
+        the bot sleeps in the scheduler until the time it can act, or until an event of the bot
+        is added to a register of the process.
+        With a checkpoint, the progress is saved after each action (the processed profiles are
+        appended to a log), and a run is resumed from the last saved progress
 
         Params:
-            likes_targets: list, urls to like
-            follow_targets: list, urls to follow
+            target_queue: TargetQueue, queue with the urls to like (ACTION_LIKE) and to
+                          follow (ACTION_FOLLOW), shared with the other bots
             run_time_hours: float, time of max duration in hours
             probabilities: list of floats, probability to do a like or a follow
+            checkpoint: EngageCheckpoint, where to save the progress; None does not save it
+            progress: dict, progress of a previous run to resume
+                      (see EngageCheckpoint.load_progress)
+            scheduler: BotScheduler, scheduler shared with the other bots; if None, the bot uses
+                       its own
 
         Return:
             tuple, liked and followed urls lists
         """
+        own_scheduler = scheduler is None
+        if own_scheduler:
+            scheduler = BotScheduler()
+        try:
+            return run_steps(self.engage_steps(target_queue, run_time_hours, probabilities,
+                                               checkpoint, progress), self.name, scheduler)
+        finally:
+            if own_scheduler:
+                scheduler.close()
+
+    async def engage_async(self, target_queue, run_time_hours=None, probabilities=None,
+                           checkpoint=None, progress=None, scheduler=None, executor=None) -> tuple:
+        """
+        Runs engage in the running asyncio event loop: the waits are asyncio timers and the
+        Selenium calls run in an executor, so that many bots run in a few threads
+
+        Params:
+            scheduler: AsyncBotScheduler, scheduler shared with the other bots; if None, the bot
+                       uses its own
+            executor: Executor, executor of the Selenium calls; if None, the loop default one
+            (see engage for the rest)
+
+        Return:
+            tuple, liked and followed urls lists
+        """
+        own_scheduler = scheduler is None
+        if own_scheduler:
+            scheduler = AsyncBotScheduler()
+        try:
+            return await run_steps_async(
+                self.engage_steps(target_queue, run_time_hours, probabilities, checkpoint,
+                                  progress), self.name, scheduler, executor)
+        finally:
+            if own_scheduler:
+                scheduler.close()
+
+    def engage_steps(self, target_queue, run_time_hours=None, probabilities=None, checkpoint=None,
+                     progress=None):
+        """
+        Steps of engage (see bot_steps)
+        """
 
         num_actions = len(ACTION_LIST)
 
@@ -379,63 +491,146 @@ class InstaBot:
 
         self.max_run_hours = None
 
-        # Build targets
-        targets = {ACTION_LIKE: likes_targets.values,
-                   ACTION_FOLLOW: follow_targets.values}
-        total_actions = {x: len(targets[x]) for x in ACTION_LIST}
-        total_str = ', '.join(['{} ({})'.format(x.upper(), n) for x, n in total_actions.items()])
+        total_str = ', '.join(['{} ({})'.format(x.upper(), target_queue.get_num_targets(x))
+                               for x in ACTION_LIST])
         print('({}) Targets: {}'.format(self.name, total_str))
 
         # Loop
         actions_count = {x: 0 for x in ACTION_LIST}
         profiles = {x: [] for x in ACTION_LIST}
         self.time_start = datetime.now()
-        run_time = timedelta(0, 3600 * run_time_hours)
-        while datetime.now() - self.time_start < run_time:
-            sleep(5)  # 0.2 Hz
-
-            if not self.waited_enough_after_last_block('engage', in_with_rnd=True):
+        if progress is not None:
+            actions_count.update(progress[KEY_ACTIONS_COUNT])
+            profiles.update(progress[KEY_PROFILES])
+            self.time_start -= timedelta(0, progress[KEY_ELAPSED_S])
+            print('({}) Resumed after {}: {}'.format(
+                self.name, timedelta(0, progress[KEY_ELAPSED_S]),
+                ', '.join(['{} ({})'.format(x.upper(), actions_count[x]) for x in ACTION_LIST])))
+        time_end = self.time_start + timedelta(0, 3600 * run_time_hours)
+        while datetime.now() < time_end:
+            block_end_time = self.get_block_end_time()
+            if block_end_time is not None and block_end_time > datetime.now():
+                print('({}) engage: wait after last block until {}'
+                      .format(self.name, block_end_time))
+                target_queue.release(self.name)
+                yield STEP_SLEEP_UNTIL, min(block_end_time, time_end)
                 continue
 
-            num_actions = {x: len(profiles[x]) for x in ACTION_LIST}
-            actions_completed = [num_actions[x] >= total_actions[x] for x in ACTION_LIST]
+            actions_completed = [not target_queue.has_targets(x, self.name) for x in ACTION_LIST]
             if all(actions_completed):
                 break
 
-            # Select action
-            probabilities = [(not actions_completed[i]) * p for i, p in enumerate(probabilities)]
-            selected_action = ACTION_LIST[select_idx_by_prob(probabilities)]
+            # Select action among the ones that the limits allow now
+            action_times = [None if actions_completed[i] else self.get_next_action_time(x)
+                            for i, x in enumerate(ACTION_LIST)]
+            now = datetime.now()
+            action_probabilities = [(action_times[i] is not None and action_times[i] <= now) * p
+                                    for i, p in enumerate(probabilities)]
+            if sum(action_probabilities) == 0:
+                next_action_time = min(x for x in action_times if x is not None)
+                print('({}) engage: max counts reached, wait until {}'
+                      .format(self.name, next_action_time))
+                yield STEP_SLEEP_UNTIL, min(next_action_time, time_end)
+                continue
+            selected_action = ACTION_LIST[select_idx_by_prob(action_probabilities)]
             selected_action_str = selected_action.upper()
-            action_idx = actions_count[selected_action]
-            print('({}) RUN **** {}: {} / {} profiles ****'
-                  .format(self.name, selected_action_str,
-                          action_idx, total_actions[selected_action]))
-
-            # Run action
-            new_target = targets[selected_action][action_idx]
-            if selected_action == ACTION_LIKE:
-                processed_profile = self.do_likes([new_target], in_jump_wait=True)
-            elif selected_action == ACTION_FOLLOW:
-                processed_profile = self.do_follows([new_target], in_jump_wait=True)
-
-            success = len(processed_profile) > 0
-            if success:
-                actions_count[selected_action] += 1
-                profiles[selected_action].append(processed_profile)
-            print('({}) {} **** {} ****'
-                  .format(self.name, 'DONE' if success else 'PASS', selected_action_str))
+            new_target = target_queue.get(self.name, selected_action)
+            if new_target is not None:
+                print('({}) RUN **** {}: {} done, {} profiles left ****'
+                      .format(self.name, selected_action_str, actions_count[selected_action],
+                              target_queue.get_num_targets(selected_action)))
+
+                # Run action
+                if selected_action == ACTION_LIKE:
+                    processed_profile = yield from self.like_steps([new_target], in_jump_wait=True)
+                elif selected_action == ACTION_FOLLOW:
+                    processed_profile = yield from self.follow_steps([new_target],
+                                                                     in_jump_wait=True)
+
+                success = len(processed_profile) > 0
+                if success:
+                    actions_count[selected_action] += 1
+                    profiles[selected_action].append(processed_profile)
+                    if checkpoint is not None:
+                        yield STEP_IO, checkpoint.add_profile, \
+                            (self.name, selected_action, processed_profile)
+                elif new_target not in self.exclusion_index:
+                    # Not processed yet (e.g. max counts per hour reached): retry it later
+                    target_queue.put_back(self.name, selected_action, new_target)
+                print('({}) {} **** {} ****'
+                      .format(self.name, 'DONE' if success else 'PASS', selected_action_str))
+
+                if checkpoint is not None:
+                    yield STEP_IO, checkpoint.save, \
+                        (self.name, (datetime.now() - self.time_start).total_seconds(),
+                         target_queue)
+
+            yield STEP_SLEEP_UNTIL, min(datetime.now() + timedelta(0, ENGAGE_ACTION_PERIOD_S),
+                                        time_end)
 
         return tuple(profiles[x] for x in ACTION_LIST)
 
+    def get_block_end_time(self):
+        """
+        Returns the time when the wait after the last block of the bot ends, None if it has never
+        been blocked. The wait is drawn once per block, between 'wait_after_block_hours' and twice
+        as long
+
+        Returns:
+            datetime or None, the end of the wait
+        """
+        last_block_timestamp = self.event_register.get_last_block_timestamp(self.name)
+        if last_block_timestamp is None:
+            return None
+        if self.block_end_time is None or self.block_end_time[0] != last_block_timestamp:
+            duration = uniform(self.wait_after_block_hours, 2 * self.wait_after_block_hours)
+            self.block_end_time = (last_block_timestamp,
+                                   last_block_timestamp + timedelta(0, 3600 * duration))
+        return self.block_end_time[1]
+
+    def get_next_action_time(self, in_action):
+        """
+        Returns the time from which the daily and hourly limits allow the bot to do an action
+
+        Params:
+            in_action: str, ACTION_LIKE or ACTION_FOLLOW
+
+        Returns:
+            datetime, the time, now if the limits are not reached
+        """
+        now = datetime.now()
+        next_action_time = now
+        min_wait = timedelta(0, ENGAGE_ACTION_PERIOD_S)
+        if in_action == ACTION_LIKE:
+            for window, max_counts in ((ONE_DAY, self.likes_max_per_day),
+                                       (ONE_HOUR, self.likes_max_per_hour)):
+                if self.event_register.get_number_of_likes_in_last(self.name, window) > max_counts:
+                    # The likes after this timestamp are within the limit once it leaves the window
+                    timestamp = self.event_register\
+                        .get_first_timestamp_with_more_than_cumulative_likes(self.name, max_counts)
+                    next_action_time = max(next_action_time, now + min_wait,
+                                           now if timestamp is None else timestamp + window)
+        elif in_action == ACTION_FOLLOW:
+            for window, max_counts in ((ONE_DAY, self.follows_max_per_day),
+                                       (ONE_HOUR, self.follows_max_per_hour)):
+                counts = self.event_register.get_number_of_follows_in_last(self.name, window)
+                if counts > max_counts:
+                    # The follows after this timestamp are within the limit once it leaves the
+                    # window
+                    timestamp = self.event_register\
+                        .get_first_timestamp_with_more_than_cumulative_follows(self.name,
+                                                                               max_counts)
+                    next_action_time = max(next_action_time, now + min_wait,
+                                           now if timestamp is None else timestamp + window)
+        return next_action_time
+
     def print_last_events(self, in_source):
-        past_day = datetime.now() - ONE_DAY
-        past_hour = datetime.now() - ONE_HOUR
         if in_source == 'likes':
-            last_day = self.event_register.get_number_of_likes_since(self.name, past_day)
-            last_hour = self.event_register.get_number_of_likes_since(self.name, past_hour)
+            last_day = self.event_register.get_number_of_likes_in_last(self.name, ONE_DAY)
+            last_hour = self.event_register.get_number_of_likes_in_last(self.name, ONE_HOUR)
         elif in_source == 'follows':
-            last_day = self.event_register.get_number_of_follows_since(self.name, past_day)
-            last_hour = self.event_register.get_number_of_follows_since(self.name, past_hour)
+            last_day = self.event_register.get_number_of_follows_in_last(self.name, ONE_DAY)
+            last_hour = self.event_register.get_number_of_follows_in_last(self.name, ONE_HOUR)
         print('({}) {}: last day / hour: {} / {}'.format(self.name, in_source,
                                                          int(last_day), int(last_hour)))
 
@@ -475,12 +670,11 @@ class InstaBot:
             return False
 
     def enough_counts_for_today(self, in_source) -> bool:
-        past_day = datetime.now() - ONE_DAY
         if in_source == 'likes':
-            counts_last_day = self.event_register.get_number_of_likes_since(self.name, past_day)
+            counts_last_day = self.event_register.get_number_of_likes_in_last(self.name, ONE_DAY)
             max_per_day = self.likes_max_per_day
         elif in_source == 'follows':
-            counts_last_day = self.event_register.get_number_of_follows_since(self.name, past_day)
+            counts_last_day = self.event_register.get_number_of_follows_in_last(self.name, ONE_DAY)
             max_per_day = self.follows_max_per_day
 
         if counts_last_day > max_per_day:
@@ -518,6 +712,12 @@ class InstaBot:
             return False
 
     def sleep_for_next_profile(self, in_source):
+        run_steps(self.sleep_for_next_profile_steps(in_source))
+
+    def sleep_for_next_profile_steps(self, in_source):
+        """
+        Steps of sleep_for_next_profile (see bot_steps)
+        """
         if in_source == 'likes':
             sleep_time = uniform(self.likes_min_seconds_between_profiles,
                                  self.likes_max_seconds_between_profiles)
@@ -526,15 +726,20 @@ class InstaBot:
                                  self.follows_max_seconds_between_profiles)
         duration = timedelta(0, sleep_time)
         print('({}) {}: wait for next profile: {}'.format(self.name, in_source, duration))
-        sleep(sleep_time)
+        yield STEP_WAIT, sleep_time
 
     def wait_for_max_counts_per_hour(self, in_source, in_jump_wait=False) -> bool:
-        past_hour = datetime.now() - ONE_HOUR
+        return run_steps(self.wait_for_max_counts_per_hour_steps(in_source, in_jump_wait))
+
+    def wait_for_max_counts_per_hour_steps(self, in_source, in_jump_wait=False):
+        """
+        Steps of wait_for_max_counts_per_hour (see bot_steps)
+        """
         if in_source == 'likes':
-            counts = self.event_register.get_number_of_likes_since(self.name, past_hour)
+            counts = self.event_register.get_number_of_likes_in_last(self.name, ONE_HOUR)
             max_counts = self.likes_max_per_hour
         elif in_source == 'follows':
-            counts = self.event_register.get_number_of_follows_since(self.name, past_hour)
+            counts = self.event_register.get_number_of_follows_in_last(self.name, ONE_HOUR)
             max_counts = self.follows_max_per_hour
 
         if counts > max_counts:
@@ -545,12 +750,18 @@ class InstaBot:
                 wait_time_in_s = uniform(15 * 60, 30 * 60)  # Wait between 15 and 30 min
                 print("({}) {}: max per hour reached for bot: {} > {}: wait {:.2f} min"
                       .format(self.name, in_source, counts, max_counts, wait_time_in_s / 60))
-                sleep(wait_time_in_s)
+                yield STEP_WAIT, wait_time_in_s
             return True
         else:
             return False
 
-    def wait_for_max_count_rate(self, time_start, in_source):
+    def wait_for_max_count_rate(self, time_start, in_source) -> bool:
+        return run_steps(self.wait_for_max_count_rate_steps(time_start, in_source))
+
+    def wait_for_max_count_rate_steps(self, time_start, in_source):
+        """
+        Steps of wait_for_max_count_rate (see bot_steps)
+        """
         if in_source == 'likes':
             run_time = datetime.now() - time_start
             number_of_likes_in_run = \
@@ -564,7 +775,7 @@ class InstaBot:
                       .format(self.name, in_source,
                               number_of_likes_in_run, max_likes_in_run,
                               wait_time_in_sec))
-                sleep(wait_time_in_sec)
+                yield STEP_WAIT, wait_time_in_sec
                 return True
             else:
                 rate_counts_per_hour = number_of_likes_in_run / (run_time.seconds / 3600)
@@ -573,7 +784,13 @@ class InstaBot:
         return False
 
     def wait_after_exception(self, in_source):
+        run_steps(self.wait_after_exception_steps(in_source))
+
+    def wait_after_exception_steps(self, in_source):
+        """
+        Steps of wait_after_exception (see bot_steps)
+        """
         wait_time_in_sec = uniform(SLEEP_AFTER_EXCEPTION_MIN_S, SLEEP_AFTER_EXCEPTION_MAX_S)
         print("({}) {}: wait after exception for {}"
               .format(self.name, in_source, timedelta(0, wait_time_in_sec)))
-        sleep(wait_time_in_sec)
+        yield STEP_WAIT, wait_time_in_sec
@@ -140,8 +140,3 @@ def follow_profile(bot, profile_url, log_fail_folder=None):
         return 0, exception_cause
 
 
-def append_profile_as_row(file_name, new_profileUrl):
-    # Open file in append mode
-    file = open(file_name, 'a')
-    file.write(new_profileUrl+'\n')
-    file.close()
@@ -0,0 +1,385 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""File with the SQLite storage backend of the bot event register"""
+
+__author__ = "Josep-Arnau Claret"
+__email__ = "joseparnau81@gmail.com"
+
+import datetime
+import sqlite3
+import threading
+
+import pandas as pd
+
+from acid_rain.acid_rain_settings import ReadWriteLock
+from acid_rain.bot_event_register import BotEventRegister, ALL_LABELS, LABEL_TIMESTAMP, \
+    LABEL_BOT, LABEL_EVENT, LABEL_USERNAME, LABEL_NUM_LIKES, LABEL_COMMENTS, LABEL_COUNT, \
+    EVENT_LIKES, ROLLUP_PERIODS
+
+TABLE_EVENTS = 'events'
+TABLE_ROLLUPS = 'rollups'
+BUSY_TIMEOUT_MS = 30000
+
+EPOCH = datetime.datetime(1970, 1, 1)
+ONE_MICROSECOND = datetime.timedelta(microseconds=1)
+
+SQL_CREATE_TABLE = f"""
+    CREATE TABLE IF NOT EXISTS {TABLE_EVENTS} (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        {LABEL_TIMESTAMP} INTEGER NOT NULL,
+        {LABEL_BOT} TEXT NOT NULL,
+        {LABEL_EVENT} TEXT NOT NULL,
+        {LABEL_USERNAME} TEXT,
+        {LABEL_NUM_LIKES} REAL,
+        {LABEL_COMMENTS} TEXT
+    )"""
+SQL_CREATE_INDEXES = [
+    f"CREATE INDEX IF NOT EXISTS idx_bot_event_timestamp "
+    f"ON {TABLE_EVENTS} ({LABEL_BOT}, {LABEL_EVENT}, {LABEL_TIMESTAMP})",
+    f"CREATE INDEX IF NOT EXISTS idx_bot_timestamp "
+    f"ON {TABLE_EVENTS} ({LABEL_BOT}, {LABEL_TIMESTAMP})",
+    f"CREATE INDEX IF NOT EXISTS idx_timestamp ON {TABLE_EVENTS} ({LABEL_TIMESTAMP})"]
+# Rollups of the events per (period, bot, event), kept up to date by triggers on the events.
+# Periods and their starts ('bucket') are in microseconds
+ROLLUP_PERIODS_US = [period // ONE_MICROSECOND for period in ROLLUP_PERIODS]
+SQL_CREATE_ROLLUPS_TABLE = f"""
+    CREATE TABLE IF NOT EXISTS {TABLE_ROLLUPS} (
+        period INTEGER NOT NULL,
+        {LABEL_BOT} TEXT NOT NULL,
+        {LABEL_EVENT} TEXT NOT NULL,
+        bucket INTEGER NOT NULL,
+        {LABEL_COUNT} INTEGER NOT NULL,
+        {LABEL_NUM_LIKES} REAL NOT NULL,
+        PRIMARY KEY (period, {LABEL_BOT}, {LABEL_EVENT}, bucket)
+    )"""
+SQL_CREATE_ROLLUPS_TRIGGERS = [
+    f"CREATE TRIGGER IF NOT EXISTS rollups_insert AFTER INSERT ON {TABLE_EVENTS} BEGIN " +
+    "".join(
+        f"INSERT INTO {TABLE_ROLLUPS} VALUES ({period}, NEW.{LABEL_BOT}, NEW.{LABEL_EVENT}, "
+        f"NEW.{LABEL_TIMESTAMP} - NEW.{LABEL_TIMESTAMP} % {period}, 1, "
+        f"COALESCE(NEW.{LABEL_NUM_LIKES}, 0)) "
+        f"ON CONFLICT (period, {LABEL_BOT}, {LABEL_EVENT}, bucket) DO UPDATE SET "
+        f"{LABEL_COUNT} = {LABEL_COUNT} + 1, "
+        f"{LABEL_NUM_LIKES} = {LABEL_NUM_LIKES} + excluded.{LABEL_NUM_LIKES}; "
+        for period in ROLLUP_PERIODS_US) + "END",
+    f"CREATE TRIGGER IF NOT EXISTS rollups_delete AFTER DELETE ON {TABLE_EVENTS} BEGIN " +
+    "".join(
+        f"UPDATE {TABLE_ROLLUPS} SET {LABEL_COUNT} = {LABEL_COUNT} - 1, "
+        f"{LABEL_NUM_LIKES} = {LABEL_NUM_LIKES} - COALESCE(OLD.{LABEL_NUM_LIKES}, 0) "
+        f"WHERE period = {period} AND {LABEL_BOT} = OLD.{LABEL_BOT} "
+        f"AND {LABEL_EVENT} = OLD.{LABEL_EVENT} "
+        f"AND bucket = OLD.{LABEL_TIMESTAMP} - OLD.{LABEL_TIMESTAMP} % {period}; "
+        f"DELETE FROM {TABLE_ROLLUPS} WHERE period = {period} AND {LABEL_BOT} = OLD.{LABEL_BOT} "
+        f"AND {LABEL_EVENT} = OLD.{LABEL_EVENT} "
+        f"AND bucket = OLD.{LABEL_TIMESTAMP} - OLD.{LABEL_TIMESTAMP} % {period} "
+        f"AND {LABEL_COUNT} = 0; "
+        for period in ROLLUP_PERIODS_US) + "END"]
+SQL_FILL_ROLLUPS = f"""
+    INSERT INTO {TABLE_ROLLUPS}
+    SELECT ?, {LABEL_BOT}, {LABEL_EVENT}, {LABEL_TIMESTAMP} - {LABEL_TIMESTAMP} % ?, COUNT(*),
+           COALESCE(SUM({LABEL_NUM_LIKES}), 0)
+    FROM {TABLE_EVENTS}
+    GROUP BY {LABEL_BOT}, {LABEL_EVENT}, {LABEL_TIMESTAMP} - {LABEL_TIMESTAMP} % ?
+    """
+SQL_INSERT = f"INSERT INTO {TABLE_EVENTS} ({', '.join(ALL_LABELS)}) " \
+             f"VALUES ({', '.join('?' for _ in ALL_LABELS)})"
+
+
+def to_microseconds(in_timestamp) -> int:
+    """
+    Converts a datetime into microseconds since the epoch
+    """
+    return (in_timestamp - EPOCH) // ONE_MICROSECOND
+
+
+def from_microseconds(in_microseconds) -> (None, datetime.datetime):
+    """
+    Converts microseconds since the epoch into a datetime; None stays None
+    """
+    return None if in_microseconds is None else EPOCH + in_microseconds * ONE_MICROSECOND
+
+
+def to_sql_value(in_value):
+    """
+    Converts missing values (None or NaN) into None
+    """
+    return None if in_value is None or pd.isna(in_value) else in_value
+
+
+class SqliteEventStore:
+    """
+    Class that holds the bot events in a SQLite database in WAL mode.
+    It offers the same queries as EventStore, each one served by an index on
+    (bot, event, timestamp), so several processes can share the database and nothing needs to be
+    loaded in memory. The connection is shared by the threads of the process, so its writes are
+    serialized by a lock: a transaction cannot be started while another thread is in one
+    """
+
+    is_persistent = True
+
+    def __init__(self, in_sqlite_path):
+        """
+        Params:
+            in_sqlite_path: str, path of the SQLite database; created if it does not exist
+        """
+        self.source = in_sqlite_path
+        self.write_lock = threading.Lock()
+        self.connection = sqlite3.connect(str(in_sqlite_path), isolation_level=None,
+                                          check_same_thread=False)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.execute(f'PRAGMA busy_timeout={BUSY_TIMEOUT_MS}')
+        self.connection.execute(SQL_CREATE_TABLE)
+        for sql_create_index in SQL_CREATE_INDEXES:
+            self.connection.execute(sql_create_index)
+        self.create_rollups()
+
+        self.bot_locks = {}
+        self.bot_locks_lock = threading.Lock()
+
+    def __len__(self):
+        return self.count_events()
+
+    def close(self):
+        self.connection.close()
+
+    def create_rollups(self):
+        """
+        Creates the rollups table and its triggers, filling it with the events of the database
+        if it is new. Done in one transaction so that no event is missed or counted twice
+        """
+        with self.write_lock, self.connection:
+            self.connection.execute('BEGIN IMMEDIATE')
+            is_new = self.connection.execute(
+                "SELECT COUNT(*) FROM sqlite_master WHERE type = 'table' AND name = ?",
+                (TABLE_ROLLUPS,)).fetchone()[0] == 0
+            self.connection.execute(SQL_CREATE_ROLLUPS_TABLE)
+            for sql_create_trigger in SQL_CREATE_ROLLUPS_TRIGGERS:
+                self.connection.execute(sql_create_trigger)
+            if is_new:
+                for period_us in ROLLUP_PERIODS_US:
+                    self.connection.execute(SQL_FILL_ROLLUPS, (period_us, period_us, period_us))
+
+    def get_lock(self, in_bot) -> ReadWriteLock:
+        """
+        Returns the lock of the events of a bot
+        """
+        with self.bot_locks_lock:
+            if in_bot not in self.bot_locks:
+                self.bot_locks[in_bot] = ReadWriteLock()
+            return self.bot_locks[in_bot]
+
+    def query_value(self, in_sql, in_parameters=()):
+        return self.connection.execute(in_sql, in_parameters).fetchone()[0]
+
+    # -----------------------------------------------------------------------
+    # Queries
+
+    def count_events(self, in_bot=None) -> int:
+        """
+        Returns the number of events of a bot, or of all bots if 'in_bot' is None
+        """
+        if in_bot is None:
+            return self.query_value(f"SELECT COUNT(*) FROM {TABLE_EVENTS}")
+        return self.query_value(f"SELECT COUNT(*) FROM {TABLE_EVENTS} WHERE {LABEL_BOT} = ?",
+                                (in_bot,))
+
+    def get_last_timestamp(self, in_bot=None, in_event=None, in_timestamp=None):
+        """
+        Returns the timestamp of the last event <= 'in_timestamp' (or the last event if None)
+        of a bot and event; None if there is no such event
+        """
+        conditions = []
+        parameters = []
+        for label, value in ((LABEL_BOT, in_bot), (LABEL_EVENT, in_event)):
+            if value is not None:
+                conditions.append(f"{label} = ?")
+                parameters.append(value)
+        if in_timestamp is not None:
+            conditions.append(f"{LABEL_TIMESTAMP} <= ?")
+            parameters.append(to_microseconds(in_timestamp))
+        where = f" WHERE {' AND '.join(conditions)}" if conditions else ''
+        return from_microseconds(self.query_value(
+            f"SELECT MAX({LABEL_TIMESTAMP}) FROM {TABLE_EVENTS}{where}", parameters))
+
+    def count_events_since(self, in_bot, in_event, in_timestamp) -> int:
+        """
+        Returns the number of events of a bot with timestamp >= 'in_timestamp'
+        """
+        return self.query_value(
+            f"SELECT COUNT(*) FROM {TABLE_EVENTS} "
+            f"WHERE {LABEL_BOT} = ? AND {LABEL_EVENT} = ? AND {LABEL_TIMESTAMP} >= ?",
+            (in_bot, in_event, to_microseconds(in_timestamp)))
+
+    def sum_likes_since(self, in_bot, in_timestamp):
+        """
+        Returns the number of likes of a bot with timestamp >= 'in_timestamp'
+        """
+        return self.query_value(
+            f"SELECT COALESCE(SUM({LABEL_NUM_LIKES}), 0) FROM {TABLE_EVENTS} "
+            f"WHERE {LABEL_BOT} = ? AND {LABEL_EVENT} = ? AND {LABEL_TIMESTAMP} >= ?",
+            (in_bot, EVENT_LIKES, to_microseconds(in_timestamp)))
+
+    def count_events_in_last(self, in_bot, in_event, in_window, in_now=None) -> int:
+        """
+        Returns the number of events of a bot in the window ending now
+        """
+        now = datetime.datetime.now() if in_now is None else in_now
+        return self.count_events_since(in_bot, in_event, now - in_window)
+
+    def sum_likes_in_last(self, in_bot, in_window, in_now=None):
+        """
+        Returns the number of likes of a bot in the window ending now
+        """
+        now = datetime.datetime.now() if in_now is None else in_now
+        return self.sum_likes_since(in_bot, now - in_window)
+
+    def get_first_timestamp_with_more_than_cumulative_likes(self, in_bot, in_num_likes):
+        """
+        Returns the last timestamp such that the likes of the bot since then are more than
+        'in_num_likes'; None if there is no such timestamp
+        """
+        row = self.connection.execute(
+            f"SELECT {LABEL_TIMESTAMP} FROM ("
+            f"  SELECT {LABEL_TIMESTAMP}, SUM({LABEL_NUM_LIKES}) OVER ("
+            f"    ORDER BY {LABEL_TIMESTAMP} DESC, id DESC) AS cumulative_likes"
+            f"  FROM {TABLE_EVENTS} WHERE {LABEL_BOT} = ? AND {LABEL_EVENT} = ?) "
+            f"WHERE cumulative_likes > ? ORDER BY {LABEL_TIMESTAMP} DESC LIMIT 1",
+            (in_bot, EVENT_LIKES, in_num_likes)).fetchone()
+        return None if row is None else from_microseconds(row[0])
+
+    def get_first_timestamp_with_more_than_cumulative_events(self, in_bot, in_event,
+                                                             in_num_events):
+        """
+        Returns the last timestamp such that the events of type 'in_event' of the bot since then
+        are more than 'in_num_events'; None if there is no such timestamp
+        """
+        row = self.connection.execute(
+            f"SELECT {LABEL_TIMESTAMP} FROM {TABLE_EVENTS} WHERE {LABEL_BOT} = ? AND "
+            f"{LABEL_EVENT} = ? ORDER BY {LABEL_TIMESTAMP} DESC, id DESC LIMIT 1 OFFSET ?",
+            (in_bot, in_event, in_num_events)).fetchone()
+        return None if row is None else from_microseconds(row[0])
+
+    def get_rollup_buckets(self, in_bot, in_event, in_period, in_start=None, in_end=None) -> dict:
+        """
+        Returns the periods of the rollup of an event of a bot, or of all bots if 'in_bot' is
+        None, that start in ['in_start', 'in_end'), 'in_start' rounded down to its period
+
+        Returns:
+            dict, start of each period with events -> (number of events, number of likes)
+        """
+        period_us = in_period // ONE_MICROSECOND
+        conditions = ["period = ?", f"{LABEL_EVENT} = ?"]
+        parameters = [period_us, in_event]
+        if in_bot is not None:
+            conditions.append(f"{LABEL_BOT} = ?")
+            parameters.append(in_bot)
+        if in_start is not None:
+            start_us = to_microseconds(in_start)
+            conditions.append("bucket >= ?")
+            parameters.append(start_us - start_us % period_us)
+        if in_end is not None:
+            conditions.append("bucket < ?")
+            parameters.append(to_microseconds(in_end))
+        rows = self.connection.execute(
+            f"SELECT bucket, SUM({LABEL_COUNT}), SUM({LABEL_NUM_LIKES}) FROM {TABLE_ROLLUPS} "
+            f"WHERE {' AND '.join(conditions)} GROUP BY bucket", parameters).fetchall()
+        return {from_microseconds(bucket): (count, total) for bucket, count, total in rows}
+
+    def get_database(self) -> pd.DataFrame:
+        """
+        Returns all the events as a DataFrame
+        """
+        database = pd.read_sql_query(
+            f"SELECT {', '.join(ALL_LABELS)} FROM {TABLE_EVENTS} ORDER BY id", self.connection)
+        database[LABEL_TIMESTAMP] = pd.to_datetime(database[LABEL_TIMESTAMP], unit='us')
+        return database
+
+    def get_memory_usage(self) -> dict:
+        """
+        Returns the memory used by each column of the events: none, they are kept on disk
+        """
+        return {label: 0 for label in ALL_LABELS}
+
+    # -----------------------------------------------------------------------
+    # Write
+
+    def append(self, in_data):
+        """
+        Inserts an event
+
+        Params:
+            in_data: dict, event data with all the labels as keys
+        """
+        row = self.to_row(in_data)
+        with self.write_lock:
+            self.connection.execute(SQL_INSERT, row)
+
+    def append_many(self, in_data_list):
+        """
+        Inserts several events in a single transaction
+
+        Params:
+            in_data_list: list, event data dicts with all the labels as keys
+        """
+        rows = [self.to_row(data) for data in in_data_list]
+        with self.write_lock, self.connection:
+            self.connection.execute('BEGIN')
+            self.connection.executemany(SQL_INSERT, rows)
+
+    def insert_database(self, in_database) -> int:
+        """
+        Inserts all the events of a DataFrame in a single transaction
+
+        Params:
+            in_database: DataFrame, the events
+
+        Returns:
+            int, number of inserted events
+        """
+        self.append_many(in_database[ALL_LABELS].to_dict('records'))
+        return len(in_database)
+
+    def remove_before(self, in_timestamp) -> int:
+        """
+        Removes the events before the timestamp
+
+        Returns:
+            int, number of events removed
+        """
+        with self.write_lock:
+            cursor = self.connection.execute(
+                f"DELETE FROM {TABLE_EVENTS} WHERE {LABEL_TIMESTAMP} < ?",
+                (to_microseconds(in_timestamp),))
+        return cursor.rowcount
+
+    def checkpoint(self) -> bool:
+        """
+        Moves the content of the write-ahead log into the database file
+        """
+        with self.write_lock:
+            self.connection.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+        return True
+
+    @staticmethod
+    def to_row(in_data) -> tuple:
+        return tuple([to_microseconds(pd.Timestamp(in_data[LABEL_TIMESTAMP]).to_pydatetime())]
+                     + [to_sql_value(in_data[label]) for label in ALL_LABELS[1:]])
+
+
+def migrate_csv_to_sqlite(in_csv_path, in_sqlite_path) -> int:
+    """
+    Copies the events of a csv register (and of its journal, if any) into a SQLite database
+
+    Params:
+        in_csv_path: str, path of the csv with the events
+        in_sqlite_path: str, path of the SQLite database
+
+    Returns:
+        int, number of migrated events
+    """
+    database = BotEventRegister.read_database(in_csv_path).get_database()
+    store = SqliteEventStore(in_sqlite_path)
+    num_events = store.insert_database(database)
+    store.close()
+    return num_events
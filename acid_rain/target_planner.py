@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""File with the planner that sizes the targets of each bot to its remaining quota"""
+
+__author__ = "Josep-Arnau Claret"
+__email__ = "joseparnau81@gmail.com"
+
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+from acid_rain.acid_rain_constants import ONE_DAY, ONE_HOUR
+from acid_rain.insta_bot import ACTION_LIKE
+
+PLAN_HORIZON_HOURS = 30 * 24
+
+LABEL_BLOCKED_UNTIL = 'blocked_until'
+LABEL_DAY_HEADROOM = 'day_headroom'
+LABEL_HOUR_HEADROOM = 'hour_headroom'
+LABEL_CAPACITY = 'capacity'
+LABEL_ALLOTMENT = 'allotment'
+
+
+def get_action_limits(in_bot, in_action) -> dict:
+    """
+    Returns the limits of a bot for an action, read from its parameters
+
+    Params:
+        in_bot: InstaBot, the bot
+        in_action: str, ACTION_LIKE or ACTION_FOLLOW
+
+    Returns:
+        dict, maximum counts per day ('max_per_day') and per hour ('max_per_hour'), mean counts
+        per target ('counts_per_target'; likes per profile or 1 follow) and mean seconds spent
+        per target ('seconds_per_target')
+    """
+    if in_action == ACTION_LIKE:
+        counts_per_target = (in_bot.likes_min_x_profile + in_bot.likes_max_x_profile) / 2
+        seconds_between_profiles = (in_bot.likes_min_seconds_between_profiles +
+                                    in_bot.likes_max_seconds_between_profiles) / 2
+        seconds_per_like = (in_bot.likes_min_sleep_time_s + in_bot.likes_max_sleep_time_s) / 2
+        return {'max_per_day': in_bot.likes_max_per_day,
+                'max_per_hour': in_bot.likes_max_per_hour,
+                'counts_per_target': counts_per_target,
+                'seconds_per_target': seconds_between_profiles +
+                counts_per_target * seconds_per_like}
+    seconds_between_profiles = (in_bot.follows_min_seconds_between_profiles +
+                                in_bot.follows_max_seconds_between_profiles) / 2
+    return {'max_per_day': in_bot.follows_max_per_day,
+            'max_per_hour': in_bot.follows_max_per_hour,
+            'counts_per_target': 1,
+            'seconds_per_target': seconds_between_profiles}
+
+
+def get_headroom(in_bot, in_action, in_now=None) -> dict:
+    """
+    Returns the remaining quota and the block state of a bot, read from its event register
+
+    Params:
+        in_bot: InstaBot, the bot
+        in_action: str, ACTION_LIKE or ACTION_FOLLOW
+        in_now: datetime, the current time; if None, now
+
+    Returns:
+        dict, counts left in the last day (LABEL_DAY_HEADROOM) and hour (LABEL_HOUR_HEADROOM),
+        and the end of the wait after the last block (LABEL_BLOCKED_UNTIL), None if not blocked
+    """
+    now = datetime.now() if in_now is None else in_now
+    limits = get_action_limits(in_bot, in_action)
+    register = in_bot.event_register
+    if in_action == ACTION_LIKE:
+        counts_day = register.get_number_of_likes_since(in_bot.name, now - ONE_DAY)
+        counts_hour = register.get_number_of_likes_since(in_bot.name, now - ONE_HOUR)
+    else:
+        counts_day = register.get_number_of_follows_since(in_bot.name, now - ONE_DAY)
+        counts_hour = register.get_number_of_follows_since(in_bot.name, now - ONE_HOUR)
+
+    blocked_until = None
+    last_block_timestamp = register.get_last_block_timestamp(in_bot.name)
+    if last_block_timestamp is not None:
+        blocked_until = last_block_timestamp + timedelta(0, 3600 * in_bot.wait_after_block_hours)
+        if blocked_until <= now:
+            blocked_until = None
+
+    return {LABEL_DAY_HEADROOM: max(0, limits['max_per_day'] - counts_day),
+            LABEL_HOUR_HEADROOM: max(0, limits['max_per_hour'] - counts_hour),
+            LABEL_BLOCKED_UNTIL: blocked_until}
+
+
+def project_targets(in_limits, in_headroom, in_hours, in_now=None) -> list:
+    """
+    Projects the targets a bot can process in each of the next hours: none while it is blocked,
+    and as many as its hourly limit, its pace and what is left of its daily limit allow. The
+    daily limit is renewed every 24 hours
+
+    Params:
+        in_limits: dict, limits of the bot for the action (see get_action_limits)
+        in_headroom: dict, headroom of the bot for the action (see get_headroom)
+        in_hours: int, number of hours
+        in_now: datetime, the current time; if None, now
+
+    Returns:
+        list, number of targets of each hour
+    """
+    now = datetime.now() if in_now is None else in_now
+    blocked_until = in_headroom[LABEL_BLOCKED_UNTIL]
+    # Without any wait between the targets, only the hourly limit bounds the pace
+    counts_per_hour = in_limits['max_per_hour']
+    if in_limits['seconds_per_target'] > 0:
+        counts_per_hour = min(counts_per_hour, 3600 / in_limits['seconds_per_target'] *
+                              in_limits['counts_per_target'])
+    day_left = in_headroom[LABEL_DAY_HEADROOM]
+    targets = []
+    for hour in range(in_hours):
+        if hour > 0 and hour % 24 == 0:
+            day_left = in_limits['max_per_day']
+        if blocked_until is not None and now + timedelta(0, 3600 * (hour + 1)) <= blocked_until:
+            targets.append(0)
+            continue
+        counts = min(counts_per_hour, day_left)
+        if hour == 0:
+            counts = min(counts, in_headroom[LABEL_HOUR_HEADROOM])
+        day_left -= counts
+        targets.append(counts / in_limits['counts_per_target'])
+    return targets
+
+
+def plan_targets(in_bots, in_num_targets, in_run_hours, in_now=None) -> tuple:
+    """
+    Sizes the targets of each bot and action to what the bot can process in the run, given its
+    remaining quota and block state, and projects when the fleet completes all the targets.
+    Each action is planned on its own, as if the bots only did that action
+
+    Params:
+        in_bots: list, the bots (InstaBot)
+        in_num_targets: dict, number of targets of each action
+        in_run_hours: float, duration of the run in hours
+        in_now: datetime, the current time; if None, now
+
+    Returns:
+        tuple, a DataFrame with the headroom, capacity in the run (LABEL_CAPACITY) and allotment
+        (LABEL_ALLOTMENT) of each bot (index) and action, and a dict with the projected completion
+        time of each action, None if it is after PLAN_HORIZON_HOURS
+    """
+    now = datetime.now() if in_now is None else in_now
+    run_hours = int(round(in_run_hours))
+    rows = []
+    completion_times = {}
+    for action, num_targets in in_num_targets.items():
+        projections = {}
+        for bot in in_bots:
+            headroom = get_headroom(bot, action, now)
+            projections[bot.name] = project_targets(get_action_limits(bot, action), headroom,
+                                                    PLAN_HORIZON_HOURS, now)
+            rows.append(dict(headroom, bot=bot.name, action=action,
+                             capacity=int(sum(projections[bot.name][:run_hours]))))
+
+        # Fleet completion: first hour at which the targets processed add up to all of them
+        completion_times[action] = None
+        num_processed = 0
+        for hour in range(PLAN_HORIZON_HOURS):
+            num_processed += sum(projection[hour] for projection in projections.values())
+            if num_processed >= num_targets:
+                completion_times[action] = now + timedelta(0, 3600 * (hour + 1))
+                break
+
+    plan = pd.DataFrame(rows)
+    plan[LABEL_ALLOTMENT] = 0
+    for action, num_targets in in_num_targets.items():
+        is_action = plan['action'] == action
+        capacities = plan.loc[is_action, LABEL_CAPACITY]
+        total_capacity = capacities.sum()
+        if total_capacity <= num_targets:
+            plan.loc[is_action, LABEL_ALLOTMENT] = capacities
+            continue
+        # Share the targets in proportion to the capacities, rounding by the largest remainders
+        shares = capacities * num_targets / total_capacity
+        allotments = shares.astype(int)
+        remainder = num_targets - allotments.sum()
+        for index in (shares - allotments).sort_values(ascending=False).index[:remainder]:
+            allotments[index] += 1
+        plan.loc[is_action, LABEL_ALLOTMENT] = allotments
+    return plan.set_index(['bot', 'action']), completion_times
@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""File with the queue of target profiles shared by the bots"""
+
+__author__ = "Josep-Arnau Claret"
+__email__ = "joseparnau81@gmail.com"
+
+from collections import deque
+import threading
+
+DEFAULT_BATCH_SIZE = 10
+
+
+class TargetQueue:
+    """
+    Class that hands out the target profiles of each action (e.g. like or follow) to several bots.
+    Each bot takes its targets from a local batch, refilled from the shared pool; when the pool is
+    empty, it steals half of the largest batch of another bot. Bots that are blocked or stop
+    release their batches back to the pool, so no target is stuck with a bot that cannot act.
+    A bot can be given an allotment of targets of an action (see set_allotment), which reserves
+    them for it: the other bots with allotments only get the targets not reserved, so once a bot
+    uses up its allotment it goes on with the targets left over. A bot that releases its batches
+    also gives up its reservation, so the other bots take over its targets.
+    The pool of each action is the initial list of targets, which is never modified, with a cursor
+    to the next one, plus the released targets, handed out first; so the state of the queue (see
+    get_state) is small and cheap to checkpoint
+    """
+
+    def __init__(self, in_targets, in_batch_size=DEFAULT_BATCH_SIZE):
+        """
+        Params:
+            in_targets: dict, iterable of target urls of each action
+            in_batch_size: int, number of targets a bot takes from the pool at once
+        """
+        self.batch_size = in_batch_size
+        self.lock = threading.Lock()
+        self.targets = {action: list(targets) for action, targets in in_targets.items()}
+        self.cursors = {action: 0 for action in self.targets}
+        # Action -> targets released by the bots, in front of the pool
+        self.pools = {action: deque() for action in self.targets}
+        # Bot -> action -> targets taken from the pool and not handed out yet
+        self.batches = {}
+        # Bot -> action -> number of targets reserved for the bot; negative once it got more
+        self.allotments = {}
+
+    def __len__(self):
+        with self.lock:
+            return sum(self.count_targets(action) for action in self.pools)
+
+    def count_targets(self, in_action) -> int:
+        """
+        Returns the number of targets of an action not handed out yet. The lock must be held
+        """
+        return self.count_pool_targets(in_action) + \
+            sum(len(bot_batches.get(in_action, ())) for bot_batches in self.batches.values())
+
+    def count_pool_targets(self, in_action) -> int:
+        """
+        Returns the number of targets of an action in the pool. The lock must be held
+        """
+        return len(self.pools[in_action]) + len(self.targets[in_action]) - self.cursors[in_action]
+
+    def count_available(self, in_bot, in_action):
+        """
+        Returns the number of targets of an action that a bot with an allotment can take, those
+        not handed out yet and not reserved for the other bots; None if the bot has no allotment.
+        The lock must be held
+        """
+        if self.allotments.get(in_bot, {}).get(in_action) is None:
+            return None
+        num_reserved = sum(max(0, bot_allotments.get(in_action) or 0)
+                           for bot, bot_allotments in self.allotments.items() if bot != in_bot)
+        return self.count_targets(in_action) - num_reserved
+
+    def take_pool_target(self, in_action):
+        """
+        Removes and returns the next target of an action in the pool, released targets first.
+        The lock must be held and the pool not be empty
+        """
+        if len(self.pools[in_action]) > 0:
+            return self.pools[in_action].popleft()
+        self.cursors[in_action] += 1
+        return self.targets[in_action][self.cursors[in_action] - 1]
+
+    def get_num_targets(self, in_action) -> int:
+        """
+        Returns the number of targets of an action not handed out yet, in the pool and in the bot
+        batches
+        """
+        with self.lock:
+            return self.count_targets(in_action)
+
+    def set_allotment(self, in_bot, in_action, in_num_targets):
+        """
+        Reserves a number of targets of an action for a bot from now on, and limits the bot to
+        them and to the targets not reserved for the other bots
+
+        Params:
+            in_bot: str, name of the bot
+            in_action: str, the action
+            in_num_targets: int, number of targets; None removes the allotment and the limit
+        """
+        with self.lock:
+            bot_allotments = self.allotments.setdefault(in_bot, {})
+            if in_num_targets is None:
+                bot_allotments.pop(in_action, None)
+            else:
+                bot_allotments[in_action] = in_num_targets
+
+    def get_allotment(self, in_bot, in_action):
+        """
+        Returns the number of targets of an action still reserved for a bot, negative if it got
+        more targets than its allotment; None if it is not limited
+        """
+        with self.lock:
+            return self.allotments.get(in_bot, {}).get(in_action)
+
+    def has_targets(self, in_action, in_bot=None) -> bool:
+        """
+        Returns whether there are targets of an action not handed out yet and, if a bot is given,
+        whether it can get one: from its batch, or not reserved for the other bots
+        """
+        with self.lock:
+            if len(self.batches.get(in_bot, {}).get(in_action, ())) > 0:
+                return True
+            num_available = self.count_available(in_bot, in_action)
+            if num_available is not None and num_available <= 0:
+                return False
+            return self.count_targets(in_action) > 0
+
+    def get(self, in_bot, in_action):
+        """
+        Hands out the next target of an action to a bot
+
+        Params:
+            in_bot: str, name of the bot
+            in_action: str, the action
+
+        Returns:
+            str or None, url of the target, None if there are no targets left or they are all
+            reserved for other bots
+        """
+        with self.lock:
+            batch = self.batches.setdefault(in_bot, {}).setdefault(in_action, deque())
+            if len(batch) == 0:
+                num_available = self.count_available(in_bot, in_action)
+                if num_available is not None and num_available <= 0:
+                    return None
+                self.refill(in_bot, in_action, batch, num_available)
+            if len(batch) == 0:
+                return None
+            allotment = self.allotments.get(in_bot, {}).get(in_action)
+            if allotment is not None:
+                self.allotments[in_bot][in_action] = allotment - 1
+            return batch.popleft()
+
+    def refill(self, in_bot, in_action, in_batch, in_num_available=None):
+        """
+        Fills an empty batch of a bot from the pool, with no more targets than it can take (see
+        count_available), or, if the pool is empty, with half of the largest batch of another
+        bot. The lock must be held
+        """
+        num_pool_targets = self.count_pool_targets(in_action)
+        if num_pool_targets > 0:
+            batch_size = self.batch_size if in_num_available is None \
+                else min(self.batch_size, in_num_available)
+            for _ in range(min(batch_size, num_pool_targets)):
+                in_batch.append(self.take_pool_target(in_action))
+            return
+
+        victim_batch = max((bot_batches.get(in_action, deque())
+                            for bot, bot_batches in self.batches.items() if bot != in_bot),
+                           key=len, default=deque())
+        # The victim keeps the first half, which it would act on first
+        num_stolen = (len(victim_batch) + 1) // 2
+        if in_num_available is not None:
+            num_stolen = min(num_stolen, in_num_available)
+        for _ in range(num_stolen):
+            in_batch.appendleft(victim_batch.pop())
+
+    def put_back(self, in_bot, in_action, in_target):
+        """
+        Returns a target handed out to a bot to the front of its batch, e.g. when it could not
+        act on it yet. The target does not count in the allotment of the bot
+        """
+        with self.lock:
+            bot_allotments = self.allotments.get(in_bot, {})
+            if bot_allotments.get(in_action) is not None:
+                bot_allotments[in_action] += 1
+            self.batches.setdefault(in_bot, {}).setdefault(in_action, deque()).appendleft(in_target)
+
+    def iterate(self, in_bot, in_action):
+        """
+        Yields the targets of an action handed out to a bot until there are none left
+        """
+        while True:
+            target = self.get(in_bot, in_action)
+            if target is None:
+                return
+            yield target
+
+    def release(self, in_bot) -> int:
+        """
+        Returns the targets of the batches of a bot to the front of the pools, e.g. when it is
+        blocked or stops, and gives up the targets reserved for it, so that the other bots go on
+        with them. The bot keeps its allotments, used up: it only gets the targets left over
+
+        Returns:
+            int, number of released targets
+        """
+        with self.lock:
+            bot_allotments = self.allotments.get(in_bot, {})
+            for action, allotment in bot_allotments.items():
+                if allotment is not None:
+                    bot_allotments[action] = min(0, allotment)
+            num_released = 0
+            for action, batch in self.batches.pop(in_bot, {}).items():
+                self.pools[action].extendleft(reversed(batch))
+                num_released += len(batch)
+            return num_released
+
+    def get_state(self) -> dict:
+        """
+        Returns what the queue has handed out: the cursors of the pools, the released targets,
+        the batches and the allotments. Together with the initial targets, it rebuilds the queue
+        (see set_state)
+        """
+        with self.lock:
+            return {'cursors': dict(self.cursors),
+                    'released': {action: list(pool) for action, pool in self.pools.items()},
+                    'batches': {bot: {action: list(batch) for action, batch in bot_batches.items()}
+                                for bot, bot_batches in self.batches.items()},
+                    'allotments': {bot: dict(bot_allotments)
+                                   for bot, bot_allotments in self.allotments.items()}}
+
+    def set_state(self, in_state):
+        """
+        Restores a state returned by get_state on a queue with the same initial targets
+        """
+        with self.lock:
+            self.cursors = dict(in_state['cursors'])
+            self.pools = {action: deque(in_state['released'].get(action, ()))
+                          for action in self.targets}
+            self.batches = {bot: {action: deque(batch) for action, batch in bot_batches.items()}
+                            for bot, bot_batches in in_state['batches'].items()}
+            self.allotments = {bot: dict(bot_allotments)
+                               for bot, bot_allotments in in_state['allotments'].items()}
@@ -0,0 +1,37 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+a program that converts the bot events database between csv and the binary columnar format
+
+@author: Josep-Arnau Claret
+"""
+
+import os
+from pathlib import Path
+import sys
+
+ROOTDIR = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.append(ROOTDIR)
+
+from acid_rain.bot_event_register import COLUMNAR_SUFFIX
+from acid_rain.columnar_event_file import convert_csv_to_columnar, convert_columnar_to_csv
+
+
+def main():
+
+    input_file_path = Path(ROOTDIR) / 'data/bot_register_event_db.csv'
+    output_file_path = Path(ROOTDIR) / ('data/bot_register_event_db' + COLUMNAR_SUFFIX)
+
+    if len(sys.argv) == 3:
+        input_file_path = Path(sys.argv[1])
+        output_file_path = Path(sys.argv[2])
+
+    if input_file_path.suffix == COLUMNAR_SUFFIX:
+        num_events = convert_columnar_to_csv(input_file_path, output_file_path)
+    else:
+        num_events = convert_csv_to_columnar(input_file_path, output_file_path)
+    print('Converted {} events: {} -> {}'.format(num_events, input_file_path, output_file_path))
+
+
+if __name__ == "__main__":
+    main()
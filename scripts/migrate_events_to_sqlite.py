@@ -0,0 +1,34 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+a program that migrates the bot events csv database to SQLite
+
+@author: Josep-Arnau Claret
+"""
+
+import os
+from pathlib import Path
+import sys
+
+ROOTDIR = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.append(ROOTDIR)
+
+from acid_rain.sqlite_event_store import migrate_csv_to_sqlite
+
+
+def main():
+
+    bot_events_csv_file_path = Path(ROOTDIR) / 'data/bot_register_event_db.csv'
+    bot_events_sqlite_file_path = Path(ROOTDIR) / 'data/bot_register_event_db.sqlite'
+
+    if len(sys.argv) == 3:
+        bot_events_csv_file_path = Path(sys.argv[1])
+        bot_events_sqlite_file_path = Path(sys.argv[2])
+
+    num_events = migrate_csv_to_sqlite(bot_events_csv_file_path, bot_events_sqlite_file_path)
+    print('Migrated {} events: {} -> {}'.format(num_events, bot_events_csv_file_path,
+                                                bot_events_sqlite_file_path))
+
+
+if __name__ == "__main__":
+    main()
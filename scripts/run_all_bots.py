@@ -22,6 +22,11 @@ def main():
 
     # Log folder
     log_folder = Path(ROOTDIR) / 'logs'
+    # Checkpoint folder, to resume the run if it crashes
+    checkpoint_folder = Path(ROOTDIR) / 'data/checkpoints'
+    resume = False
+    # Run the bots in an asyncio event loop instead of one thread per bot
+    use_asyncio = False
 
     # # TEST
     # test = True
@@ -51,7 +56,8 @@ def main():
                            excluded_profiles_file,
                            bot_events_database_file_path,
                            test,
-                           in_log_folder=log_folder)
+                           in_log_folder=log_folder,
+                           in_checkpoint_folder=checkpoint_folder)
 
     run_num_profiles_likes = 800
     run_num_profiles_follows = 800
@@ -111,7 +117,10 @@ def main():
         bot_master.follows_max_seconds_between_profiles = 10  # 5 min
 
     # Run
-    bot_master.run(run_num_profiles_likes, run_num_profiles_follows)
+    if use_asyncio:
+        bot_master.run_async(run_num_profiles_likes, run_num_profiles_follows, in_resume=resume)
+    else:
+        bot_master.run(run_num_profiles_likes, run_num_profiles_follows, in_resume=resume)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+a program that serves the bot events database to bots running in other processes
+
+@author: Josep-Arnau Claret
+"""
+
+import os
+from pathlib import Path
+import sys
+
+ROOTDIR = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.append(ROOTDIR)
+
+from acid_rain.bot_event_register import BotEventRegister
+from acid_rain.event_store_server import EventStoreServer
+
+DEFAULT_ADDRESS = 'tcp://127.0.0.1:8765'
+
+
+def main():
+
+    bot_events_file_path = Path(ROOTDIR) / 'data/bot_register_event_db.csv'
+    address = DEFAULT_ADDRESS
+
+    if len(sys.argv) == 3:
+        bot_events_file_path = Path(sys.argv[1])
+        address = sys.argv[2]
+
+    register = BotEventRegister(bot_events_file_path, in_journal_on=True, in_write_behind_on=True)
+    server = EventStoreServer(register, address)
+    print('Serving {} at {}'.format(bot_events_file_path, server.address))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+        register.compact()
+        register.close()
+
+
+if __name__ == "__main__":
+    main()
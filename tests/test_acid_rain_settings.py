@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# pylint: disable=missing-function-docstring, C0103
+
+__author__ = "Josep-Arnau Claret"
+__email__ = "joseparnau81@gmail.com"
+
+import unittest
+
+import threading
+import time
+
+from acid_rain.acid_rain_settings import InstrumentedRLock, LOCK_HISTOGRAM_BOUNDS, ReadWriteLock
+
+
+class TestReadWriteLockMethods(unittest.TestCase):
+
+    def setUp(self):
+        self.lock = ReadWriteLock()
+
+    def test_readers_in_parallel(self):
+        num_readers = 4
+        barrier = threading.Barrier(num_readers, timeout=5)
+
+        def read():
+            with self.lock.read():
+                barrier.wait()  # Fails unless all readers hold the lock at the same time
+
+        threads = [threading.Thread(target=read) for _ in range(num_readers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertFalse(barrier.broken)
+
+    def test_writer_excludes_readers(self):
+        events = []
+        writer_holds_lock = threading.Event()
+
+        def read():
+            writer_holds_lock.wait()
+            with self.lock.read():
+                events.append('read')
+
+        reader = threading.Thread(target=read)
+        reader.start()
+        with self.lock.write():
+            self.assertTrue(self.lock.acquired)
+            self.assertEqual(self.lock.owner, threading.get_ident())
+            writer_holds_lock.set()
+            reader.join(0.1)
+            self.assertTrue(reader.is_alive())
+            events.append('write')
+        reader.join()
+        self.assertEqual(events, ['write', 'read'])
+        self.assertFalse(self.lock.acquired)
+
+    def test_writer_reentrant(self):
+        with self.lock.write():
+            with self.lock.read():
+                with self.lock.write():
+                    self.assertTrue(self.lock.acquired)
+            self.assertTrue(self.lock.acquired)
+        self.assertFalse(self.lock.acquired)
+    def test_call_site_histograms(self):
+        with self.lock.read('a_reader'):
+            pass
+        with self.lock.write('a_writer'):
+            pass
+        with self.lock.write('a_writer'):
+            pass
+        histograms = self.lock.statistics.get_histograms()
+        self.assertEqual(set(histograms), {'a_reader', 'a_writer'})
+        self.assertEqual(sum(histograms['a_reader']['wait']), 1)
+        self.assertEqual(sum(histograms['a_writer']['hold']), 2)
+
+
+class TestInstrumentedRLockMethods(unittest.TestCase):
+
+    def setUp(self):
+        self.lock = InstrumentedRLock()
+
+    def test_owner_and_reentrance(self):
+        self.assertFalse(self.lock.acquired)
+        self.assertIsNone(self.lock.owner)
+        with self.lock.using('a_site'):
+            with self.lock:
+                self.assertTrue(self.lock.acquired)
+                self.assertEqual(self.lock.owner, threading.get_ident())
+            self.assertTrue(self.lock.acquired)
+        self.assertFalse(self.lock.acquired)
+        self.assertIsNone(self.lock.owner)
+        # The reentrant acquisition is accounted to the outer call site
+        histograms = self.lock.statistics.get_histograms()
+        self.assertEqual(list(histograms), ['a_site'])
+        self.assertEqual(len(histograms['a_site']['wait']), len(LOCK_HISTOGRAM_BOUNDS) + 1)
+        self.assertEqual(sum(histograms['a_site']['hold']), 1)
+
+    def test_wait_histogram(self):
+        lock_held = threading.Event()
+
+        def hold():
+            with self.lock.using('a_holder'):
+                lock_held.set()
+                time.sleep(0.05)
+
+        holder = threading.Thread(target=hold)
+        holder.start()
+        lock_held.wait()
+        self.assertFalse(self.lock.acquire(blocking=False, in_call_site='a_waiter'))
+        with self.lock.using('a_waiter'):
+            self.assertEqual(self.lock.owner, threading.get_ident())
+        holder.join()
+        histograms = self.lock.statistics.get_histograms()
+        # The waiter waited ~50ms and the holder held the lock for the same time
+        self.assertEqual(histograms['a_waiter']['wait'][-4], 1)
+        self.assertEqual(histograms['a_holder']['hold'][-4], 1)
+
+    def test_release_not_owned(self):
+        with self.assertRaises(RuntimeError):
+            self.lock.release()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -10,10 +10,17 @@ import unittest
 import datetime
 import os
 from pathlib import Path
+import shutil
 import tempfile
+import threading
+import time
+from unittest.mock import patch
 
+from acid_rain.acid_rain_constants import ONE_DAY, ONE_HOUR
 from acid_rain.bot_event_register import BotEventRegister, EVENT_LOGIN, EVENT_LIKES, EVENT_FOLLOW, \
-    EVENT_EXCEPTION, EVENT_BLOCK
+    EVENT_EXCEPTION, EVENT_BLOCK, ALL_LABELS, LABEL_TIMESTAMP, LABEL_BOT, LABEL_EVENT, \
+    LABEL_USERNAME, LABEL_NUM_LIKES, LABEL_COMMENTS, LABEL_COUNT
+from acid_rain.event_index import RollingCounter
 
 
 class TestBotEventRegisterMethods(unittest.TestCase):
@@ -33,6 +40,103 @@ class TestBotEventRegisterMethods(unittest.TestCase):
             self.assertEqual(self.register.get_number_of_events(),
                              register_tmp.get_number_of_events())
 
+    def test_read_events_file(self):
+        # The trailing comma of the csv header does not add an 'Unnamed: 6' column
+        database = BotEventRegister.read_events_file(self.test_csv)
+        self.assertEqual(list(database.columns), ALL_LABELS)
+        self.assertEqual(list(self.register.database.columns), ALL_LABELS)
+
+    def test_save_book_with_journal(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            csv_path = Path(temp_dir) / 'events.csv'
+            shutil.copy(self.test_csv, csv_path)
+            journal_path = BotEventRegister.get_journal_path(csv_path)
+            register = BotEventRegister(csv_path, in_journal_on=True)
+
+            self.assertTrue(register.add_event('a_bot', EVENT_LOGIN))
+            self.assertTrue(register.save())
+            self.assertTrue(register.add_event('a_bot', EVENT_LIKES, 'a_user', 2))
+            self.assertTrue(register.add_event('a_bot', EVENT_FOLLOW, 'a_user'))
+            self.assertTrue(register.save())
+            self.assertTrue(register.save())
+            self.assertTrue(os.path.isfile(journal_path))
+            self.assertEqual(register.get_store().num_journaled, 3)
+
+            register_replayed = BotEventRegister(csv_path)
+            self.assertEqual(register_replayed.get_number_of_events(), 3)
+            self.assertEqual(register_replayed.get_number_of_likes_since(
+                'a_bot', datetime.datetime.now() - datetime.timedelta(1)), 2)
+
+            self.assertTrue(register.compact())
+            self.assertFalse(os.path.isfile(journal_path))
+            self.assertEqual(BotEventRegister(csv_path).get_number_of_events(), 3)
+
+            # Removing events forces a compaction
+            self.assertTrue(register.add_event('a_bot', EVENT_LOGIN))
+            self.assertTrue(register.save())
+            self.assertEqual(register.remove_events_before(datetime.datetime.now()), 4)
+            self.assertTrue(register.save())
+            self.assertFalse(os.path.isfile(journal_path))
+            self.assertEqual(BotEventRegister(csv_path).get_number_of_events(), 0)
+
+    def test_save_book_write_behind(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            csv_path = Path(temp_dir) / 'events.csv'
+            shutil.copy(self.test_csv, csv_path)
+            journal_path = BotEventRegister.get_journal_path(csv_path)
+            register = BotEventRegister(csv_path, in_journal_on=True, in_write_behind_on=True)
+
+            # Saves are coalesced until the writer delay expires
+            register.writer.delay = 60.
+            self.assertTrue(register.add_event('a_bot', EVENT_LOGIN))
+            self.assertTrue(register.save())
+            self.assertTrue(register.add_event('a_bot', EVENT_LIKES, 'a_user', 2))
+            self.assertTrue(register.save())
+            self.assertFalse(os.path.isfile(journal_path))
+            self.assertTrue(register.flush())
+            self.assertEqual(BotEventRegister(csv_path).get_number_of_events(), 2)
+
+            # The writer writes on its own once the delay expires
+            register.writer.delay = 0.
+            self.assertTrue(register.add_event('a_bot', EVENT_FOLLOW, 'a_user'))
+            self.assertTrue(register.save())
+            for _ in range(100):
+                if register.get_store().num_journaled == 3:
+                    break
+                time.sleep(0.01)
+            self.assertEqual(BotEventRegister(csv_path).get_number_of_events(), 3)
+
+            register.writer.delay = 60.
+            self.assertTrue(register.add_event('a_bot', EVENT_LOGIN))
+            self.assertTrue(register.save())
+            self.assertTrue(register.close())
+            self.assertFalse(register.writer.thread.is_alive())
+            self.assertEqual(BotEventRegister(csv_path).get_number_of_events(), 4)
+
+    def test_shared_write_behind(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            csv_path = Path(temp_dir) / 'events.csv'
+            shutil.copy(self.test_csv, csv_path)
+            register = BotEventRegister(csv_path, in_journal_on=True, in_write_behind_on=True)
+            # The registers of the same store and csv share one writer, another store has its own
+            with patch.object(BotEventRegister, 'get_store', return_value=register.get_store()):
+                register_2 = BotEventRegister(csv_path, in_journal_on=True,
+                                              in_write_behind_on=True)
+            self.assertIs(register_2.writer, register.writer)
+            register_3 = BotEventRegister(csv_path, in_journal_on=True, in_write_behind_on=True)
+            self.assertIsNot(register_3.writer, register.writer)
+            self.assertTrue(register_3.close())
+
+            # The writer writes the pending events of a closed register and stops with the last
+            register.writer.delay = 60.
+            self.assertTrue(register.add_event('a_bot', EVENT_LOGIN))
+            self.assertTrue(register.save())
+            self.assertTrue(register.close())
+            self.assertTrue(register.writer.thread.is_alive())
+            self.assertEqual(BotEventRegister(csv_path).get_number_of_events(), 1)
+            self.assertTrue(register_2.close())
+            self.assertFalse(register.writer.thread.is_alive())
+
     def test_do_book_backup(self):
         with tempfile.TemporaryDirectory() as temp_dir:
             self.assertTrue(self.register.add_event('a_bot', EVENT_LOGIN))
@@ -132,6 +236,33 @@ class TestBotEventRegisterMethods(unittest.TestCase):
         self.assertEqual(self.register.get_number_of_likes_since('a_bot', timestamp_01), 11)
         self.assertEqual(self.register.get_number_of_likes_since('a_bot_2', timestamp_01), 5)
 
+    def test_get_number_in_last(self):
+        now = datetime.datetime.now()
+        self.assertTrue(self.register.add_event('a_bot', EVENT_LIKES, 'a_user_1', 1,
+                                                in_timestamp=now - datetime.timedelta(2)))
+        self.assertTrue(self.register.add_event('a_bot', EVENT_LIKES, 'a_user_2', 2,
+                                                in_timestamp=now - datetime.timedelta(0, 7200)))
+        self.assertTrue(self.register.add_event('a_bot', EVENT_LIKES, 'a_user_3', 3))
+        self.assertTrue(self.register.add_event('a_bot_2', EVENT_LIKES, 'a_user_3', 4))
+        self.assertTrue(self.register.add_event('a_bot', EVENT_FOLLOW, 'a_user_4',
+                                                in_timestamp=now - datetime.timedelta(0, 7200)))
+        self.assertTrue(self.register.add_event('a_bot', EVENT_FOLLOW, 'a_user_5'))
+
+        self.assertEqual(self.register.get_number_of_likes_in_last('a_bot', ONE_HOUR), 3)
+        self.assertEqual(self.register.get_number_of_likes_in_last('a_bot', ONE_DAY), 5)
+        self.assertEqual(self.register.get_number_of_likes_in_last('a_bot', 3 * ONE_DAY), 6)
+        self.assertEqual(self.register.get_number_of_follows_in_last('a_bot', ONE_HOUR), 1)
+        self.assertEqual(self.register.get_number_of_follows_in_last('a_bot', ONE_DAY), 2)
+        self.assertEqual(self.register.get_number_of_follows_in_last('another_bot', ONE_DAY), 0)
+
+        # Counters are rebuilt from the saved events
+        with tempfile.NamedTemporaryFile() as temp_file:
+            self.register.save(temp_file.name)
+            register_tmp = BotEventRegister(in_csv_path=temp_file.name)
+            self.assertEqual(register_tmp.get_number_of_likes_in_last('a_bot', ONE_HOUR), 3)
+            self.assertEqual(register_tmp.get_number_of_likes_in_last('a_bot', ONE_DAY), 5)
+            self.assertEqual(register_tmp.get_number_of_follows_in_last('a_bot', ONE_DAY), 2)
+
     def test_get_first_timestamp_with_more_than_cumulative_likes(self):
         self.assertTrue(self.register.add_event('a_bot', EVENT_LOGIN))
         self.assertTrue(self.register.add_event('a_bot', EVENT_LIKES, 'a_user_1', 1))
@@ -166,6 +297,30 @@ class TestBotEventRegisterMethods(unittest.TestCase):
                                                                                            15),
                          timestamp_0)
 
+    def test_get_first_timestamp_with_more_than_cumulative_likes_after_removal(self):
+        now = datetime.datetime.now().replace(hour=12, minute=0, second=0, microsecond=0)
+        timestamps = [now - datetime.timedelta(i_day, 60 * i_event)
+                      for i_day in range(3, -1, -1) for i_event in range(2, -1, -1)]
+        for i_event, timestamp in enumerate(timestamps):
+            self.assertTrue(self.register.add_event('a_bot', EVENT_LIKES, 'a_user', i_event % 3,
+                                                    in_timestamp=timestamp))
+            self.assertTrue(self.register.add_event('a_bot', EVENT_LOGIN, in_timestamp=timestamp))
+        # Likes per day, from the newest: 3, 3, 3, 3
+        self.assertEqual(self.register.get_first_timestamp_with_more_than_cumulative_likes(
+            'a_bot', 3), timestamps[8])
+        self.assertEqual(self.register.get_first_timestamp_with_more_than_cumulative_likes(
+            'a_bot', 5), timestamps[7])
+        self.assertEqual(self.register.get_first_timestamp_with_more_than_cumulative_likes(
+            'a_bot', 11), timestamps[1])
+
+        self.assertEqual(self.register.remove_events_before(timestamps[4]), 8)
+        self.assertEqual(self.register.get_first_timestamp_with_more_than_cumulative_likes(
+            'a_bot', 6), timestamps[5])
+        self.assertEqual(self.register.get_first_timestamp_with_more_than_cumulative_likes(
+            'a_bot', 8), timestamps[4])
+        self.assertIsNone(self.register.get_first_timestamp_with_more_than_cumulative_likes(
+            'a_bot', 9))
+
     # -----------------------------------------------------------------------
     # Write
 
@@ -240,6 +395,228 @@ class TestBotEventRegisterMethods(unittest.TestCase):
         self.assertEqual(self.register.get_number_of_events('a_bot'), 5)
         self.assertEqual(self.register.get_number_of_events('another_bot'), 0)
 
+    def test_remove_events_before_drops_segments(self):
+        now = datetime.datetime.now().replace(hour=12, minute=0, second=0, microsecond=0)
+        for i_day in range(5, -1, -1):
+            self.assertTrue(self.register.add_event('a_bot', EVENT_LIKES, 'a_user', 1,
+                                                    in_timestamp=now - datetime.timedelta(i_day)))
+            self.assertTrue(self.register.add_event('a_bot', EVENT_FOLLOW, 'a_user',
+                                                    in_timestamp=now - datetime.timedelta(i_day)))
+        shard = self.register.get_store().get_shard('a_bot')
+        self.assertEqual(len(shard.days), 6)
+        self.assertEqual(self.register.get_number_of_likes_since(
+            'a_bot', now - datetime.timedelta(2, 1)), 3)
+        self.assertEqual(self.register.get_event_timestamp(
+            'a_bot', now - datetime.timedelta(2, 1)), now - datetime.timedelta(3))
+
+        self.assertEqual(self.register.remove_events_before(now - datetime.timedelta(2, 1)), 6)
+        self.assertEqual(len(shard.days), 3)
+        self.assertEqual(self.register.get_number_of_events('a_bot'), 6)
+        self.assertEqual(self.register.get_number_of_follows_since(
+            'a_bot', now - datetime.timedelta(10)), 3)
+        self.assertIsNone(self.register.get_event_timestamp(
+            'a_bot', now - datetime.timedelta(2, 1)))
+
+    def test_add_events(self):
+        now = datetime.datetime.now()
+        events = [{LABEL_BOT: 'a_bot', LABEL_EVENT: EVENT_LIKES, LABEL_USERNAME: 'a_user',
+                   LABEL_NUM_LIKES: 3},
+                  {LABEL_BOT: 'a_bot', LABEL_EVENT: EVENT_EXCEPTION, LABEL_COMMENTS: 'like'},
+                  {LABEL_BOT: 'a_bot', LABEL_EVENT: EVENT_BLOCK, LABEL_COMMENTS: 'like',
+                   LABEL_TIMESTAMP: now}]
+        self.assertTrue(self.register.add_events(events))
+        self.assertTrue(self.register.add_events([]))
+        self.assertEqual(self.register.get_number_of_events('a_bot'), 3)
+        self.assertEqual(self.register.get_last_block_timestamp('a_bot'), now)
+        self.assertEqual(self.register.get_number_of_likes_in_last('a_bot', ONE_HOUR), 3)
+
+        # Several bots and days in a batch
+        events = [{LABEL_BOT: 'a_bot_{}'.format(i_event % 2), LABEL_EVENT: EVENT_FOLLOW,
+                   LABEL_USERNAME: 'a_user', LABEL_TIMESTAMP: now - datetime.timedelta(i_event)}
+                  for i_event in range(4)]
+        self.assertTrue(self.register.add_events(iter(events)))
+        self.assertEqual(self.register.get_number_of_events(), 7)
+        self.assertEqual(self.register.get_number_of_follows_since(
+            'a_bot_1', now - datetime.timedelta(5)), 2)
+
+        # A single invalid event discards the batch
+        events = [{LABEL_BOT: 'a_bot', LABEL_EVENT: EVENT_LOGIN},
+                  {LABEL_BOT: 'a_bot', LABEL_EVENT: EVENT_FOLLOW}]
+        self.assertFalse(self.register.add_events(events))
+        self.assertEqual(self.register.get_number_of_events(), 7)
+
+    def test_compact_representation(self):
+        self.assertTrue(self.register.add_event('a_bot', EVENT_LIKES, 'a_user', 3))
+        self.assertTrue(self.register.add_event('a_bot', EVENT_EXCEPTION, in_comments='like'))
+        self.assertTrue(self.register.add_event('a_bot_2', EVENT_FOLLOW, 'a_user'))
+        database = self.register.database
+        for label in [LABEL_BOT, LABEL_EVENT, LABEL_USERNAME, LABEL_COMMENTS]:
+            self.assertEqual(database[label].dtype.name, 'category')
+        self.assertEqual(database[LABEL_NUM_LIKES].dtype.name, 'Int16')
+        self.assertEqual(database[LABEL_TIMESTAMP].dtype.name, 'datetime64[ns]')
+        self.assertEqual(self.register.get_number_of_likes_in_last('a_bot', ONE_HOUR), 3)
+
+        memory_report = self.register.get_memory_report()
+        self.assertEqual(list(memory_report.index), ALL_LABELS + ['total'])
+        self.assertEqual(memory_report['total'], memory_report[ALL_LABELS].sum())
+        self.assertGreater(memory_report[LABEL_USERNAME], 0)
+
+    def test_add_event_buffered(self):
+
+        for i_event in range(50):
+            self.assertTrue(self.register.add_event('a_bot', EVENT_LIKES, f'a_user_{i_event}', 2))
+        self.assertEqual(self.register.store.num_buffered, 50)
+        self.assertEqual(self.register.get_number_of_events(), 50)
+
+        timestamp_0 = datetime.datetime.now()
+        self.assertTrue(self.register.add_event('a_bot_2', EVENT_LIKES, 'a_user', 3,
+                                                in_timestamp=timestamp_0))
+        self.assertEqual(self.register.get_number_of_events('a_bot'), 50)
+        self.assertEqual(self.register.get_number_of_likes_since('a_bot_2', timestamp_0), 3)
+        self.assertEqual(self.register.store.num_buffered, 51)
+        self.assertEqual(len(self.register.database), 51)
+        self.assertEqual(self.register.store.num_buffered, 0)
+
+    def test_add_event_concurrently(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            csv_path = Path(temp_dir) / 'events.csv'
+            shutil.copy(self.test_csv, csv_path)
+            register = BotEventRegister(csv_path, in_journal_on=True)
+            bots = ['a_bot_{}'.format(i_bot) for i_bot in range(4)]
+            num_events_per_bot = 100
+
+            def run_bot(bot):
+                for i_event in range(num_events_per_bot):
+                    register.add_event(bot, EVENT_LIKES, 'a_user_{}'.format(i_event), 1)
+                    register.get_number_of_likes_in_last(bot, ONE_HOUR)
+                    if i_event % 10 == 0:
+                        register.save()
+
+            threads = [threading.Thread(target=run_bot, args=(bot,)) for bot in bots]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            register.save()
+
+            self.assertEqual(register.get_number_of_events(), len(bots) * num_events_per_bot)
+            register_replayed = BotEventRegister(csv_path)
+            for bot in bots:
+                self.assertEqual(register_replayed.get_number_of_events(bot), num_events_per_bot)
+                self.assertEqual(register_replayed.get_number_of_likes_in_last(bot, ONE_HOUR),
+                                 num_events_per_bot)
+
+    def test_read_while_writing(self):
+        num_events = 2000
+        timestamp_0 = datetime.datetime.now() - datetime.timedelta(0, 2 * num_events)
+        readings = []
+
+        def write():
+            for i_event in range(num_events):
+                # Some events arrive out of order
+                timestamp = timestamp_0 + datetime.timedelta(0, 2 * i_event - i_event % 3)
+                self.register.add_event('a_bot', EVENT_LIKES, 'a_user', 1, in_timestamp=timestamp)
+
+        writer = threading.Thread(target=write)
+        writer.start()
+        while writer.is_alive():
+            readings.append((self.register.get_number_of_events('a_bot'),
+                             self.register.get_number_of_likes_since('a_bot', timestamp_0)))
+        writer.join()
+
+        for (num_events_0, num_likes_0), (num_events_1, num_likes_1) in \
+                zip(readings, readings[1:]):
+            self.assertLessEqual(num_events_0, num_events_1)
+            self.assertLessEqual(num_likes_0, num_likes_1)
+        self.assertEqual(self.register.get_number_of_likes_since('a_bot', timestamp_0),
+                         num_events)
+
+    def test_query_cache(self):
+        timestamp_0 = datetime.datetime.now() - datetime.timedelta(0, 60)
+        self.assertTrue(self.register.add_event('a_bot', EVENT_LIKES, 'a_user_1', 2))
+        self.assertTrue(self.register.add_event('a_bot_2', EVENT_LIKES, 'a_user_1', 3))
+        statistics_0 = self.register.get_query_cache_statistics()
+
+        for _ in range(3):
+            self.assertEqual(self.register.get_number_of_likes_since('a_bot', timestamp_0), 2)
+            self.assertEqual(self.register.get_number_of_likes_since('a_bot_2', timestamp_0), 3)
+        statistics = self.register.get_query_cache_statistics()
+        self.assertEqual(statistics['misses'] - statistics_0['misses'], 2)
+        self.assertEqual(statistics['hits'] - statistics_0['hits'], 4)
+
+        # Adding an event of a bot invalidates only its queries
+        self.assertTrue(self.register.add_event('a_bot', EVENT_LIKES, 'a_user_2', 1))
+        self.assertEqual(self.register.get_number_of_likes_since('a_bot', timestamp_0), 3)
+        self.assertEqual(self.register.get_number_of_likes_since('a_bot_2', timestamp_0), 3)
+        statistics = self.register.get_query_cache_statistics()
+        self.assertEqual(statistics['misses'] - statistics_0['misses'], 3)
+        self.assertEqual(statistics['hits'] - statistics_0['hits'], 5)
+
+        # The queries over the last hour and day are read from the rolling counters
+        with patch.object(RollingCounter, 'get_total', autospec=True,
+                          side_effect=RollingCounter.get_total) as get_total, \
+                patch.object(RollingCounter, 'get_count', autospec=True,
+                             side_effect=RollingCounter.get_count) as get_count:
+            self.assertEqual(self.register.get_number_of_likes_in_last('a_bot', ONE_HOUR), 3)
+            self.assertEqual(self.register.get_number_of_follows_in_last('a_bot', ONE_DAY), 0)
+            self.assertTrue(self.register.add_event('a_bot', EVENT_FOLLOW, 'a_user_1'))
+            self.assertEqual(self.register.get_number_of_follows_in_last('a_bot', ONE_DAY), 1)
+        self.assertEqual(get_total.call_count, 1)
+        self.assertEqual(get_count.call_count, 1)
+        statistics_1 = self.register.get_query_cache_statistics()
+        self.assertEqual(statistics_1['misses'], statistics['misses'])
+        self.assertEqual(statistics_1['hits'], statistics['hits'])
+
+        self.assertEqual(self.register.remove_events_before(datetime.datetime.now()), 4)
+        self.assertEqual(self.register.get_number_of_likes_since('a_bot_2', timestamp_0), 0)
+        self.assertEqual(self.register.get_number_of_likes_in_last('a_bot', ONE_HOUR), 0)
+
+    def test_get_rollup(self):
+        timestamp_0 = (datetime.datetime.now() - ONE_DAY).replace(hour=12, minute=30, second=0,
+                                                                  microsecond=0)
+        hour_0 = timestamp_0.replace(minute=0)
+        for i_hour in range(4):
+            self.assertTrue(self.register.add_event(
+                'a_bot', EVENT_LIKES, 'a_user', 2,
+                in_timestamp=timestamp_0 - datetime.timedelta(0, 3600 * i_hour)))
+        self.assertTrue(self.register.add_event('a_bot', EVENT_FOLLOW, 'a_user',
+                                                in_timestamp=timestamp_0))
+        self.assertTrue(self.register.add_event('a_bot_2', EVENT_LIKES, 'a_user', 3,
+                                                in_timestamp=timestamp_0))
+
+        rollup = self.register.get_rollup('a_bot', EVENT_LIKES, in_end=timestamp_0 + ONE_HOUR)
+        self.assertEqual(list(rollup.index),
+                         [hour_0 - datetime.timedelta(0, 3600 * i) for i in range(3, -2, -1)])
+        self.assertEqual(list(rollup[LABEL_COUNT]), [1, 1, 1, 1, 0])
+        self.assertEqual(list(rollup[LABEL_NUM_LIKES]), [2, 2, 2, 2, 0])
+
+        rollup = self.register.get_rollup(None, EVENT_LIKES, ONE_DAY,
+                                          in_start=timestamp_0 - datetime.timedelta(1))
+        self.assertEqual(list(rollup[LABEL_COUNT]), [0, 5, 0])
+        self.assertEqual(list(rollup[LABEL_NUM_LIKES]), [0, 11, 0])
+        rollup = self.register.get_rollup('a_bot', EVENT_FOLLOW, in_start=hour_0,
+                                          in_end=timestamp_0)
+        self.assertEqual(list(rollup[LABEL_COUNT]), [1])
+        self.assertIsNone(self.register.get_rollup('a_bot', EVENT_LIKES, datetime.timedelta(0, 60)))
+
+        # Removal drops the old periods and recomputes the period of the removal timestamp
+        self.assertEqual(self.register.remove_events_before(
+            hour_0 - datetime.timedelta(0, 3600 + 60)), 2)
+        rollup = self.register.get_rollup('a_bot', EVENT_LIKES, in_start=hour_0 - ONE_DAY,
+                                          in_end=timestamp_0 + ONE_HOUR)
+        self.assertEqual(rollup[LABEL_COUNT].sum(), 2)
+        self.assertEqual(rollup.loc[hour_0 - datetime.timedelta(0, 3600), LABEL_COUNT], 1)
+        self.assertEqual(self.register.get_rollup('a_bot', EVENT_LIKES, ONE_DAY).iloc[0][
+            LABEL_NUM_LIKES], 4)
+
+        # Loaded databases are rolled up
+        with tempfile.TemporaryDirectory() as temp_dir:
+            csv_path = Path(temp_dir) / 'events.csv'
+            self.assertTrue(self.register.save(csv_path))
+            register = BotEventRegister(csv_path)
+            rollup = register.get_rollup(None, EVENT_LIKES, in_start=hour_0)
+            self.assertEqual(rollup.loc[hour_0].tolist(), [2, 5])
+
     def test_get_last_block_timestamp(self):
 
         self.assertTrue(self.register.add_event('a_bot', EVENT_LOGIN))
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# pylint: disable=missing-function-docstring, C0103
+
+__author__ = "Josep-Arnau Claret"
+__email__ = "joseparnau81@gmail.com"
+
+import unittest
+
+from pathlib import Path
+import tempfile
+from unittest.mock import patch
+
+import pandas as pd
+
+import acid_rain.acid_rain_settings
+from acid_rain.bot_event_register import BotEventRegister, ALL_LABELS, EVENT_LOGIN
+from acid_rain.bot_master import BotMaster, read_target_profiles
+from acid_rain.event_store_server import EventStoreServer, RemoteBotEventRegister
+from acid_rain.excluded_profiles import ExclusionIndex
+
+
+class TestBotMasterMethods(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.profiles_path = Path(self.temp_dir.name) / 'followers_all.csv'
+        self.num_rows = 1000
+        profiles = pd.DataFrame({
+            'profileUrl': ['https://www.instagram.com/user_{}'.format(i)
+                           for i in range(self.num_rows)],
+            'username': ['user_{}'.format(i) for i in range(self.num_rows)],
+            'isPrivate': ['Private' if i % 4 == 0 else None for i in range(self.num_rows)]})
+        profiles.to_csv(self.profiles_path, index=False)
+
+        self.excluded_path = Path(self.temp_dir.name) / 'excluded_profiles.csv'
+        with open(self.excluded_path, 'w') as file:
+            file.write('profileUrl\nhttps://www.instagram.com/user_1\n'
+                       'https://www.instagram.com/user_4/\n')
+
+    def tearDown(self):
+        acid_rain.acid_rain_settings.use_global_database = False
+        acid_rain.acid_rain_settings.global_events_db = None
+        self.temp_dir.cleanup()
+
+    def test_read_target_profiles(self):
+        likes_targets, follows_targets, num_rows = read_target_profiles(self.profiles_path)
+        self.assertEqual(num_rows, self.num_rows)
+        self.assertEqual(len(likes_targets), 750)
+        self.assertEqual(len(follows_targets), 250)
+        self.assertEqual(likes_targets[0], 'https://www.instagram.com/user_1')
+        self.assertEqual(follows_targets[1], 'https://www.instagram.com/user_4')
+
+    def test_read_target_profiles_with_quotas(self):
+        exclusion_index = ExclusionIndex(self.excluded_path)
+        likes_targets, follows_targets, num_rows = read_target_profiles(
+            self.profiles_path, exclusion_index, in_max_likes=10, in_max_follows=5,
+            in_chunk_size=10)
+        self.assertEqual(list(likes_targets),
+                         ['https://www.instagram.com/user_{}'.format(i)
+                          for i in [2, 3, 5, 6, 7, 9, 10, 11, 13, 14]])
+        self.assertEqual(list(follows_targets),
+                         ['https://www.instagram.com/user_{}'.format(i)
+                          for i in [0, 8, 12, 16, 20]])
+        # Reading stops once both quotas are filled
+        self.assertEqual(num_rows, 30)
+
+        # The keys of the excluded profiles are read once, not for every chunk
+        with patch.object(exclusion_index, 'get_keys', wraps=exclusion_index.get_keys) as get_keys:
+            likes_targets, follows_targets, num_rows = read_target_profiles(
+                self.profiles_path, exclusion_index, in_max_likes=0, in_chunk_size=100)
+        get_keys.assert_called_once()
+        self.assertEqual(len(likes_targets), 0)
+        self.assertEqual(len(follows_targets), 249)
+        self.assertEqual(num_rows, self.num_rows)
+
+    @patch('acid_rain.insta_bot.start_selenium')
+    def test_initialize_bots_with_server(self, _):
+        events_path = Path(self.temp_dir.name) / 'events.csv'
+        pd.DataFrame(columns=ALL_LABELS).to_csv(events_path, index=False)
+        register = BotEventRegister(events_path)
+        server = EventStoreServer(register, 'tcp://127.0.0.1:0')
+        server.start()
+        try:
+            self.assertIsNone(BotEventRegister.load_database(server.address))
+            bot_master = BotMaster([{'name': 'a_bot', 'password': 'a_password'}],
+                                   self.profiles_path, self.excluded_path, server.address,
+                                   in_test=True)
+            bot_master.initialize_bots()
+            self.assertFalse(acid_rain.acid_rain_settings.use_global_database)
+            self.assertIsNone(acid_rain.acid_rain_settings.global_events_db)
+
+            # The bots add their events to the served register
+            bot_register = bot_master.bots[0].event_register
+            self.assertIsInstance(bot_register, RemoteBotEventRegister)
+            self.assertTrue(bot_register.add_event('a_bot', EVENT_LOGIN))
+            self.assertEqual(register.get_number_of_events('a_bot'), 1)
+            bot_register.close()
+        finally:
+            server.stop()
+
+    @patch('acid_rain.insta_bot.start_selenium')
+    def test_compact_events(self, _):
+        events_path = Path(self.temp_dir.name) / 'events.csv'
+        pd.DataFrame(columns=ALL_LABELS).to_csv(events_path, index=False)
+        bot_master = BotMaster([{'name': 'a_bot', 'password': 'a_password'},
+                                {'name': 'a_bot_2', 'password': 'a_password'}],
+                               self.profiles_path, self.excluded_path, events_path, in_test=True)
+        bot_master.initialize_bots()
+
+        # The bots do not compact the events, only the last bot thread to end does
+        bot_master.num_running_bots = 2
+        with patch.object(BotEventRegister, 'compact', return_value=True) as compact, \
+                patch.object(BotMaster, 'bot_run_function', side_effect=RuntimeError):
+            for bot in bot_master.bots:
+                self.assertTrue(bot.event_register.add_event(bot.name, EVENT_LOGIN))
+                with self.assertRaises(RuntimeError):
+                    bot_master.bot_thread_function(bot)
+                bot.close_session()
+        compact.assert_called_once()
+        self.assertEqual(BotEventRegister(events_path).get_number_of_events(), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# pylint: disable=missing-function-docstring, C0103
+
+__author__ = "Josep-Arnau Claret"
+__email__ = "joseparnau81@gmail.com"
+
+import unittest
+
+from datetime import datetime, timedelta
+import os
+from pathlib import Path
+import threading
+import time
+
+from acid_rain.bot_event_register import BotEventRegister, EVENT_LOGIN
+from acid_rain.bot_scheduler import BotScheduler
+
+
+class TestBotSchedulerMethods(unittest.TestCase):
+
+    def setUp(self):
+        self.scheduler = BotScheduler()
+
+    def tearDown(self):
+        self.scheduler.close()
+
+    def sleep_in_thread(self, in_bot, in_seconds, out_results):
+        def sleep():
+            out_results[in_bot] = self.scheduler.sleep_until(
+                in_bot, datetime.now() + timedelta(seconds=in_seconds))
+        thread = threading.Thread(target=sleep)
+        thread.start()
+        return thread
+
+    def test_sleep_until(self):
+        self.assertFalse(self.scheduler.sleep_until('a_bot', datetime.now()))
+        results = {}
+        time_start = time.monotonic()
+        threads = [self.sleep_in_thread('a_bot', 0.2, results),
+                   self.sleep_in_thread('a_bot_2', 0.1, results)]
+        for thread in threads:
+            thread.join()
+        self.assertGreaterEqual(time.monotonic() - time_start, 0.2)
+        self.assertEqual(results, {'a_bot': False, 'a_bot_2': False})
+        self.assertEqual(self.scheduler.heap, [])
+
+    def test_wake(self):
+        results = {}
+        time_start = time.monotonic()
+        threads = [self.sleep_in_thread('a_bot', 60, results),
+                   self.sleep_in_thread('a_bot_2', 0.1, results)]
+        time.sleep(0.05)
+        self.scheduler.wake('a_bot')
+        for thread in threads:
+            thread.join()
+        self.assertLess(time.monotonic() - time_start, 30)
+        self.assertEqual(results, {'a_bot': True, 'a_bot_2': False})
+        self.assertEqual(self.scheduler.heap, [])
+
+    def test_wake_on_events(self):
+        dirname = os.path.dirname(__file__)
+        register = BotEventRegister(Path(dirname) / 'data/bot_register_event_db.csv')
+        results = {}
+        threads = [self.sleep_in_thread('a_bot', 60, results),
+                   self.sleep_in_thread('a_bot_2', 0.2, results)]
+        time.sleep(0.05)
+        self.assertTrue(register.add_event('a_bot', EVENT_LOGIN))
+        threads[0].join(30)
+        self.assertEqual(results, {'a_bot': True})
+        threads[1].join()
+        self.assertEqual(results['a_bot_2'], False)
+
+    def test_close(self):
+        results = {}
+        thread = self.sleep_in_thread('a_bot', 60, results)
+        time.sleep(0.05)
+        self.scheduler.close()
+        thread.join(30)
+        self.assertEqual(results, {'a_bot': True})
+        self.assertFalse(self.scheduler.sleep_until('a_bot', datetime.now() + timedelta(hours=1)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# pylint: disable=missing-function-docstring, C0103
+
+__author__ = "Josep-Arnau Claret"
+__email__ = "joseparnau81@gmail.com"
+
+import unittest
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+import os
+from pathlib import Path
+import tempfile
+import threading
+import time
+from unittest.mock import patch
+
+import pandas as pd
+
+from acid_rain.bot_event_register import BotEventRegister, EVENT_LOGIN, EVENT_LIKES, ALL_LABELS
+from acid_rain.bot_scheduler import BotScheduler, AsyncBotScheduler
+from acid_rain.bot_steps import run_steps, run_steps_async, STEP_WAIT, STEP_SLEEP_UNTIL, \
+    STEP_CALL, STEP_IO
+from acid_rain.insta_bot import InstaBot
+
+
+def fail():
+    raise ValueError('selenium failed')
+
+
+def routine(in_wait_s=0.01):
+    """
+    Waits, calls a blocking function and recovers from a failed one
+    """
+    yield STEP_WAIT, in_wait_s
+    thread_name = yield STEP_CALL, lambda: threading.current_thread().name, ()
+    try:
+        yield STEP_CALL, fail, ()
+    except ValueError as e:
+        error = str(e)
+    woken_up = yield STEP_SLEEP_UNTIL, datetime.now() + timedelta(seconds=in_wait_s)
+    return thread_name, error, woken_up
+
+
+class TestBotStepsMethods(unittest.TestCase):
+
+    def test_run_steps(self):
+        scheduler = BotScheduler()
+        result = run_steps(routine(), 'a_bot', scheduler)
+        scheduler.close()
+        self.assertEqual(result, (threading.current_thread().name, 'selenium failed', False))
+
+        def failing_routine():
+            yield STEP_WAIT, 0
+            yield STEP_CALL, fail, ()
+        with self.assertRaises(ValueError):
+            run_steps(failing_routine())
+
+    def test_run_steps_async(self):
+        num_bots = 50
+        wait_s = 0.2
+
+        async def run_bots():
+            scheduler = AsyncBotScheduler()
+            with ThreadPoolExecutor(2, thread_name_prefix='selenium') as executor:
+                results = await asyncio.gather(*[
+                    run_steps_async(routine(wait_s), 'a_bot_{}'.format(i), scheduler, executor)
+                    for i in range(num_bots)])
+            scheduler.close()
+            return results
+
+        time_start = time.monotonic()
+        results = asyncio.run(run_bots())
+        # The waits of the bots overlap in the event loop, and the calls run in the executor
+        self.assertLess(time.monotonic() - time_start, num_bots * wait_s / 2)
+        self.assertEqual(len(results), num_bots)
+        for thread_name, error, woken_up in results:
+            self.assertTrue(thread_name.startswith('selenium'))
+            self.assertEqual(error, 'selenium failed')
+            self.assertFalse(woken_up)
+
+    def test_run_io_steps(self):
+        def io_routine():
+            thread_name = yield STEP_IO, lambda: threading.current_thread().name, ()
+            try:
+                yield STEP_IO, fail, ()
+            except ValueError as e:
+                error = str(e)
+            return thread_name, error
+
+        self.assertEqual(run_steps(io_routine()),
+                         (threading.current_thread().name, 'selenium failed'))
+
+        async def run_bot():
+            with ThreadPoolExecutor(1, thread_name_prefix='selenium') as executor:
+                return threading.current_thread().name, \
+                    await run_steps_async(io_routine(), 'a_bot', None, executor)
+
+        loop_thread_name, (thread_name, error) = asyncio.run(run_bot())
+        # The disk I/O runs neither in the event loop nor in the executor of the Selenium calls
+        self.assertNotEqual(thread_name, loop_thread_name)
+        self.assertFalse(thread_name.startswith('selenium'))
+        self.assertEqual(error, 'selenium failed')
+
+    def test_async_scheduler_wake_on_events(self):
+        dirname = os.path.dirname(__file__)
+        register = BotEventRegister(Path(dirname) / 'data/bot_register_event_db.csv')
+
+        async def sleep_and_add_event():
+            scheduler = AsyncBotScheduler()
+            sleeps = [asyncio.ensure_future(scheduler.sleep_until(
+                bot, datetime.now() + timedelta(seconds=seconds)))
+                for bot, seconds in [('a_bot', 60), ('a_bot_2', 0.2)]]
+            await asyncio.sleep(0.05)
+            # Events added from another thread wake up their bot
+            thread = threading.Thread(target=register.add_event, args=('a_bot', EVENT_LOGIN))
+            thread.start()
+            thread.join()
+            results = await asyncio.wait_for(asyncio.gather(*sleeps), 30)
+            scheduler.close()
+            return results
+
+        self.assertEqual(asyncio.run(sleep_and_add_event()), [True, False])
+
+    def test_blocking_wait_helpers(self):
+        dirname = os.path.dirname(__file__)
+        bot = InstaBot.__new__(InstaBot)
+        bot.name = 'a_bot'
+        bot.event_register = BotEventRegister(Path(dirname) / 'data/bot_register_event_db.csv')
+        bot.likes_max_per_hour = 0
+        self.assertTrue(bot.event_register.add_event('a_bot', EVENT_LIKES, 'a_user', 2))
+
+        # The public helpers block until their wait ends, their steps only yield the wait
+        with patch('acid_rain.bot_steps.sleep') as mock_sleep:
+            self.assertTrue(bot.wait_for_max_counts_per_hour('likes'))
+            bot.wait_after_exception('likes')
+            self.assertEqual(mock_sleep.call_count, 2)
+            steps = bot.wait_after_exception_steps('likes')
+            self.assertEqual(next(steps)[0], STEP_WAIT)
+            self.assertEqual(mock_sleep.call_count, 2)
+
+    @patch('acid_rain.insta_bot.start_selenium')
+    def test_like_steps_query_cache(self, _):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            events_path = Path(temp_dir) / 'events.csv'
+            pd.DataFrame(columns=ALL_LABELS).to_csv(events_path, index=False)
+            excluded_path = Path(temp_dir) / 'excluded_profiles.csv'
+            with open(excluded_path, 'w') as file:
+                file.write('profileUrl\n')
+            bot = InstaBot('a_bot', 'a_password', excluded_path, events_path, True)
+            bot.login()
+
+            # The queries of an iteration after its events are added share the cache entries
+            statistics_0 = bot.event_register.get_query_cache_statistics()
+            with patch('acid_rain.bot_steps.sleep'), \
+                    patch('acid_rain.insta_bot.mock_like_photos_profile',
+                          return_value=(2, False, '')):
+                self.assertEqual(run_steps(bot.like_steps(['https://www.instagram.com/a_user'])),
+                                 ['https://www.instagram.com/a_user'])
+            statistics = bot.event_register.get_query_cache_statistics()
+            self.assertEqual(statistics['hits'] - statistics_0['hits'], 1)
+            # The last block before the iteration and the likes of the run after its events
+            self.assertEqual(statistics['misses'] - statistics_0['misses'], 2)
+            bot.close_session()
+
+
+if __name__ == '__main__':
+    unittest.main()
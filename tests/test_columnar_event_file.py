@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# pylint: disable=missing-function-docstring, C0103
+
+__author__ = "Josep-Arnau Claret"
+__email__ = "joseparnau81@gmail.com"
+
+import unittest
+
+import datetime
+from pathlib import Path
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from acid_rain.acid_rain_constants import ONE_DAY, ONE_HOUR
+from acid_rain.bot_event_register import BotEventRegister, EVENT_LOGIN, EVENT_LIKES, \
+    EVENT_FOLLOW, EVENT_EXCEPTION, EVENT_BLOCK, ALL_LABELS, LABEL_TIMESTAMP, LABEL_BOT, \
+    LABEL_EVENT, LABEL_USERNAME, LABEL_NUM_LIKES, LABEL_COMMENTS
+from acid_rain.columnar_event_file import read_columnar_events, write_columnar_events, \
+    convert_csv_to_columnar, convert_columnar_to_csv
+
+
+class TestColumnarEventFileMethods(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.columnar_path = Path(self.temp_dir.name) / 'events.events'
+        self.test_csv = \
+            Path(__file__).parent.parent / 'data_test/bot_register_event_db_test_jac.csv'
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    @staticmethod
+    def make_events(in_num_days, in_num_events_per_day) -> pd.DataFrame:
+        # Events of two bots over several days, each one to a different user
+        timestamp_0 = datetime.datetime.now().replace(microsecond=0) - datetime.timedelta(
+            in_num_days)
+        num_events = in_num_days * in_num_events_per_day
+        seconds_between_events = 86400 // in_num_events_per_day
+        return pd.DataFrame({
+            LABEL_TIMESTAMP: [timestamp_0 + datetime.timedelta(0, i * seconds_between_events)
+                              for i in range(num_events)],
+            LABEL_BOT: ['a_bot_{}'.format(i % 2) for i in range(num_events)],
+            LABEL_EVENT: EVENT_LIKES,
+            LABEL_USERNAME: ['a_user_{}'.format(i) for i in range(num_events)],
+            LABEL_NUM_LIKES: [float(1 + i % 3) for i in range(num_events)],
+            LABEL_COMMENTS: None}, columns=ALL_LABELS)
+
+    def test_write_and_read(self):
+        database = BotEventRegister.read_events_file(self.test_csv)
+        write_columnar_events(database, self.columnar_path)
+        # Overwriting replaces the whole folder
+        write_columnar_events(database, self.columnar_path)
+
+        columnar_database = read_columnar_events(self.columnar_path)
+        self.assertEqual(list(columnar_database.columns), ALL_LABELS)
+        self.assertEqual(columnar_database[LABEL_TIMESTAMP].dtype, np.dtype('datetime64[ns]'))
+        self.assertEqual(columnar_database[LABEL_BOT].dtype.name, 'category')
+        self.assertEqual(columnar_database[LABEL_NUM_LIKES].dtype, np.float64)
+        pd.testing.assert_frame_equal(columnar_database.astype(object),
+                                      database.astype(object).where(database.notna(), np.nan))
+
+    def test_register(self):
+        self.assertEqual(convert_csv_to_columnar(self.test_csv, self.columnar_path), 2)
+        register = BotEventRegister(self.columnar_path, in_journal_on=True)
+        self.assertEqual(register.get_number_of_events(), 2)
+
+        now = datetime.datetime.now()
+        self.assertTrue(register.add_event('a_bot', EVENT_LOGIN, in_timestamp=now))
+        self.assertTrue(register.add_event('a_bot', EVENT_LIKES, 'a_user', 3, in_timestamp=now))
+        self.assertTrue(register.add_event('a_bot', EVENT_EXCEPTION, in_comments='like',
+                                           in_timestamp=now))
+        self.assertTrue(register.save())
+        self.assertEqual(BotEventRegister(self.columnar_path).get_number_of_events(), 5)
+        self.assertTrue(register.compact())
+
+        register_compacted = BotEventRegister(self.columnar_path)
+        self.assertEqual(register_compacted.get_number_of_events(), 5)
+        self.assertEqual(register_compacted.get_number_of_likes_since('a_bot', now), 3)
+        self.assertEqual(register_compacted.get_event_timestamp('a_bot'), now)
+
+        csv_path = Path(self.temp_dir.name) / 'events.csv'
+        self.assertEqual(convert_columnar_to_csv(self.columnar_path, csv_path), 5)
+        self.assertEqual(BotEventRegister(csv_path).get_number_of_events(), 5)
+
+    def test_segment_categories(self):
+        database = self.make_events(20, 50)
+        csv_path = Path(self.temp_dir.name) / 'events.csv'
+        database.to_csv(csv_path, index=False)
+        self.assertEqual(convert_csv_to_columnar(csv_path, self.columnar_path), len(database))
+
+        store = BotEventRegister.read_database(self.columnar_path)
+        # The segments only keep the usernames of their events, not those of the whole file
+        for shard in store.shards.values():
+            for segment in shard.get_segments():
+                usernames = segment.get_database()[LABEL_USERNAME]
+                self.assertEqual(set(usernames.cat.categories), set(usernames))
+        memory_usage = sum(store.get_memory_usage().values())
+        csv_memory_usage = sum(BotEventRegister.read_database(csv_path)
+                               .get_memory_usage().values())
+        self.assertLess(memory_usage, 1.1 * csv_memory_usage)
+
+    def test_load_time(self):
+        # A million events of 50 bots over the last 14 days, mostly to different users
+        num_events = 1000000
+        rng = np.random.default_rng(0)
+        now = np.datetime64(datetime.datetime.now(), 'us')
+        timestamps = now - rng.integers(0, 14 * 86400 * 10 ** 6, num_events).astype(
+            'timedelta64[us]')
+        events = np.array([EVENT_LIKES, EVENT_FOLLOW, EVENT_LOGIN, EVENT_EXCEPTION, EVENT_BLOCK])[
+            rng.choice(5, num_events, p=[.6, .3, .05, .04, .01])]
+        database = pd.DataFrame({
+            LABEL_TIMESTAMP: timestamps,
+            LABEL_BOT: np.array(['a_bot_{}'.format(i) for i in range(50)])[
+                rng.integers(0, 50, num_events)],
+            LABEL_EVENT: events,
+            LABEL_USERNAME: np.char.add('a_user_', rng.integers(0, num_events // 2, num_events)
+                                        .astype(str)),
+            LABEL_NUM_LIKES: np.where(events == EVENT_LIKES,
+                                      rng.integers(1, 4, num_events), np.nan),
+            LABEL_COMMENTS: None}, columns=ALL_LABELS)
+        write_columnar_events(database, self.columnar_path)
+
+        time_start = time.monotonic()
+        store = BotEventRegister.read_database(self.columnar_path)
+        load_time = time.monotonic() - time_start
+        # A fraction of a second, even on a slow machine, and ~100 ms of it is pandas checking
+        # the categories of the usernames
+        self.assertLess(load_time, 1.)
+        self.assertEqual(len(store), num_events)
+
+        bot_events = database.loc[database[LABEL_BOT] == 'a_bot_7']
+        timestamp = now.astype(datetime.datetime) - datetime.timedelta(3)
+        is_since = bot_events[LABEL_TIMESTAMP] >= timestamp
+        self.assertEqual(store.sum_likes_since('a_bot_7', timestamp),
+                         bot_events.loc[is_since, LABEL_NUM_LIKES].sum())
+        self.assertEqual(store.count_events_since('a_bot_7', EVENT_FOLLOW, timestamp),
+                         (is_since & (bot_events[LABEL_EVENT] == EVENT_FOLLOW)).sum())
+        self.assertEqual(store.get_last_timestamp('a_bot_7'),
+                         bot_events[LABEL_TIMESTAMP].max().to_pydatetime())
+        self.assertEqual(len(store.get_shard('a_bot_7').get_database()), len(bot_events))
+
+    def test_register_contents(self):
+        # Mixed events, some of them in the last hour and day and some out of order
+        database = self.make_events(5, 48)
+        database[LABEL_EVENT] = [[EVENT_LIKES, EVENT_FOLLOW, EVENT_LOGIN][i % 3]
+                                 for i in range(len(database))]
+        database.loc[database[LABEL_EVENT] != EVENT_LIKES, LABEL_NUM_LIKES] = np.nan
+        database = pd.concat([database.iloc[::-1], database.iloc[:10]], ignore_index=True)
+        csv_path = Path(self.temp_dir.name) / 'events.csv'
+        database.to_csv(csv_path, index=False)
+        write_columnar_events(BotEventRegister.read_events_file(csv_path), self.columnar_path)
+
+        register = BotEventRegister(self.columnar_path)
+        csv_register = BotEventRegister(csv_path)
+        pd.testing.assert_frame_equal(register.database.astype(object),
+                                      csv_register.database.astype(object))
+        now = datetime.datetime.now()
+        # The indexes built at once on load match those of the events added one by one
+        added_register = BotEventRegister(csv_path, pd.DataFrame(columns=ALL_LABELS))
+        for event in database.to_dict('records'):
+            event[LABEL_TIMESTAMP] = event[LABEL_TIMESTAMP].to_pydatetime()
+            self.assertTrue(added_register.add_events([event]))
+        for bot in ['a_bot_0', 'a_bot_1']:
+            for window in [ONE_HOUR, ONE_DAY, datetime.timedelta(3)]:
+                self.assertEqual(register.get_number_of_likes_in_last(bot, window),
+                                 added_register.get_number_of_likes_in_last(bot, window))
+                self.assertEqual(register.get_number_of_follows_in_last(bot, window),
+                                 added_register.get_number_of_follows_in_last(bot, window))
+            self.assertEqual(
+                register.get_first_timestamp_with_more_than_cumulative_likes(bot, 10),
+                added_register.get_first_timestamp_with_more_than_cumulative_likes(bot, 10))
+        for bot in ['a_bot_0', 'a_bot_1']:
+            for window in [ONE_HOUR, ONE_DAY, datetime.timedelta(3)]:
+                self.assertEqual(register.get_number_of_likes_in_last(bot, window),
+                                 csv_register.get_number_of_likes_in_last(bot, window))
+                self.assertEqual(register.get_number_of_follows_in_last(bot, window),
+                                 csv_register.get_number_of_follows_in_last(bot, window))
+                self.assertEqual(register.get_number_of_likes_since(bot, now - window),
+                                 csv_register.get_number_of_likes_since(bot, now - window))
+            for num_likes in [0, 10, 100]:
+                self.assertEqual(
+                    register.get_first_timestamp_with_more_than_cumulative_likes(bot, num_likes),
+                    csv_register.get_first_timestamp_with_more_than_cumulative_likes(
+                        bot, num_likes))
+            self.assertEqual(register.get_event_timestamp(bot),
+                             csv_register.get_event_timestamp(bot))
+            pd.testing.assert_frame_equal(register.get_rollup(bot, EVENT_LIKES, ONE_DAY),
+                                          csv_register.get_rollup(bot, EVENT_LIKES, ONE_DAY))
+        # Both match the events
+        self.assertEqual(register.get_number_of_events(), len(database))
+        self.assertEqual(register.get_number_of_likes_since('a_bot_0', now - ONE_DAY),
+                         database.loc[(database[LABEL_BOT] == 'a_bot_0') &
+                                      (database[LABEL_TIMESTAMP] >= now - ONE_DAY),
+                                      LABEL_NUM_LIKES].sum())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# pylint: disable=missing-function-docstring, C0103
+
+__author__ = "Josep-Arnau Claret"
+__email__ = "joseparnau81@gmail.com"
+
+import unittest
+
+import os
+from pathlib import Path
+import tempfile
+from unittest.mock import patch
+
+from acid_rain.engage_checkpoint import EngageCheckpoint, KEY_ACTIONS_COUNT, KEY_PROFILES, \
+    KEY_ELAPSED_S, QUEUE_FILE_NAME, PROFILES_SUFFIX, read_json, write_json_atomically
+from acid_rain.target_queue import TargetQueue
+
+
+class TestEngageCheckpointMethods(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.folder = Path(self.temp_dir.name) / 'checkpoints'
+        self.checkpoint = EngageCheckpoint(self.folder)
+        self.queue = TargetQueue({'like': ['like_{}'.format(i) for i in range(10)],
+                                  'follow': ['follow_{}'.format(i) for i in range(3)]},
+                                 in_batch_size=4)
+        self.progress = {KEY_ACTIONS_COUNT: {'like': 1},
+                         KEY_PROFILES: {'like': [['like_0']]},
+                         KEY_ELAPSED_S: 12.5}
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_resume(self):
+        self.assertIsNone(self.checkpoint.load_target_queue())
+
+    def test_write_json_atomically(self):
+        path = Path(self.temp_dir.name) / 'data.json'
+        # The file is synced before it replaces the previous one, then its directory
+        with patch('acid_rain.engage_checkpoint.os.fsync', wraps=os.fsync) as fsync:
+            self.assertTrue(write_json_atomically(path, {'a': 1}))
+        self.assertEqual(fsync.call_count, 2)
+        self.assertEqual(read_json(path), {'a': 1})
+        self.assertFalse(os.path.exists(str(path) + '.tmp'))
+        self.assertTrue(self.checkpoint.save_targets(self.queue))
+        self.assertEqual(self.queue.get('a_bot', 'like'), 'like_0')
+        self.assertEqual(self.queue.get('a_bot_2', 'like'), 'like_4')
+        self.assertTrue(self.checkpoint.add_profile('a_bot', 'like', ['like_0']))
+        self.assertTrue(self.checkpoint.save('a_bot', 12.5, self.queue))
+        self.assertEqual(list(self.folder.glob('*.tmp')), [])
+
+        # A new process resumes the queue where it was saved
+        target_queue = EngageCheckpoint(self.folder).load_target_queue(in_batch_size=4)
+        self.assertEqual(target_queue.get_state(), self.queue.get_state())
+        self.assertEqual(target_queue.get('a_bot', 'like'), 'like_1')
+        self.assertEqual(target_queue.get('a_bot_3', 'like'), 'like_8')
+        self.assertEqual(target_queue.get_num_targets('like'), 6)
+        self.assertEqual(self.checkpoint.load_progress('a_bot'), self.progress)
+        self.assertIsNone(self.checkpoint.load_progress('a_bot_2'))
+
+        self.checkpoint.remove_progress('a_bot')
+        self.assertIsNone(self.checkpoint.load_progress('a_bot'))
+
+    def test_save_targets(self):
+        self.assertTrue(self.checkpoint.add_profile('a_bot', 'like', ['like_0']))
+        self.assertTrue(self.checkpoint.save('a_bot', 12.5, self.queue))
+        # A new run starts a new checkpoint
+        self.assertTrue(self.checkpoint.save_targets(self.queue))
+        self.assertIsNone(self.checkpoint.load_progress('a_bot'))
+
+    def test_profiles_log(self):
+        for i_profile in range(3):
+            self.assertTrue(self.checkpoint.add_profile('a_bot', 'like',
+                                                        ['like_{}'.format(i_profile)]))
+            self.assertTrue(self.checkpoint.save('a_bot', float(i_profile), self.queue))
+        self.assertTrue(self.checkpoint.add_profile('a_bot', 'follow', ['follow_0']))
+        # A line cut by a crash is skipped
+        with open(self.folder / ('a_bot' + PROFILES_SUFFIX), 'a') as file:
+            file.write('\n["like", ["like_')
+        self.assertTrue(self.checkpoint.add_profile('a_bot', 'like', ['like_3']))
+
+        progress = self.checkpoint.load_progress('a_bot')
+        self.assertEqual(progress[KEY_ACTIONS_COUNT], {'like': 4, 'follow': 1})
+        self.assertEqual(progress[KEY_PROFILES],
+                         {'like': [['like_{}'.format(i)] for i in range(4)],
+                          'follow': [['follow_0']]})
+        self.assertEqual(progress[KEY_ELAPSED_S], 2.)
+
+        self.checkpoint.remove_progress('a_bot')
+        self.assertIsNone(self.checkpoint.load_progress('a_bot'))
+        self.assertEqual(list(self.folder.glob('a_bot*')), [])
+
+    def test_invalid_checkpoint(self):
+        self.assertTrue(self.checkpoint.save_targets(self.queue))
+        with open(self.folder / QUEUE_FILE_NAME, 'w') as file:
+            file.write('{"cursors": ')
+        self.assertIsNone(self.checkpoint.load_target_queue())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# pylint: disable=missing-function-docstring, C0103
+
+__author__ = "Josep-Arnau Claret"
+__email__ = "joseparnau81@gmail.com"
+
+import unittest
+
+import datetime
+
+import numpy as np
+
+from acid_rain.event_index import EventRollup, EventTimeIndex, QueryCache, RollingCounter
+
+
+class TestEventTimeIndexMethods(unittest.TestCase):
+
+    def setUp(self):
+        self.timestamp_0 = datetime.datetime(2020, 6, 1, 12)
+        self.index = EventTimeIndex()
+        for i_event, value in enumerate([1, 2, 3, 4, 5]):
+            self.index.add(self.timestamp_0 + datetime.timedelta(0, 60 * i_event), value)
+
+    def test_count_and_sum_since(self):
+        self.assertEqual(len(self.index), 5)
+        self.assertEqual(self.index.count_since(self.timestamp_0), 5)
+        self.assertEqual(self.index.count_since(self.timestamp_0 + datetime.timedelta(0, 90)), 3)
+        self.assertEqual(self.index.sum_since(self.timestamp_0 + datetime.timedelta(0, 90)), 12)
+        self.assertEqual(self.index.sum_since(self.timestamp_0 + datetime.timedelta(1)), 0)
+
+    def test_add_out_of_order(self):
+        self.index.add(self.timestamp_0 + datetime.timedelta(0, 30), 10)
+        self.assertEqual(self.index.count_since(self.timestamp_0 + datetime.timedelta(0, 30)), 5)
+        self.assertEqual(self.index.sum_since(self.timestamp_0 + datetime.timedelta(0, 30)), 24)
+        self.assertEqual(self.index.sum_since(self.timestamp_0 + datetime.timedelta(0, 60)), 14)
+
+    def test_from_sorted(self):
+        timestamps, cumulative, _ = self.index.version
+        time_index = EventTimeIndex.from_sorted(list(timestamps), list(cumulative))
+        self.assertEqual(len(time_index), 5)
+        self.assertEqual(time_index.get_values(), [1, 2, 3, 4, 5])
+        self.assertEqual(time_index.sum_since(self.timestamp_0 + datetime.timedelta(0, 90)), 12)
+        time_index.add(self.timestamp_0 + datetime.timedelta(0, 30), 10)
+        self.assertEqual(time_index.get_values(), [1, 10, 2, 3, 4, 5])
+
+        # Arrays are searched as they are, and converted to lists when an event is added
+        time_index = EventTimeIndex.from_sorted(np.array(timestamps, dtype='datetime64[ns]'),
+                                                np.array(cumulative))
+        self.assertEqual(time_index.count_since(self.timestamp_0 + datetime.timedelta(0, 90)), 3)
+        self.assertEqual(time_index.sum_since(self.timestamp_0 + datetime.timedelta(0, 90)), 12)
+        self.assertEqual(time_index.last_timestamp(), timestamps[-1])
+        self.assertEqual(time_index.last_timestamp_with_sum_above(5), timestamps[3])
+        self.assertEqual(time_index.remove_before(self.timestamp_0 + datetime.timedelta(0, 30)), 1)
+        self.assertEqual(time_index.get_total(), 14)
+        time_index.add(self.timestamp_0 + datetime.timedelta(0, 30), 10)
+        self.assertEqual(time_index.get_values(), [10, 2, 3, 4, 5])
+        self.assertEqual(time_index.last_timestamp(), timestamps[-1])
+
+    def test_last_timestamp(self):
+        self.assertEqual(self.index.last_timestamp(),
+                         self.timestamp_0 + datetime.timedelta(0, 240))
+        self.assertEqual(self.index.last_timestamp(self.timestamp_0 + datetime.timedelta(0, 90)),
+                         self.timestamp_0 + datetime.timedelta(0, 60))
+        self.assertIsNone(self.index.last_timestamp(self.timestamp_0 - datetime.timedelta(0, 1)))
+        self.assertIsNone(EventTimeIndex().last_timestamp())
+
+    def test_last_timestamp_with_sum_above(self):
+        self.assertEqual(self.index.get_total(), 15)
+        self.assertEqual(self.index.last_timestamp_with_sum_above(0),
+                         self.timestamp_0 + datetime.timedelta(0, 240))
+        self.assertEqual(self.index.last_timestamp_with_sum_above(5),
+                         self.timestamp_0 + datetime.timedelta(0, 180))
+        self.assertEqual(self.index.last_timestamp_with_sum_above(9),
+                         self.timestamp_0 + datetime.timedelta(0, 120))
+        self.assertEqual(self.index.last_timestamp_with_sum_above(14), self.timestamp_0)
+        self.assertIsNone(self.index.last_timestamp_with_sum_above(15))
+        self.index.remove_before(self.timestamp_0 + datetime.timedelta(0, 60))
+        self.assertEqual(self.index.get_total(), 14)
+        self.assertIsNone(self.index.last_timestamp_with_sum_above(14))
+
+    def test_last_timestamp_with_count_above(self):
+        self.assertEqual(self.index.last_timestamp_with_count_above(0),
+                         self.timestamp_0 + datetime.timedelta(0, 240))
+        self.assertEqual(self.index.last_timestamp_with_count_above(3),
+                         self.timestamp_0 + datetime.timedelta(0, 60))
+        self.assertEqual(self.index.last_timestamp_with_count_above(4), self.timestamp_0)
+        self.assertIsNone(self.index.last_timestamp_with_count_above(5))
+
+    def test_remove_before(self):
+        self.assertEqual(self.index.remove_before(self.timestamp_0 + datetime.timedelta(0, 90)), 2)
+        self.assertEqual(len(self.index), 3)
+        self.assertEqual(self.index.sum_since(self.timestamp_0), 12)
+        self.index.add(self.timestamp_0 + datetime.timedelta(0, 300), 6)
+        self.assertEqual(self.index.sum_since(self.timestamp_0 + datetime.timedelta(0, 200)), 11)
+
+
+class TestRollingCounterMethods(unittest.TestCase):
+
+    def test_rolling_counter(self):
+        timestamp_0 = datetime.datetime(2020, 6, 1, 12)
+        counter = RollingCounter(datetime.timedelta(0, 3600))
+        counter.add(timestamp_0, 3)
+        counter.add(timestamp_0 + datetime.timedelta(0, 1800), 2)
+        counter.add(timestamp_0 + datetime.timedelta(0, 600), 1)
+        self.assertEqual(counter.get_count(timestamp_0 + datetime.timedelta(0, 1800)), 3)
+        self.assertEqual(counter.get_total(timestamp_0 + datetime.timedelta(0, 1800)), 6)
+        self.assertEqual(counter.get_total(timestamp_0 + datetime.timedelta(0, 3601)), 3)
+        self.assertEqual(counter.get_count(timestamp_0 + datetime.timedelta(0, 4201)), 1)
+        self.assertEqual(counter.get_total(timestamp_0 + datetime.timedelta(0, 7201)), 0)
+
+        counter.extend([timestamp_0 + datetime.timedelta(0, 7200 + 60 * i) for i in range(3)],
+                       [1, 2, 3])
+        self.assertEqual(counter.get_count(timestamp_0 + datetime.timedelta(0, 7300)), 3)
+        self.assertEqual(counter.get_total(timestamp_0 + datetime.timedelta(0, 10830)), 5)
+
+        # Arrays given to an empty counter are kept as arrays ahead of the events added later
+        counter = RollingCounter(datetime.timedelta(0, 3600))
+        counter.extend(np.array([timestamp_0 + datetime.timedelta(0, 60 * i) for i in range(3)],
+                                dtype='datetime64[ns]'), np.array([1, 2, 3]))
+        counter.add(timestamp_0 + datetime.timedelta(0, 3630), 4)
+        self.assertEqual(counter.get_count(timestamp_0 + datetime.timedelta(0, 3600)), 4)
+        self.assertEqual(counter.get_total(timestamp_0 + datetime.timedelta(0, 3661)), 7)
+        self.assertEqual(counter.get_count(timestamp_0 + datetime.timedelta(0, 3721)), 1)
+        self.assertEqual(counter.get_total(timestamp_0 + datetime.timedelta(0, 7300)), 0)
+
+
+class TestEventRollupMethods(unittest.TestCase):
+
+    def test_event_rollup(self):
+        timestamp_0 = datetime.datetime(2020, 6, 1, 12)
+        rollup = EventRollup(datetime.timedelta(0, 3600))
+        rollup.add(timestamp_0 + datetime.timedelta(0, 600), 3)
+        rollup.add(timestamp_0 + datetime.timedelta(0, 1200), 2)
+        rollup.add(timestamp_0 + datetime.timedelta(0, 7300), 1)
+        rollup.add(timestamp_0 - datetime.timedelta(0, 10), 4, 2)
+        self.assertEqual(rollup.get_bucket_start(timestamp_0 + datetime.timedelta(0, 600)),
+                         timestamp_0)
+        self.assertEqual(rollup.get_buckets(), {
+            timestamp_0 - datetime.timedelta(0, 3600): (2, 4),
+            timestamp_0: (2, 5),
+            timestamp_0 + datetime.timedelta(0, 7200): (1, 1)})
+        self.assertEqual(rollup.get_buckets(timestamp_0 + datetime.timedelta(0, 1800),
+                                            timestamp_0 + datetime.timedelta(0, 7200)),
+                         {timestamp_0: (2, 5)})
+
+        self.assertEqual(rollup.remove_before(timestamp_0 + datetime.timedelta(0, 900)), 1)
+        rollup.set_bucket(timestamp_0, 1, 2)
+        self.assertEqual(rollup.get_buckets(timestamp_0 - datetime.timedelta(1)), {
+            timestamp_0: (1, 2),
+            timestamp_0 + datetime.timedelta(0, 7200): (1, 1)})
+        rollup.set_bucket(timestamp_0, 0, 0)
+        self.assertEqual(len(rollup), 1)
+
+        # Periods added at once are merged with the existing ones
+        rollup.extend(np.array([timestamp_0, timestamp_0 + datetime.timedelta(0, 7200)],
+                               dtype='datetime64[ns]'), np.array([2, 3]), np.array([4., 5.]))
+        self.assertEqual(rollup.get_buckets(), {
+            timestamp_0: (2, 4.),
+            timestamp_0 + datetime.timedelta(0, 7200): (4, 6.)})
+
+
+class TestQueryCacheMethods(unittest.TestCase):
+
+    def test_query_cache(self):
+        cache = QueryCache()
+        results = {'a_bot': 1, 'a_bot_2': 2}
+        self.assertEqual(cache.get('a_bot', ('count',), lambda: results['a_bot']), 1)
+        self.assertEqual(cache.get('a_bot_2', ('count',), lambda: results['a_bot_2']), 2)
+        self.assertEqual(cache.get(None, ('count',), lambda: sum(results.values())), 3)
+        results['a_bot'] = 10
+        self.assertEqual(cache.get('a_bot', ('count',), lambda: results['a_bot']), 1)
+        self.assertEqual(cache.get_statistics(), {'hits': 1, 'misses': 3})
+
+        # Invalidating a bot drops its queries and those of all bots
+        cache.invalidate('a_bot')
+        self.assertEqual(cache.get('a_bot', ('count',), lambda: results['a_bot']), 10)
+        self.assertEqual(cache.get('a_bot_2', ('count',), lambda: results['a_bot_2']), 2)
+        self.assertEqual(cache.get(None, ('count',), lambda: sum(results.values())), 12)
+        self.assertEqual(cache.get_statistics(), {'hits': 2, 'misses': 5})
+
+        cache.invalidate()
+        results['a_bot_2'] = 20
+        self.assertEqual(cache.get('a_bot_2', ('count',), lambda: results['a_bot_2']), 20)
+
+    def test_query_cache_invalidated_while_computing(self):
+        cache = QueryCache()
+
+        def compute():
+            cache.invalidate('a_bot')
+            return 1
+
+        self.assertEqual(cache.get('a_bot', ('count',), compute), 1)
+        self.assertEqual(cache.get('a_bot', ('count',), lambda: 2), 2)
+
+    def test_query_cache_max_entries(self):
+        cache = QueryCache(in_max_entries_per_bot=2)
+        for i in range(3):
+            cache.get('a_bot', ('count', i), lambda: 0)
+        self.assertEqual(len(cache.entries['a_bot']), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# pylint: disable=missing-function-docstring, C0103
+
+__author__ = "Josep-Arnau Claret"
+__email__ = "joseparnau81@gmail.com"
+
+import unittest
+
+import datetime
+from pathlib import Path
+import tempfile
+import threading
+
+import pandas as pd
+
+from acid_rain.acid_rain_constants import ONE_DAY, ONE_HOUR
+from acid_rain.bot_event_register import BotEventRegister, EVENT_LOGIN, EVENT_LIKES, EVENT_FOLLOW, \
+    EVENT_BLOCK, ALL_LABELS, LABEL_BOT, LABEL_EVENT, LABEL_USERNAME, LABEL_NUM_LIKES, \
+    LABEL_TIMESTAMP, add_event_listener, remove_event_listener
+from acid_rain.event_store_server import EventStoreServer, RemoteBotEventRegister, \
+    LocalBotEventRegister, is_remote_address, parse_address
+
+
+class TestEventStoreServerMethods(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.csv_path = Path(self.temp_dir.name) / 'events.csv'
+        pd.DataFrame(columns=ALL_LABELS).to_csv(self.csv_path, index=False)
+        self.register = BotEventRegister(self.csv_path)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def check_register(self, in_client):
+        now = datetime.datetime.now()
+        self.assertTrue(in_client.add_event('a_bot', EVENT_LOGIN))
+        self.assertTrue(in_client.add_event('a_bot', EVENT_LIKES, 'a_user_1', 2,
+                                            in_timestamp=now - datetime.timedelta(0, 7200)))
+        self.assertTrue(in_client.add_events(
+            [{LABEL_BOT: 'a_bot', LABEL_EVENT: EVENT_LIKES, LABEL_USERNAME: 'a_user_2',
+              LABEL_NUM_LIKES: 3},
+             {LABEL_BOT: 'a_bot', LABEL_EVENT: EVENT_FOLLOW, LABEL_USERNAME: 'a_user_2'}]))
+        self.assertTrue(in_client.add_event('a_bot', EVENT_BLOCK, in_comments='like',
+                                            in_timestamp=now - datetime.timedelta(0, 3600)))
+
+        self.assertEqual(in_client.get_number_of_events(), 5)
+        self.assertEqual(in_client.get_number_of_events('a_bot'), 5)
+        self.assertEqual(in_client.get_number_of_likes_in_last('a_bot', ONE_HOUR), 3)
+        self.assertEqual(in_client.get_number_of_likes_in_last('a_bot', ONE_DAY), 5)
+        self.assertEqual(in_client.get_number_of_follows_in_last('a_bot', ONE_DAY), 1)
+        self.assertEqual(in_client.get_number_of_likes_since(
+            'a_bot', now - datetime.timedelta(0, 60)), 3)
+        self.assertEqual(in_client.get_last_block_timestamp('a_bot'),
+                         now - datetime.timedelta(0, 3600))
+        self.assertEqual(in_client.get_first_timestamp_with_more_than_cumulative_likes(
+            'a_bot', 3), now - datetime.timedelta(0, 7200))
+        self.assertIsNotNone(in_client.get_first_timestamp_with_more_than_cumulative_follows(
+            'a_bot', 0))
+        self.assertIsNone(in_client.get_first_timestamp_with_more_than_cumulative_follows(
+            'a_bot', 1))
+        self.assertIsNone(in_client.get_last_block_timestamp('a_bot_2'))
+        pd.testing.assert_frame_equal(
+            in_client.get_rollup('a_bot', EVENT_LIKES, ONE_HOUR, now - ONE_DAY, now),
+            self.register.get_rollup('a_bot', EVENT_LIKES, ONE_HOUR, now - ONE_DAY, now),
+            check_freq=False)
+        pd.testing.assert_series_equal(in_client.get_memory_report(),
+                                       self.register.get_memory_report())
+
+        # The calls reach the served register
+        self.assertEqual(self.register.get_number_of_events(), 5)
+        self.assertTrue(in_client.save())
+        self.assertTrue(in_client.flush())
+        self.assertEqual(BotEventRegister(self.csv_path).get_number_of_events(), 5)
+
+        # Only the register API is served
+        with self.assertRaises(AttributeError):
+            in_client.get_store()
+        with self.assertRaises(RuntimeError):
+            in_client.call('get_store')
+        with self.assertRaises(RuntimeError):
+            in_client.get_number_of_likes_in_last('a_bot', 'not a window')
+        # The register is only saved to its own file
+        with self.assertRaises(RuntimeError):
+            in_client.save(str(Path(self.temp_dir.name) / 'other_events.csv'))
+        self.assertFalse((Path(self.temp_dir.name) / 'other_events.csv').exists())
+        with self.assertRaises(AttributeError):
+            in_client.compact()
+        self.assertTrue(in_client.close())
+
+    def test_address(self):
+        self.assertTrue(is_remote_address('tcp://127.0.0.1:8765'))
+        self.assertTrue(is_remote_address('unix:///tmp/events.sock'))
+        self.assertFalse(is_remote_address(self.csv_path))
+        self.assertEqual(parse_address('tcp://127.0.0.1:8765')[1], ('127.0.0.1', 8765))
+        self.assertEqual(parse_address('unix:///tmp/events.sock')[1], '/tmp/events.sock')
+
+    def test_local_register(self):
+        self.check_register(LocalBotEventRegister(self.register))
+
+    def test_tcp_server(self):
+        server = EventStoreServer(self.register, 'tcp://127.0.0.1:0')
+        server.start()
+        try:
+            self.check_register(RemoteBotEventRegister(server.address))
+        finally:
+            server.stop()
+
+    def test_remote_event_listeners(self):
+        server = EventStoreServer(self.register, 'tcp://127.0.0.1:0')
+        server.start()
+        client = RemoteBotEventRegister(server.address)
+        notified = []
+        add_event_listener(notified.extend)
+        try:
+            # The events added through a client are notified to the listeners of its process.
+            # Here the server runs in the same process, so they are also notified by the server
+            self.assertTrue(client.add_event('a_bot', EVENT_BLOCK, in_comments='like'))
+            self.assertTrue(client.add_events([{LABEL_BOT: 'a_bot_2', LABEL_EVENT: EVENT_LOGIN}]))
+            self.assertFalse(client.add_events([{LABEL_BOT: 'a_bot_2', LABEL_EVENT: EVENT_LIKES}]))
+            self.assertEqual([event[LABEL_BOT] for event in notified],
+                             ['a_bot', 'a_bot', 'a_bot_2', 'a_bot_2'])
+            self.assertEqual(notified[-1][LABEL_TIMESTAMP],
+                             self.register.get_event_timestamp('a_bot_2'))
+        finally:
+            remove_event_listener(notified.extend)
+            client.close()
+            server.stop()
+
+    def test_unix_server(self):
+        socket_path = Path(self.temp_dir.name) / 'events.sock'
+        server = EventStoreServer(self.register, 'unix://{}'.format(socket_path))
+        server.start()
+        try:
+            self.check_register(RemoteBotEventRegister(server.address))
+        finally:
+            server.stop()
+        self.assertFalse(socket_path.exists())
+
+    def test_concurrent_clients(self):
+        server = EventStoreServer(self.register, 'tcp://127.0.0.1:0')
+        server.start()
+        client = RemoteBotEventRegister(server.address)
+        num_threads = 4
+        num_events = 50
+
+        def add_events(in_bot):
+            for _ in range(num_events):
+                client.add_event(in_bot, EVENT_LOGIN)
+
+        threads = [threading.Thread(target=add_events, args=('a_bot_{}'.format(i),))
+                   for i in range(num_threads)]
+        try:
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            self.assertEqual(client.get_number_of_events(), num_threads * num_events)
+            self.assertEqual(client.get_number_of_events('a_bot_0'), num_events)
+            self.assertEqual(len(client.connections), num_threads + 1)
+        finally:
+            client.close()
+            server.stop()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# pylint: disable=missing-function-docstring, C0103
+
+__author__ = "Josep-Arnau Claret"
+__email__ = "joseparnau81@gmail.com"
+
+import unittest
+
+import os
+from pathlib import Path
+import shutil
+import tempfile
+import threading
+
+from acid_rain.excluded_profiles import ExcludedProfilesWriter, ExclusionIndex, \
+    open_excluded_profiles_writer, close_excluded_profiles_writer, get_exclusion_index, \
+    INDEX_SUFFIX
+
+
+class TestExcludedProfilesWriterMethods(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.file_path = Path(self.temp_dir.name) / 'excluded_profiles.csv'
+        with open(self.file_path, 'w') as file:
+            file.write('profileUrl\n')
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def read_profiles(self) -> list:
+        with open(self.file_path) as file:
+            return file.read().splitlines()[1:]
+
+    def test_add_and_flush(self):
+        writer = ExcludedProfilesWriter(self.file_path)
+        writer.add('https://www.instagram.com/a_user_1/')
+        writer.add('https://www.instagram.com/a_user_2/')
+        self.assertTrue(writer.flush())
+        self.assertEqual(self.read_profiles(), ['https://www.instagram.com/a_user_1/',
+                                                'https://www.instagram.com/a_user_2/'])
+        writer.add('https://www.instagram.com/a_user_3/')
+        self.assertTrue(writer.close())
+        self.assertEqual(len(self.read_profiles()), 3)
+        self.assertTrue(writer.flush())
+
+    def test_add_concurrently(self):
+        writer = ExcludedProfilesWriter(self.file_path, in_fsync_interval_s=0)
+        num_threads = 4
+        num_profiles = 200
+
+        def add_profiles(in_thread):
+            for i in range(num_profiles):
+                writer.add('https://www.instagram.com/user_{}_{}/'.format(in_thread, i))
+
+        threads = [threading.Thread(target=add_profiles, args=(i,)) for i in range(num_threads)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertTrue(writer.close())
+
+        profiles = self.read_profiles()
+        self.assertEqual(len(profiles), num_threads * num_profiles)
+        self.assertEqual(len(set(profiles)), num_threads * num_profiles)
+        # Lines are never interleaved and each thread keeps its order
+        for i_thread in range(num_threads):
+            thread_profiles = [profile for profile in profiles
+                               if profile.startswith('https://www.instagram.com/user_{}_'
+                                                     .format(i_thread))]
+            self.assertEqual(thread_profiles,
+                             ['https://www.instagram.com/user_{}_{}/'.format(i_thread, i)
+                              for i in range(num_profiles)])
+
+    def test_shared_writer(self):
+        writer_1 = open_excluded_profiles_writer(self.file_path)
+        writer_2 = open_excluded_profiles_writer(str(self.file_path))
+        self.assertIs(writer_1, writer_2)
+
+        writer_1.add('https://www.instagram.com/a_user_1/')
+        self.assertTrue(close_excluded_profiles_writer(writer_1))
+        self.assertEqual(self.read_profiles(), ['https://www.instagram.com/a_user_1/'])
+        self.assertFalse(writer_2.closed)
+
+        writer_2.add('https://www.instagram.com/a_user_2/')
+        self.assertTrue(close_excluded_profiles_writer(writer_2))
+        self.assertTrue(writer_2.closed)
+        self.assertEqual(len(self.read_profiles()), 2)
+        writer_3 = open_excluded_profiles_writer(self.file_path)
+        self.assertIsNot(writer_3, writer_1)
+        self.assertTrue(close_excluded_profiles_writer(writer_3))
+
+
+class TestExclusionIndexMethods(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.file_path = Path(self.temp_dir.name) / 'excluded_profiles.csv'
+        dirname = os.path.dirname(os.path.dirname(__file__))
+        shutil.copy(Path(dirname) / 'data_test/excluded_profiles_test_jac.csv', self.file_path)
+        with open(self.file_path) as file:
+            self.num_profiles = len(file.read().splitlines()) - 1
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_load(self):
+        index = ExclusionIndex(self.file_path)
+        self.assertGreater(len(index), 0)
+        self.assertLessEqual(len(index), self.num_profiles)
+        self.assertIn('https://www.instagram.com/paint_sensei', index)
+        self.assertIn('https://www.instagram.com/Paint_Sensei/', index)
+        self.assertNotIn('https://www.instagram.com/a_user_1', index)
+        self.assertNotIn('profileUrl', index)
+
+    def test_claim(self):
+        index = ExclusionIndex(self.file_path)
+        self.assertFalse(index.claim('https://www.instagram.com/paint_sensei'))
+        self.assertTrue(index.claim('https://www.instagram.com/a_user_1/'))
+        self.assertFalse(index.claim('https://www.instagram.com/a_user_1'))
+
+    def test_save_and_refresh(self):
+        index = ExclusionIndex(self.file_path)
+        num_keys = len(index)
+        self.assertTrue(index.save())
+        self.assertTrue(os.path.isfile(str(self.file_path) + INDEX_SUFFIX))
+
+        # Lines appended after the save are read on load, and partial lines are left for later
+        with open(self.file_path, 'a') as file:
+            file.write('https://www.instagram.com/a_user_1\nhttps://www.instagram.com/a_us')
+        index = ExclusionIndex(self.file_path)
+        self.assertEqual(len(index), num_keys + 1)
+        self.assertNotIn('https://www.instagram.com/a_us', index)
+        with open(self.file_path, 'a') as file:
+            file.write('er_2\n')
+        self.assertEqual(index.refresh(), 1)
+        self.assertIn('https://www.instagram.com/a_user_2', index)
+
+        # An index of a larger file (e.g. replaced) is rebuilt
+        with open(str(self.file_path) + INDEX_SUFFIX, 'w') as file:
+            file.write('{}\nhttps://www.instagram.com/a_user_3\n'.format(10 ** 9))
+        index = ExclusionIndex(self.file_path)
+        self.assertNotIn('https://www.instagram.com/a_user_3', index)
+        self.assertEqual(len(index), num_keys + 2)
+
+        # An index of a file rewritten with other profiles is rebuilt, even if it is not smaller
+        self.assertTrue(index.save())
+        with open(self.file_path) as file:
+            data = file.read()
+        with open(self.file_path, 'w') as file:
+            file.write(data.replace('a_user_1', 'a_user_9'))
+        index = ExclusionIndex(self.file_path)
+        self.assertNotIn('https://www.instagram.com/a_user_1', index)
+        self.assertIn('https://www.instagram.com/a_user_9', index)
+        self.assertEqual(len(index), num_keys + 2)
+
+    def test_shared_index(self):
+        index = get_exclusion_index(self.file_path)
+        self.assertIs(get_exclusion_index(str(self.file_path)), index)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# pylint: disable=missing-function-docstring, C0103
+
+__author__ = "Josep-Arnau Claret"
+__email__ = "joseparnau81@gmail.com"
+
+import unittest
+
+import datetime
+import os
+from pathlib import Path
+import tempfile
+import threading
+
+from acid_rain.acid_rain_constants import ONE_DAY, ONE_HOUR
+from acid_rain.bot_event_register import BotEventRegister, EVENT_LOGIN, EVENT_LIKES, EVENT_FOLLOW, \
+    EVENT_BLOCK, LABEL_TIMESTAMP, LABEL_BOT, LABEL_EVENT, LABEL_USERNAME, LABEL_NUM_LIKES, \
+    LABEL_COUNT
+from acid_rain.sqlite_event_store import SqliteEventStore, migrate_csv_to_sqlite
+
+
+class TestSqliteEventStoreMethods(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.sqlite_path = Path(self.temp_dir.name) / 'events.sqlite'
+        self.register = BotEventRegister(self.sqlite_path)
+
+    def tearDown(self):
+        self.register.get_store().close()
+        self.temp_dir.cleanup()
+
+    def test_backend(self):
+        self.assertIsInstance(self.register.get_store(), SqliteEventStore)
+        self.assertTrue(self.register.add_event('a_bot', EVENT_LOGIN))
+        self.assertTrue(self.register.save())
+        self.assertTrue(self.register.compact())
+
+        # Another register on the same database sees the events
+        register_2 = BotEventRegister(self.sqlite_path)
+        self.assertEqual(register_2.get_number_of_events(), 1)
+        register_2.get_store().close()
+
+    def test_add_events(self):
+        self.assertTrue(self.register.add_events(
+            [{LABEL_BOT: 'a_bot', LABEL_EVENT: EVENT_LIKES, LABEL_USERNAME: 'a_user',
+              LABEL_NUM_LIKES: 2},
+             {LABEL_BOT: 'a_bot_2', LABEL_EVENT: EVENT_LOGIN}]))
+        self.assertEqual(self.register.get_number_of_events(), 2)
+        self.assertEqual(self.register.get_number_of_likes_in_last('a_bot', ONE_HOUR), 2)
+
+    def test_add_events_concurrently(self):
+        # The bots share the connection of the store and add their events from their threads
+        bots = ['a_bot_{}'.format(i_bot) for i_bot in range(4)]
+        num_batches = 200
+        errors = []
+
+        def run_bot(bot):
+            for i_batch in range(num_batches):
+                try:
+                    self.register.add_events(
+                        [{LABEL_BOT: bot, LABEL_EVENT: EVENT_LIKES,
+                          LABEL_USERNAME: 'a_user_{}'.format(i_batch), LABEL_NUM_LIKES: 1},
+                         {LABEL_BOT: bot, LABEL_EVENT: EVENT_FOLLOW,
+                          LABEL_USERNAME: 'a_user_{}'.format(i_batch)}])
+                    self.register.add_event(bot, EVENT_LOGIN)
+                except Exception as e:  # pylint: disable=broad-except
+                    errors.append(e)
+
+        threads = [threading.Thread(target=run_bot, args=(bot,)) for bot in bots]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        for bot in bots:
+            self.assertEqual(self.register.get_number_of_events(bot), 3 * num_batches)
+            self.assertEqual(self.register.get_number_of_likes_in_last(bot, ONE_HOUR),
+                             num_batches)
+
+    def test_get_rollup(self):
+        timestamp_0 = (datetime.datetime.now() - ONE_DAY).replace(hour=12, minute=30, second=0,
+                                                                  microsecond=0)
+        hour_0 = timestamp_0.replace(minute=0)
+        self.assertTrue(self.register.add_event('a_bot', EVENT_LIKES, 'a_user_1', 2,
+                                                in_timestamp=timestamp_0 - ONE_HOUR))
+        self.assertTrue(self.register.add_events(
+            [{LABEL_BOT: 'a_bot', LABEL_EVENT: EVENT_LIKES, LABEL_USERNAME: 'a_user_2',
+              LABEL_NUM_LIKES: 1, LABEL_TIMESTAMP: timestamp_0},
+             {LABEL_BOT: 'a_bot_2', LABEL_EVENT: EVENT_LIKES, LABEL_USERNAME: 'a_user_2',
+              LABEL_NUM_LIKES: 3, LABEL_TIMESTAMP: timestamp_0}]))
+
+        rollup = self.register.get_rollup(None, EVENT_LIKES, in_end=timestamp_0)
+        self.assertEqual(list(rollup.index), [hour_0 - ONE_HOUR, hour_0])
+        self.assertEqual(list(rollup[LABEL_COUNT]), [1, 2])
+        self.assertEqual(list(rollup[LABEL_NUM_LIKES]), [2, 4])
+        rollup = self.register.get_rollup('a_bot', EVENT_LIKES, ONE_DAY, in_end=timestamp_0)
+        self.assertEqual(rollup.iloc[0].tolist(), [2, 3])
+
+        # The triggers keep the rollups up to date on removal
+        self.assertEqual(self.register.remove_events_before(hour_0), 1)
+        rollup = self.register.get_rollup('a_bot', EVENT_LIKES, in_start=hour_0 - ONE_HOUR,
+                                          in_end=timestamp_0)
+        self.assertEqual(list(rollup[LABEL_COUNT]), [0, 1])
+
+        # Rollups are filled when they are created on an existing database
+        store = self.register.get_store()
+        store.connection.execute('DROP TABLE rollups')
+        store.create_rollups()
+        rollup = self.register.get_rollup(None, EVENT_LIKES, ONE_DAY, in_end=timestamp_0)
+        self.assertEqual(rollup.iloc[0].tolist(), [2, 4])
+
+    def test_queries(self):
+        now = datetime.datetime.now()
+        self.assertTrue(self.register.add_event('a_bot', EVENT_LOGIN,
+                                                in_timestamp=now - datetime.timedelta(2)))
+        self.assertTrue(self.register.add_event('a_bot', EVENT_LIKES, 'a_user_1', 1,
+                                                in_timestamp=now - datetime.timedelta(2)))
+        self.assertTrue(self.register.add_event('a_bot', EVENT_LIKES, 'a_user_2', 2,
+                                                in_timestamp=now - datetime.timedelta(0, 7200)))
+        self.assertTrue(self.register.add_event('a_bot', EVENT_BLOCK, in_comments='like',
+                                                in_timestamp=now - datetime.timedelta(0, 7200)))
+        self.assertTrue(self.register.add_event('a_bot', EVENT_LIKES, 'a_user_3', 3,
+                                                in_timestamp=now))
+        self.assertTrue(self.register.add_event('a_bot_2', EVENT_FOLLOW, 'a_user_3',
+                                                in_timestamp=now))
+
+        self.assertEqual(self.register.get_number_of_events(), 6)
+        self.assertEqual(self.register.get_number_of_events('a_bot'), 5)
+        self.assertEqual(self.register.get_event_timestamp('a_bot'), now)
+        self.assertEqual(self.register.get_event_timestamp(
+            'a_bot', now - datetime.timedelta(1)), now - datetime.timedelta(2))
+        self.assertEqual(self.register.get_last_block_timestamp('a_bot'),
+                         now - datetime.timedelta(0, 7200))
+        self.assertIsNone(self.register.get_last_block_timestamp('a_bot_2'))
+        self.assertEqual(self.register.get_number_of_likes_since('a_bot', now - ONE_DAY), 5)
+        self.assertEqual(self.register.get_number_of_likes_in_last('a_bot', ONE_HOUR), 3)
+        self.assertEqual(self.register.get_number_of_follows_since('a_bot_2', now), 1)
+        self.assertEqual(self.register.get_number_of_follows_in_last('a_bot', ONE_DAY), 0)
+        self.assertEqual(
+            self.register.get_first_timestamp_with_more_than_cumulative_likes('a_bot', 4),
+            now - datetime.timedelta(0, 7200))
+        self.assertIsNone(
+            self.register.get_first_timestamp_with_more_than_cumulative_likes('a_bot', 6))
+        self.assertEqual(
+            self.register.get_first_timestamp_with_more_than_cumulative_follows('a_bot_2', 0),
+            now)
+        self.assertIsNone(
+            self.register.get_first_timestamp_with_more_than_cumulative_follows('a_bot_2', 1))
+
+        self.assertEqual(self.register.remove_events_before(now - ONE_DAY), 2)
+        self.assertEqual(self.register.get_number_of_events(), 4)
+        self.assertEqual(len(self.register.database), 4)
+
+    def test_migrate_csv_to_sqlite(self):
+        csv_path = Path(self.temp_dir.name) / 'events.csv'
+        csv_register = BotEventRegister(Path(os.path.dirname(__file__))
+                                        / 'data/bot_register_event_db.csv')
+        self.assertTrue(csv_register.add_event('a_bot', EVENT_LOGIN))
+        self.assertTrue(csv_register.add_event('a_bot', EVENT_LIKES, 'a_user', 2))
+        csv_register.save(csv_path)
+
+        migrated_path = Path(self.temp_dir.name) / 'migrated.sqlite'
+        self.assertEqual(migrate_csv_to_sqlite(csv_path, migrated_path), 2)
+        register_migrated = BotEventRegister(migrated_path)
+        self.assertEqual(register_migrated.get_number_of_events('a_bot'), 2)
+        self.assertEqual(register_migrated.get_number_of_likes_in_last('a_bot', ONE_DAY), 2)
+        register_migrated.get_store().close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# pylint: disable=missing-function-docstring, C0103
+
+__author__ = "Josep-Arnau Claret"
+__email__ = "joseparnau81@gmail.com"
+
+import unittest
+
+from datetime import datetime, timedelta
+import os
+from pathlib import Path
+from types import SimpleNamespace
+
+from acid_rain.bot_event_register import BotEventRegister, EVENT_LIKES, EVENT_FOLLOW, EVENT_BLOCK
+from acid_rain.insta_bot import InstaBot, ACTION_FOLLOW, LIKES_MAX_PER_RUN, LIKES_MAX_PER_DAY, \
+    LIKES_MAX_PER_HOUR, LIKES_MIN_X_PROFILE, LIKES_MAX_X_PROFILE, LIKES_MIN_SLEEP_TIME_S, \
+    LIKES_MAX_SLEEP_TIME_S, LIKES_MIN_SECONDS_BETWEEN_PROFILES, \
+    LIKES_MAX_SECONDS_BETWEEN_PROFILES, FOLLOWS_MAX_PER_DAY, FOLLOWS_MAX_PER_HOUR, \
+    FOLLOWS_MIN_SECONDS_BETWEEN_PROFILES, FOLLOWS_MAX_SECONDS_BETWEEN_PROFILES, \
+    WAIT_AFTER_BLOCK_HOURS
+from acid_rain.target_planner import get_headroom, plan_targets, LABEL_ALLOTMENT, \
+    LABEL_CAPACITY, LABEL_DAY_HEADROOM, LABEL_HOUR_HEADROOM, LABEL_BLOCKED_UNTIL
+
+
+def make_bot(in_name, in_register):
+    return SimpleNamespace(
+        name=in_name, event_register=in_register, wait_after_block_hours=WAIT_AFTER_BLOCK_HOURS,
+        likes_limit=LIKES_MAX_PER_RUN, likes_max_per_day=LIKES_MAX_PER_DAY,
+        likes_max_per_hour=LIKES_MAX_PER_HOUR, likes_min_x_profile=LIKES_MIN_X_PROFILE,
+        likes_max_x_profile=LIKES_MAX_X_PROFILE, likes_min_sleep_time_s=LIKES_MIN_SLEEP_TIME_S,
+        likes_max_sleep_time_s=LIKES_MAX_SLEEP_TIME_S,
+        likes_min_seconds_between_profiles=LIKES_MIN_SECONDS_BETWEEN_PROFILES,
+        likes_max_seconds_between_profiles=LIKES_MAX_SECONDS_BETWEEN_PROFILES,
+        follows_max_per_day=FOLLOWS_MAX_PER_DAY, follows_max_per_hour=FOLLOWS_MAX_PER_HOUR,
+        follows_min_seconds_between_profiles=FOLLOWS_MIN_SECONDS_BETWEEN_PROFILES,
+        follows_max_seconds_between_profiles=FOLLOWS_MAX_SECONDS_BETWEEN_PROFILES)
+
+
+class TestTargetPlannerMethods(unittest.TestCase):
+
+    def setUp(self):
+        dirname = os.path.dirname(__file__)
+        self.register = BotEventRegister(Path(dirname) / 'data/bot_register_event_db.csv')
+        self.now = datetime.now()
+        # b_bot has 10 likes and 97 follows left today, c_bot waits 23 more hours after a block
+        self.assertTrue(self.register.add_event('b_bot', EVENT_LIKES, 'a_user', 290,
+                                                in_timestamp=self.now - timedelta(hours=2)))
+        for i in range(3):
+            self.assertTrue(self.register.add_event('b_bot', EVENT_FOLLOW, 'user_{}'.format(i),
+                                                    in_timestamp=self.now - timedelta(minutes=i)))
+        self.assertTrue(self.register.add_event('c_bot', EVENT_BLOCK, in_comments='like',
+                                                in_timestamp=self.now - timedelta(hours=1)))
+        self.bots = [make_bot(name, self.register) for name in ['a_bot', 'b_bot', 'c_bot']]
+
+    def test_get_headroom(self):
+        headroom = get_headroom(self.bots[0], 'like', self.now)
+        self.assertEqual(headroom[LABEL_DAY_HEADROOM], LIKES_MAX_PER_DAY)
+        self.assertIsNone(headroom[LABEL_BLOCKED_UNTIL])
+
+        headroom = get_headroom(self.bots[1], 'like', self.now)
+        self.assertEqual(headroom[LABEL_DAY_HEADROOM], 10)
+        self.assertEqual(headroom[LABEL_HOUR_HEADROOM], LIKES_MAX_PER_HOUR)
+        headroom = get_headroom(self.bots[1], 'follow', self.now)
+        self.assertEqual(headroom[LABEL_DAY_HEADROOM], FOLLOWS_MAX_PER_DAY - 3)
+        self.assertEqual(headroom[LABEL_HOUR_HEADROOM], FOLLOWS_MAX_PER_HOUR - 3)
+
+        headroom = get_headroom(self.bots[2], 'like', self.now)
+        self.assertEqual(headroom[LABEL_BLOCKED_UNTIL],
+                         self.now + timedelta(hours=WAIT_AFTER_BLOCK_HOURS - 1))
+
+    def test_plan_targets(self):
+        plan, completion_times = plan_targets(self.bots, {'like': 1000, 'follow': 50}, 6,
+                                              self.now)
+        # 100 likes per hour, 2.5 likes per profile, up to the daily headroom
+        self.assertEqual(list(plan.loc[(slice(None), 'like'), LABEL_CAPACITY]), [120, 4, 0])
+        self.assertEqual(list(plan.loc[(slice(None), 'like'), LABEL_ALLOTMENT]), [120, 4, 0])
+        # 7 follows per hour; b_bot has 4 left in the first hour. The targets are shared in
+        # proportion to the capacities
+        self.assertEqual(list(plan.loc[(slice(None), 'follow'), LABEL_CAPACITY]), [42, 39, 0])
+        self.assertEqual(list(plan.loc[(slice(None), 'follow'), LABEL_ALLOTMENT]), [26, 24, 0])
+        self.assertEqual(plan[LABEL_ALLOTMENT].sum(), 124 + 50)
+
+        # Each day a and b do 120 profiles and c, unblocked from hour 23, up to 160
+        self.assertEqual(completion_times['like'], self.now + timedelta(hours=73))
+        self.assertEqual(completion_times['follow'], self.now + timedelta(hours=4))
+
+        _, completion_times = plan_targets(self.bots, {'like': 10 ** 6}, 6, self.now)
+        self.assertIsNone(completion_times['like'])
+
+    def test_plan_targets_without_waits(self):
+        for bot in self.bots:
+            bot.likes_min_sleep_time_s = bot.likes_max_sleep_time_s = 0
+            bot.likes_min_seconds_between_profiles = bot.likes_max_seconds_between_profiles = 0
+            bot.follows_min_seconds_between_profiles = 0
+            bot.follows_max_seconds_between_profiles = 0
+        plan, _ = plan_targets(self.bots, {'like': 1000, 'follow': 1000}, 6, self.now)
+        # The pace is only bounded by the hourly and daily limits
+        self.assertEqual(plan.loc[('a_bot', 'like'), LABEL_CAPACITY],
+                         int(min(LIKES_MAX_PER_HOUR * 6, LIKES_MAX_PER_DAY) /
+                             ((LIKES_MIN_X_PROFILE + LIKES_MAX_X_PROFILE) / 2)))
+        self.assertEqual(plan.loc[('a_bot', 'follow'), LABEL_CAPACITY],
+                         min(FOLLOWS_MAX_PER_HOUR * 6, FOLLOWS_MAX_PER_DAY))
+
+    def test_get_next_action_time(self):
+        # 150 follows in the last hour, one every 24 s
+        timestamps = [self.now - timedelta(seconds=24 * i) for i in range(150)]
+        for i, timestamp in enumerate(timestamps):
+            self.assertTrue(self.register.add_event('d_bot', EVENT_FOLLOW, 'user_{}'.format(i),
+                                                    in_timestamp=timestamp))
+        bot = make_bot('d_bot', self.register)
+        bot.follows_max_per_day = 100
+        bot.follows_max_per_hour = 200
+        # The follows are within the daily limit once the 101st newest one is a day old
+        self.assertEqual(InstaBot.get_next_action_time(bot, ACTION_FOLLOW),
+                         timestamps[100] + timedelta(days=1))
+        bot.follows_max_per_day = 0
+        self.assertEqual(InstaBot.get_next_action_time(bot, ACTION_FOLLOW),
+                         timestamps[0] + timedelta(days=1))
+        bot.follows_max_per_day = 150
+        self.assertLessEqual(InstaBot.get_next_action_time(bot, ACTION_FOLLOW),
+                             datetime.now())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# pylint: disable=missing-function-docstring, C0103
+
+__author__ = "Josep-Arnau Claret"
+__email__ = "joseparnau81@gmail.com"
+
+import unittest
+
+import threading
+
+from acid_rain.target_queue import TargetQueue
+
+
+class TestTargetQueueMethods(unittest.TestCase):
+
+    def setUp(self):
+        self.likes_targets = ['like_{}'.format(i) for i in range(10)]
+        self.follow_targets = ['follow_{}'.format(i) for i in range(3)]
+        self.queue = TargetQueue({'like': self.likes_targets, 'follow': self.follow_targets},
+                                 in_batch_size=4)
+
+    def test_get(self):
+        self.assertEqual(len(self.queue), 13)
+        self.assertEqual(self.queue.get('a_bot', 'like'), 'like_0')
+        self.assertEqual(self.queue.get('a_bot_2', 'like'), 'like_4')
+        self.assertEqual(self.queue.get('a_bot', 'like'), 'like_1')
+        self.assertEqual(self.queue.get_num_targets('like'), 7)
+        self.assertEqual(list(self.queue.iterate('a_bot', 'follow')), self.follow_targets)
+        self.assertFalse(self.queue.has_targets('follow'))
+        self.assertIsNone(self.queue.get('a_bot_2', 'follow'))
+
+        self.queue.put_back('a_bot', 'like', 'like_1')
+        self.assertEqual(self.queue.get('a_bot', 'like'), 'like_1')
+
+    def test_steal(self):
+        self.assertEqual(self.queue.get('a_bot', 'like'), 'like_0')
+        self.assertEqual(self.queue.get('a_bot_2', 'like'), 'like_4')
+        self.assertEqual(self.queue.get('a_bot_3', 'like'), 'like_8')
+        self.assertEqual(self.queue.get('a_bot_3', 'like'), 'like_9')
+        # The pool is empty: a_bot_3 steals the last half of the largest batch
+        self.assertEqual(self.queue.get('a_bot_3', 'like'), 'like_2')
+        self.assertEqual(self.queue.get('a_bot', 'like'), 'like_1')
+        self.assertEqual(self.queue.get_num_targets('like'), 4)
+
+    def test_release(self):
+        self.assertEqual(self.queue.get('a_bot', 'like'), 'like_0')
+        self.assertEqual(self.queue.get('a_bot', 'follow'), 'follow_0')
+        self.assertEqual(self.queue.release('a_bot'), 5)
+        self.assertEqual(self.queue.release('a_bot'), 0)
+        self.assertEqual(self.queue.get('a_bot_2', 'like'), 'like_1')
+        self.assertEqual(self.queue.get('a_bot_2', 'follow'), 'follow_1')
+        self.assertEqual(self.queue.get_num_targets('like'), 8)
+
+    def test_allotment(self):
+        self.queue.set_allotment('a_bot', 'like', 3)
+        self.queue.set_allotment('a_bot_2', 'like', 5)
+        # a_bot goes past its allotment with the targets not reserved for a_bot_2
+        self.assertEqual(list(self.queue.iterate('a_bot', 'like')),
+                         ['like_{}'.format(i) for i in range(5)])
+        self.assertEqual(self.queue.get_allotment('a_bot', 'like'), -2)
+        self.assertFalse(self.queue.has_targets('like', 'a_bot'))
+        self.assertTrue(self.queue.has_targets('like', 'a_bot_2'))
+        self.assertEqual(self.queue.get('a_bot_2', 'like'), 'like_5')
+
+        # a_bot_2 stops: a_bot takes over the targets reserved for it
+        self.assertEqual(self.queue.release('a_bot_2'), 3)
+        self.assertEqual(self.queue.get_allotment('a_bot_2', 'like'), 0)
+        self.assertTrue(self.queue.has_targets('like', 'a_bot'))
+        self.assertEqual(list(self.queue.iterate('a_bot', 'like')),
+                         ['like_6', 'like_7', 'like_8', 'like_9'])
+
+        self.queue.put_back('a_bot', 'like', 'like_9')
+        self.assertEqual(self.queue.get_allotment('a_bot', 'like'), -5)
+        self.assertEqual(self.queue.get('a_bot', 'like'), 'like_9')
+        # The other actions are not limited
+        self.assertEqual(self.queue.get('a_bot', 'follow'), 'follow_0')
+
+    def test_state(self):
+        self.queue.set_allotment('a_bot', 'follow', 1)
+        self.queue.set_allotment('a_bot_3', 'follow', 2)
+        self.assertEqual(self.queue.get('a_bot', 'like'), 'like_0')
+        self.assertEqual(self.queue.get('a_bot_2', 'like'), 'like_4')
+        self.queue.release('a_bot_2')
+        state = self.queue.get_state()
+        self.assertEqual(state['cursors'], {'like': 8, 'follow': 0})
+        self.assertEqual(state['released'], {'like': ['like_5', 'like_6', 'like_7'], 'follow': []})
+
+        target_queue = TargetQueue({'like': self.likes_targets, 'follow': self.follow_targets},
+                                   in_batch_size=4)
+        target_queue.set_state(state)
+        self.assertEqual(target_queue.get('a_bot', 'like'), 'like_1')
+        self.assertEqual(target_queue.get('a_bot_2', 'like'), 'like_5')
+        self.assertEqual(list(target_queue.iterate('a_bot', 'follow')), ['follow_0'])
+        self.assertEqual(target_queue.get_allotment('a_bot_3', 'follow'), 2)
+        self.assertEqual(len(target_queue), 8)
+
+    def test_get_concurrently(self):
+        targets = ['like_{}'.format(i) for i in range(1000)]
+        queue = TargetQueue({'like': targets}, in_batch_size=7)
+        handed_out = {}
+
+        def take_targets(in_bot):
+            handed_out[in_bot] = list(queue.iterate(in_bot, 'like'))
+
+        threads = [threading.Thread(target=take_targets, args=('a_bot_{}'.format(i),))
+                   for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(sorted(sum(handed_out.values(), [])), sorted(targets))
+
+
+if __name__ == '__main__':
+    unittest.main()